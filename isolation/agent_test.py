@@ -3,6 +3,9 @@ tests to run and debug your minimax and alphabeta agents locally.  The test
 cases used by the project assistant are not public.
 """
 
+import importlib.util
+import random
+import time
 import unittest
 
 import isolation
@@ -11,6 +14,56 @@ import game_agent
 from importlib import reload
 
 
+def minimax_value(game, player, depth):
+    """Reference minimax value of a game state for testing search agents"""
+    moves = game.get_legal_moves()
+    if depth == 0 or not moves:
+        return player.score(game, player)
+    values = [minimax_value(game.forecast_move(m), player, depth - 1)
+              for m in moves]
+    return max(values) if game.active_player == player else min(values)
+
+
+class SlowPlayer:
+    """Player that takes longer than the time limit to return a move"""
+
+    def get_move(self, game, time_left):
+        time.sleep(0.3)
+        return game.get_legal_moves()[0]
+
+
+class BrokenPlayer:
+    """Player that raises an error instead of returning a move"""
+
+    def get_move(self, game, time_left):
+        raise RuntimeError("no move")
+
+
+class HungPlayer:
+    """Player that never returns a move"""
+
+    def get_move(self, game, time_left):
+        while True:
+            time.sleep(0.01)
+
+
+class SequentialPlayer:
+    """Player that raises an error if it is asked to move in a position that
+    does not follow its previous move in the same game
+    """
+
+    def __init__(self):
+        self.move_count = None
+
+    def get_move(self, game, time_left):
+        if (self.move_count is not None and
+                game.move_count != self.move_count + 2):
+            raise RuntimeError("agent state is shared between games")
+        self.move_count = game.move_count
+        moves = sorted(game.get_legal_moves())
+        return moves[0] if moves else (-1, -1)
+
+
 class IsolationTest(unittest.TestCase):
     """Unit tests for isolation agents"""
 
@@ -21,5 +74,1426 @@ class IsolationTest(unittest.TestCase):
         self.game = isolation.Board(self.player1, self.player2)
 
 
+class BitBoardTest(unittest.TestCase):
+    """Check that BitBoard plays by the same rules as Board"""
+
+    def setUp(self):
+        self.player1 = "Player1"
+        self.player2 = "Player2"
+
+    def assertSameState(self, board, bitboard):
+        self.assertEqual(board.to_string(), bitboard.to_string())
+        self.assertEqual(board.get_blank_spaces(), bitboard.get_blank_spaces())
+        self.assertEqual(board.active_player, bitboard.active_player)
+        for player in (self.player1, self.player2):
+            self.assertEqual(sorted(board.get_legal_moves(player)),
+                             sorted(bitboard.get_legal_moves(player)))
+            self.assertEqual(board.get_player_location(player),
+                             bitboard.get_player_location(player))
+            self.assertEqual(board.utility(player), bitboard.utility(player))
+            self.assertEqual(board.is_winner(player), bitboard.is_winner(player))
+            self.assertEqual(board.is_loser(player), bitboard.is_loser(player))
+
+    def test_random_games_match_board(self):
+        rng = random.Random(0)
+        for width, height in [(7, 7), (5, 8), (9, 4)]:
+            for _ in range(5):
+                board = isolation.Board(self.player1, self.player2, width, height)
+                bitboard = isolation.BitBoard(self.player1, self.player2, width, height)
+                while True:
+                    self.assertSameState(board, bitboard)
+                    moves = sorted(board.get_legal_moves())
+                    if not moves:
+                        break
+                    move = rng.choice(moves)
+                    board.apply_move(move)
+                    bitboard = bitboard.forecast_move(move)
+
+    def test_from_board(self):
+        board = isolation.Board(self.player1, self.player2)
+        for move in [(2, 3), (0, 5), (4, 4), (1, 6)]:
+            board.apply_move(move)
+        bitboard = isolation.BitBoard.from_board(board)
+        self.assertSameState(board, bitboard)
+        self.assertEqual(bitboard.move_count, board.move_count)
+
+    def test_hash_and_copy(self):
+        bitboard = isolation.BitBoard(self.player1, self.player2)
+        bitboard.apply_move((2, 3))
+        child = bitboard.forecast_move((0, 5))
+        self.assertNotEqual(bitboard.hash(), child.hash())
+        self.assertEqual(child.hash(), child.copy().hash())
+        self.assertIsNone(bitboard.get_player_location(self.player2))
+
+    def test_play(self):
+        from sample_players import RandomPlayer, GreedyPlayer
+        player1, player2 = RandomPlayer(), GreedyPlayer()
+        bitboard = isolation.BitBoard(player1, player2)
+        winner, history, outcome = bitboard.play()
+        self.assertIn(winner, (player1, player2))
+        self.assertEqual(len(history), bitboard.move_count)
+
+
+class InPlaceSearchTest(unittest.TestCase):
+    """Check the push_move()/pop_move() API and the in-place search mode"""
+
+    def setUp(self):
+        reload(game_agent)
+        self.player1 = "Player1"
+        self.player2 = "Player2"
+
+    def test_push_pop_restores_state(self):
+        for board_class in (isolation.Board, isolation.BitBoard):
+            game = board_class(self.player1, self.player2)
+            game.apply_move((2, 3))
+            game.apply_move((0, 5))
+            before = (game.to_string(), game.hash(), game.move_count,
+                      game.active_player)
+            for move in [(4, 4), (2, 6), (3, 2)]:
+                game.push_move(move)
+            self.assertNotEqual(game.hash(), before[1])
+            for _ in range(3):
+                game.pop_move()
+            self.assertEqual((game.to_string(), game.hash(), game.move_count,
+                              game.active_player), before)
+
+    def test_push_pop_from_empty_board(self):
+        game = isolation.Board(self.player1, self.player2)
+        game.push_move((3, 3))
+        game.pop_move()
+        self.assertIsNone(game.get_player_location(self.player1))
+        self.assertEqual(len(game.get_blank_spaces()), 49)
+
+    def test_in_place_search_matches_copy_search(self):
+        for player_class in (game_agent.MinimaxPlayer,
+                             game_agent.AlphaBetaPlayer):
+            moves = []
+            for in_place in (False, True):
+                random.seed(3)
+                player = player_class(in_place=in_place)
+                opponent = player_class()
+                game = isolation.Board(player, opponent)
+                game.apply_move((2, 3))
+                game.apply_move((4, 3))
+                player.time_left = lambda: 1e6
+                before = game.to_string()
+                if player_class is game_agent.MinimaxPlayer:
+                    moves.append(player.minimax(game, 3))
+                else:
+                    moves.append(player.alphabeta(game, 4))
+                self.assertEqual(game.to_string(), before)
+            self.assertEqual(moves[0], moves[1])
+
+    def test_in_place_timeout_restores_board(self):
+        player = game_agent.AlphaBetaPlayer(in_place=True)
+        game = isolation.Board(player, "Opponent")
+        game.apply_move((2, 3))
+        game.apply_move((4, 3))
+        before = game.to_string()
+        calls = iter(range(200))
+        player.time_left = lambda: 1e6 if next(calls, None) is not None else 0
+        self.assertRaises(game_agent.SearchTimeout, player.alphabeta, game, 8)
+        self.assertEqual(game.to_string(), before)
+
+
+class TranspositionTableTest(unittest.TestCase):
+    """Unit tests for Zobrist hashing and the transposition table"""
+
+    def setUp(self):
+        reload(game_agent)
+        self.player1 = "Player1"
+        self.player2 = "Player2"
+
+    def zobrist(self, game):
+        blocked, p1_keys, p2_keys, initiative = isolation.isolation.zobrist_keys(
+            game.width, game.height)
+        occupied = set(range(game.width * game.height)) - set(
+            r + c * game.height for r, c in game.get_blank_spaces())
+        key = 0
+        for idx in occupied:
+            key ^= blocked[idx]
+        for keys, player in ((p1_keys, self.player1), (p2_keys, self.player2)):
+            loc = game.get_player_location(player)
+            if loc is not None:
+                key ^= keys[loc[0] + loc[1] * game.height]
+        if game.active_player == self.player2:
+            key ^= initiative
+        return key
+
+    def test_incremental_hash(self):
+        rng = random.Random(1)
+        board = isolation.Board(self.player1, self.player2)
+        bitboard = isolation.BitBoard(self.player1, self.player2)
+        while board.get_legal_moves():
+            self.assertEqual(board.hash(), self.zobrist(board))
+            self.assertEqual(board.hash(), bitboard.hash())
+            move = rng.choice(sorted(board.get_legal_moves()))
+            board.apply_move(move)
+            bitboard.apply_move(move)
+
+    def test_rehash(self):
+        game = isolation.Board(self.player1, self.player2)
+        game.apply_move((3, 3))
+        game.canonical_hash()
+        edited = game.copy()
+        edited._board_state[:16] = [1] * 16
+        edited.rehash()
+        self.assertEqual(edited.hash(), self.zobrist(edited))
+        self.assertEqual(edited._sym_hashes, edited._compute_sym_hashes())
+        self.assertNotEqual(edited.hash(), game.hash())
+        self.assertEqual(game.hash(), self.zobrist(game))
+
+    def test_replacement_policies(self):
+        TT = game_agent.TranspositionTable
+        self.assertRaises(ValueError, TT, 8, "oldest")
+
+        table = TT(size=8, policy="depth")
+        table.store(3, 5, 1., TT.EXACT, (0, 0))
+        table.store(11, 2, 2., TT.LOWER, (1, 1))
+        self.assertEqual(table.probe(3).score, 1.)
+        self.assertIsNone(table.probe(11))
+        table.new_search()
+        table.store(11, 2, 2., TT.LOWER, (1, 1))
+        self.assertIsNone(table.probe(3))
+        self.assertEqual(table.probe(11).move, (1, 1))
+
+        table = TT(size=8, policy="always")
+        table.store(3, 5, 1., TT.EXACT, (0, 0))
+        table.store(11, 2, 2., TT.UPPER, (1, 1))
+        self.assertIsNone(table.probe(3))
+        self.assertEqual(table.probe(11).flag, TT.UPPER)
+        self.assertEqual(len(table), 1)
+
+    def test_search_with_table_is_exact(self):
+        for policy in game_agent.TranspositionTable.POLICIES:
+            player = game_agent.AlphaBetaPlayer(tt_size=1024, tt_policy=policy)
+            game = isolation.Board(player, "Opponent", 5, 5)
+            for move in [(2, 2), (0, 0), (0, 1), (2, 1)]:
+                game.apply_move(move)
+            player.time_left = lambda: 1e6
+            move = player.alphabeta(game, 3)
+            entry = player.tt.probe(game.hash() ^ player._tt_salt(game))
+            self.assertEqual(entry.move, move)
+            self.assertEqual(entry.score, minimax_value(game, player, 3))
+
+    def test_get_move_with_table(self):
+        player = game_agent.AlphaBetaPlayer(tt_size=4096)
+        game = isolation.Board(player, "Opponent")
+        game.apply_move((2, 3))
+        game.apply_move((4, 3))
+        moves = game.get_legal_moves()
+        calls = iter(range(2000))
+        time_left = lambda: 1e6 if next(calls, None) is not None else 0
+        self.assertIn(player.get_move(game, time_left), moves)
+        self.assertGreater(len(player.tt), 0)
+
+
+class CanonicalHashTest(unittest.TestCase):
+    """Check that symmetric positions share a canonical hash"""
+
+    def test_incremental_symmetric_hashes(self):
+        rng = random.Random(3)
+        for cls in (isolation.Board, isolation.BitBoard):
+            game = cls("Player1", "Player2", 5, 5)
+            game.canonical_hash()
+            while game.get_legal_moves():
+                hashes = game._sym_hashes
+                self.assertEqual(hashes, game._compute_sym_hashes())
+                self.assertEqual(hashes[0], game.hash())
+                game.push_move(game.get_legal_moves()[0])
+                game.pop_move()
+                self.assertEqual(game._sym_hashes, hashes)
+                game = game.forecast_move(
+                    rng.choice(sorted(game.get_legal_moves())))
+
+    def test_symmetric_positions(self):
+        game = isolation.Board("Player1", "Player2", 5, 7)
+        for move in [(0, 1), (3, 3), (2, 2)]:
+            game.apply_move(move)
+        # the same position after a half turn of the board
+        turned = isolation.Board("Player1", "Player2", 5, 7)
+        for r, c in [(0, 1), (3, 3), (2, 2)]:
+            turned.apply_move((6 - r, 4 - c))
+        self.assertNotEqual(game.hash(), turned.hash())
+        key, sym = game.canonical_hash()
+        turned_key, turned_sym = turned.canonical_hash()
+        self.assertEqual(key, turned_key)
+        for move in game.get_legal_moves():
+            canonical = game.to_canonical(move, sym)
+            self.assertEqual(game.from_canonical(canonical, sym), move)
+            self.assertIn(turned.from_canonical(canonical, turned_sym),
+                          turned.get_legal_moves())
+
+    def test_canonical_table_search_is_exact(self):
+        player = game_agent.AlphaBetaPlayer(tt_size=1024, canonical_tt=True)
+        player.time_left = lambda: 1e6
+        game = isolation.Board(player, "Opponent", 5, 5)
+        for move in [(2, 2), (0, 0), (0, 1), (2, 1)]:
+            game.apply_move(move)
+        for depth in range(1, 5):
+            move, score = player._search_root(game, depth, float("-inf"),
+                                              float("inf"))
+            self.assertIn(move, game.get_legal_moves())
+            self.assertEqual(score, minimax_value(game, player, depth))
+
+    def test_unique_moves(self):
+        for cls in (isolation.Board, isolation.BitBoard):
+            for width, height, count in [(7, 7, 10), (20, 20, 55), (5, 8, 12)]:
+                game = cls("Player1", "Player2", width, height)
+                moves = game.unique_moves()
+                self.assertEqual(len(moves), count)
+                # every move leads to a position reached by a unique move
+                keys = {game.forecast_move(m).canonical_hash()[0]
+                        for m in moves}
+                self.assertEqual(len(keys), count)
+                self.assertEqual(keys, {game.forecast_move(m).canonical_hash()[0]
+                                        for m in game.get_legal_moves()})
+            game = cls("Player1", "Player2", 7, 7)
+            game.apply_move((3, 3))
+            self.assertEqual(len(game.unique_moves()), 9)
+            game.apply_move((0, 1))
+            moves = sorted(game.get_legal_moves())
+            self.assertEqual(game.unique_moves(moves), moves)
+
+    def test_pruned_search_is_exact(self):
+        player = game_agent.AlphaBetaPlayer(score_fn=game_agent.custom_score,
+                                            prune_symmetric=True)
+        player.time_left = lambda: 1e6
+        game = isolation.Board(player, "Opponent", 5, 5)
+        for depth in range(1, 4):
+            move, score = player._search_root(game, depth, float("-inf"),
+                                              float("inf"))
+            self.assertIn(move, game.get_legal_moves())
+            self.assertEqual(score, minimax_value(game, player, depth))
+
+
+class MoveOrderingTest(unittest.TestCase):
+    """Unit tests for alpha-beta move ordering"""
+
+    def setUp(self):
+        reload(game_agent)
+        self.player1 = "Player1"
+        self.player2 = "Player2"
+        self.game = isolation.Board(self.player1, self.player2)
+        self.game.apply_move((3, 3))
+        self.game.apply_move((0, 0))
+
+    def test_order_priorities(self):
+        ordering = game_agent.MoveOrdering()
+        moves = sorted(self.game.get_legal_moves())
+        ordering.record_cutoff(self.game, moves[5], 2, 3)
+        ordering.record_cutoff(self.game, moves[6], 2, 3)
+        ordering.history[((3, 3), moves[7])] = 100
+        ordered = ordering.order(self.game, moves, 2, hash_move=moves[4])
+        self.assertEqual(ordered[:4], [moves[4], moves[6], moves[5], moves[7]])
+        self.assertEqual(sorted(ordered), moves)
+        # killers are only used at the ply where they were recorded
+        self.assertEqual(ordering.order(self.game, moves, 1)[0], moves[7])
+
+    def test_new_search_ages_history(self):
+        ordering = game_agent.MoveOrdering()
+        move = self.game.get_legal_moves()[0]
+        ordering.record_cutoff(self.game, move, 1, 4)
+        ordering.new_search()
+        self.assertEqual(ordering.killers, {})
+        self.assertEqual(ordering.history[((3, 3), move)], 8)
+
+    def test_ordered_search_is_exact(self):
+        player = game_agent.AlphaBetaPlayer(ordering=game_agent.MoveOrdering())
+        game = isolation.Board(player, "Opponent", 5, 5)
+        for move in [(2, 2), (0, 0), (0, 1), (2, 1)]:
+            game.apply_move(move)
+        player.time_left = lambda: 1e6
+        for depth in range(1, 4):
+            move = player.alphabeta(game, depth)
+            self.assertEqual(minimax_value(game.forecast_move(move), player,
+                                           depth - 1),
+                             minimax_value(game, player, depth))
+
+    def test_cutoff_statistics(self):
+        player = game_agent.AlphaBetaPlayer(ordering=game_agent.MoveOrdering())
+        game = isolation.Board(player, "Opponent")
+        game.apply_move((2, 3))
+        game.apply_move((4, 3))
+        calls = iter(range(3000))
+        player.get_move(game, lambda: 1e6 if next(calls, None) is not None else 0)
+        stats = player.stats
+        self.assertGreater(stats.cutoffs, 0)
+        self.assertEqual(sum(stats.cutoff_index), stats.cutoffs)
+        self.assertTrue(0 < stats.first_move_cutoff_rate <= 1)
+        self.assertEqual(stats.as_dict()["cutoffs"], stats.cutoffs)
+
+
+class MobilityCacheTest(unittest.TestCase):
+    """Check that mobility counts are cached per game state"""
+
+    def setUp(self):
+        self.player1 = "Player1"
+        self.player2 = "Player2"
+
+    def test_counts_after_direct_edits(self):
+        game = isolation.Board(self.player1, self.player2)
+        game.apply_move((3, 3))
+        game.mobility(self.player1)
+        game.mobility(self.player2)
+        # the counts are read from the cells, without calling rehash()
+        game._board_state[:16] = [1] * 16
+        self.assertEqual(game.count_blank(), len(game.get_blank_spaces()))
+        self.assertEqual(game.count_blank(), 32)
+        for player in (self.player1, self.player2):
+            moves = game.get_legal_moves(player)
+            self.assertEqual(game.count_legal_moves(player), len(moves))
+            self.assertEqual(game.has_legal_move(player), bool(moves))
+        for r, c in game.get_legal_moves(self.player1):
+            game._board_state[r + c * game.height] = 1
+        self.assertFalse(game.has_legal_move(self.player1))
+        self.assertEqual(game.count_legal_moves(self.player1), 0)
+
+    def test_counts_of_unknown_player(self):
+        for board_class in (isolation.Board, isolation.BitBoard):
+            game = board_class(self.player1, self.player2)
+            game.apply_move((3, 3))
+            game.mobility(self.player1)
+            game.mobility(self.player2)
+            self.assertRaises(RuntimeError, game.has_legal_move, "Stranger")
+            self.assertRaises(RuntimeError, game.count_legal_moves,
+                              "Stranger")
+
+    def test_copies_do_not_share_cache(self):
+        game = isolation.Board(self.player1, self.player2)
+        game.apply_move((3, 3))
+        game.apply_move((0, 0))
+        self.assertEqual(game.mobility(self.player2), 2)
+        edited = game.copy()
+        for r, c in edited.get_legal_moves(self.player1):
+            edited._board_state[r + c * edited.height] = 1
+        self.assertEqual(edited.mobility(self.player1), 0)
+        self.assertEqual(game.mobility(self.player1), 8)
+        self.assertFalse(game.is_loser(self.player1))
+        for board_class in (isolation.Board, isolation.BitBoard):
+            game = board_class(self.player1, self.player2)
+            game.mobility()
+            self.assertIsNot(game.copy()._mobility, game._mobility)
+
+    def test_mobility_matches_legal_moves(self):
+        rng = random.Random(5)
+        for board_class in (isolation.Board, isolation.BitBoard):
+            game = board_class(self.player1, self.player2)
+            while True:
+                for player in (self.player1, self.player2):
+                    self.assertEqual(game.mobility(player),
+                                     len(game.get_legal_moves(player)))
+                moves = sorted(game.get_legal_moves())
+                if not moves:
+                    break
+                game = game.forecast_move(rng.choice(moves))
+
+    def test_early_exit_primitives(self):
+        rng = random.Random(8)
+        for board_class in (isolation.Board, isolation.BitBoard):
+            game = board_class(self.player1, self.player2, 5, 6)
+            while True:
+                blank = game.get_blank_spaces()
+                self.assertEqual(list(game.iter_blank_spaces()), blank)
+                self.assertEqual(game.count_blank(), len(blank))
+                for player in (self.player1, self.player2):
+                    moves = game.get_legal_moves(player)
+                    self.assertEqual(sorted(game.iter_legal_moves(player)),
+                                     sorted(moves))
+                    self.assertEqual(game.has_legal_move(player), bool(moves))
+                    self.assertEqual(game.count_legal_moves(player),
+                                     len(moves))
+                moves = sorted(game.get_legal_moves())
+                if not moves:
+                    break
+                game = game.forecast_move(rng.choice(moves))
+
+    def test_mobility_is_computed_once_per_state(self):
+        game = isolation.Board(self.player1, self.player2)
+        game.apply_move((3, 3))
+        game.apply_move((0, 0))
+        calls = []
+        count_moves = game._count_moves
+        game._count_moves = lambda idx: calls.append(idx) or count_moves(idx)
+        for _ in range(3):
+            game.mobility(self.player1)
+            game.is_loser(self.player1)
+            game.utility(self.player2)
+        self.assertEqual(calls, [3 + 3 * game.height])
+        game.push_move((1, 1))
+        self.assertEqual(game.mobility(self.player1), 4)
+        game.pop_move()
+        self.assertEqual(game.mobility(self.player1), 8)
+        self.assertEqual(calls, [3 + 3 * game.height, 1 + 1 * game.height])
+
+
+class PrincipalVariationSearchTest(unittest.TestCase):
+    """Check that PVS and aspiration windows return exact root scores"""
+
+    def setUp(self):
+        reload(game_agent)
+
+    def make_game(self, player):
+        game = isolation.Board(player, "Opponent", 5, 5)
+        for move in [(2, 2), (0, 0), (0, 1), (2, 1)]:
+            game.apply_move(move)
+        player.time_left = lambda: 1e6
+        return game
+
+    def test_search_mode_is_validated(self):
+        self.assertRaises(ValueError, game_agent.AlphaBetaPlayer,
+                          search_mode="mtdf")
+
+    def test_pvs_is_exact(self):
+        for kwargs in ({}, {"ordering": game_agent.MoveOrdering()},
+                       {"tt_size": 1024}):
+            player = game_agent.AlphaBetaPlayer(search_mode="pvs", **kwargs)
+            game = self.make_game(player)
+            inf = float("inf")
+            for depth in range(1, 5):
+                _, score = player._search_root(game, depth, -inf, inf)
+                self.assertEqual(score, minimax_value(game, player, depth))
+
+    def test_aspiration_window_recovers_from_bad_guess(self):
+        player = game_agent.AlphaBetaPlayer(search_mode="pvs",
+                                            aspiration_window=1.)
+        game = self.make_game(player)
+        expected = minimax_value(game, player, 3)
+        for guess in (expected - 50., expected, expected + 50.):
+            move, score = player._aspiration_search(game, 3, guess)
+            self.assertEqual(score, expected)
+            self.assertEqual(minimax_value(game.forecast_move(move), player, 2),
+                             expected)
+        self.assertGreater(player.stats.researches, 0)
+
+    def test_root_always_returns_legal_move(self):
+        player = game_agent.AlphaBetaPlayer()
+        game = isolation.Board(player, "Opponent", 3, 4)
+        game.apply_move((0, 0))
+        game.apply_move((0, 1))
+        player.time_left = lambda: 1e6
+        # every move loses against perfect play
+        self.assertEqual(minimax_value(game, player, 6), float("-inf"))
+        self.assertIn(player.alphabeta(game, 6), game.get_legal_moves())
+
+
+class MonteCarloPlayerTest(unittest.TestCase):
+    """Unit tests for the MCTS competition agent"""
+
+    def setUp(self):
+        import competition_agent
+        self.agent = competition_agent
+        self.player = competition_agent.CustomPlayer(max_nodes=2000)
+        self.opponent = "Opponent"
+        self.game = isolation.Board(self.player, self.opponent)
+        self.game.apply_move((2, 3))
+        self.game.apply_move((4, 3))
+
+    def time_left(self, calls):
+        calls = iter(range(calls))
+        return lambda: 1e6 if next(calls, None) is not None else 0
+
+    def test_compact_state_matches_board(self):
+        state = self.agent.CompactState.from_game(self.game)
+        neighbours = self.agent._neighbours(7, 7)
+        moves = state.legal_moves(neighbours)
+        self.assertEqual(sorted((i % 7, i // 7) for i in moves),
+                         sorted(self.game.get_legal_moves()))
+        state.apply(moves[0])
+        self.assertEqual(state.to_move, 1)
+
+    def test_get_move_and_tree_reuse(self):
+        move = self.player.get_move(self.game, self.time_left(20))
+        self.assertIn(move, self.game.get_legal_moves())
+        self.assertLessEqual(len(self.player._move), 2000)
+
+        self.game.apply_move(move)
+        reply = sorted(self.game.get_legal_moves())[0]
+        self.game.apply_move(reply)
+        state = self.agent.CompactState.from_game(self.game)
+        self.player.time_left = lambda: 1e6
+        self.player._advance_tree(state)
+        self.assertGreater(self.player._visits[0], 0)
+        self.assertEqual(self.player._root_state.blocked, state.blocked)
+        self.assertValidTree()
+
+    def test_reroot_stops_at_deadline(self):
+        import copy
+        self.player.get_move(self.game, self.time_left(40))
+        node = max(range(1, len(self.player._move)),
+                   key=lambda idx: self.player._visits[idx])
+        self.player._root_state = self.agent.CompactState.from_game(self.game)
+        full = copy.deepcopy(self.player)
+        full.time_left = lambda: 1e6
+        full._reroot(node)
+        self.player.time_left = lambda: 0
+        self.player._reroot(node)
+        self.assertLess(len(self.player._move), len(full._move))
+        self.assertEqual(self.player._visits[0], full._visits[0])
+        self.assertValidTree()
+
+    def assertValidTree(self):
+        for node in range(1, len(self.player._move)):
+            parent = self.player._parent[node]
+            first = self.player._first_child[parent]
+            self.assertTrue(first <= node < first + self.player._num_children[parent])
+
+    def test_new_game_resets_tree(self):
+        self.player.get_move(self.game, self.time_left(10))
+        game = isolation.Board(self.opponent, self.player)
+        game.apply_move((0, 0))
+        self.assertIn(self.player.get_move(game, self.time_left(10)),
+                      game.get_legal_moves())
+
+    def test_no_legal_moves(self):
+        game = isolation.Board(self.player, self.opponent, 3, 3)
+        game.apply_move((1, 1))
+        game.apply_move((0, 0))
+        self.assertEqual(self.player.get_move(game, self.time_left(10)), (-1, -1))
+
+
+@unittest.skipIf(importlib.util.find_spec("numpy") is None,
+                 "NumPy is not installed")
+class BatchEvaluatorTest(unittest.TestCase):
+    """Check that batch evaluation matches the scalar heuristics"""
+
+    def setUp(self):
+        import sample_players
+        self.score_fns = [sample_players.open_move_score,
+                          sample_players.improved_score,
+                          sample_players.center_score, game_agent.custom_score,
+                          game_agent.custom_score_2, game_agent.custom_score_3]
+
+    def test_scores_match_heuristics(self):
+        rng = random.Random(5)
+        for score_fn in self.score_fns:
+            evaluator = game_agent.BatchEvaluator(score_fn)
+            for _ in range(20):
+                game = isolation.Board("Player1", "Player2", 7, 5)
+                for _ in range(rng.randrange(2, 30)):
+                    moves = game.get_legal_moves()
+                    if not moves:
+                        break
+                    game.apply_move(rng.choice(moves))
+                moves = game.get_legal_moves()
+                for player in ("Player1", "Player2"):
+                    self.assertEqual(evaluator.score([game], player),
+                                     [score_fn(game, player)])
+                    if moves:
+                        self.assertEqual(
+                            evaluator.score_moves(game, moves, player),
+                            [score_fn(game.forecast_move(m), player)
+                             for m in moves])
+
+    def test_unsupported_heuristic(self):
+        self.assertRaises(ValueError, game_agent.BatchEvaluator,
+                          lambda game, player: 0.)
+
+    def test_batch_search_is_exact(self):
+        for score_fn in (game_agent.custom_score, game_agent.custom_score_3):
+            player = game_agent.AlphaBetaPlayer(score_fn=score_fn,
+                                                batch_eval=True)
+            player.time_left = lambda: 1e6
+            game = isolation.Board(player, "Opponent", 5, 5)
+            for move in [(2, 2), (0, 0), (0, 1), (2, 1)]:
+                game.apply_move(move)
+            for depth in range(1, 5):
+                move, score = player._search_root(game, depth, float("-inf"),
+                                                  float("inf"))
+                self.assertIn(move, game.get_legal_moves())
+                self.assertEqual(score, minimax_value(game, player, depth))
+
+
+class OpeningBookTest(unittest.TestCase):
+    """Check that opening book lookups agree across symmetric positions"""
+
+    @classmethod
+    def setUpClass(cls):
+        import opening_book
+        cls.book = opening_book.build_book(3, 2, game_agent.custom_score,
+                                           width=5, height=5)
+
+    def test_symmetric_positions_share_entries(self):
+        import opening_book
+        self.assertEqual(len(self.book.entries), len(set(
+            opening_book.canonical_key(5, 5, key)[0]
+            for key in self.book.entries)))
+        game = isolation.Board("Player1", "Player2", width=5, height=5)
+        game.apply_move((0, 1))
+        game.apply_move((2, 2))
+        # the same position reflected across the main diagonal
+        mirror = isolation.Board("Player1", "Player2", width=5, height=5)
+        mirror.apply_move((1, 0))
+        mirror.apply_move((2, 2))
+        move = self.book.lookup(game)
+        self.assertIn(move, game.get_legal_moves())
+        self.assertEqual(self.book.lookup(mirror), (move[1], move[0]))
+
+    def test_save_and_load(self):
+        import json
+        import os
+        import tempfile
+        import opening_book
+        fd, path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            self.book.save(path)
+            book = opening_book.OpeningBook.load(path)
+            with open(path) as f:
+                data = json.load(f)
+        finally:
+            os.remove(path)
+        self.assertEqual(book.entries, self.book.entries)
+        self.assertEqual(book._table, self.book._table)
+
+        # CustomPlayer reads the same file contents through its data argument
+        from competition_agent import CustomPlayer
+        player = CustomPlayer(data=data)
+        game = isolation.Board(player, "Player2", width=5, height=5)
+        self.assertEqual(player.get_move(game, lambda: 1000.),
+                         self.book.lookup(game))
+
+    def test_alphabeta_plays_book_moves(self):
+        player = game_agent.AlphaBetaPlayer(book=self.book)
+        game = isolation.Board(player, "Player2", width=5, height=5)
+
+        def time_left():
+            raise AssertionError("book moves should not be searched")
+        self.assertEqual(player.get_move(game, time_left),
+                         self.book.lookup(game))
+        # positions past the end of the book are searched as usual
+        for move in [(0, 0), (4, 4), (1, 2)]:
+            game.apply_move(move)
+        self.assertIsNone(self.book.lookup(game))
+
+
+class EndgameSolverTest(unittest.TestCase):
+    """Check partition detection and the exact endgame solver"""
+
+    def play_until_partitioned(self, seed, width=5, height=5):
+        rng = random.Random(seed)
+        solver = game_agent.EndgameSolver()
+        game = isolation.Board("Player1", "Player2", width=width, height=height)
+        while solver.partition(game) is None:
+            moves = sorted(game.get_legal_moves())
+            if not moves:
+                return None
+            game.apply_move(rng.choice(moves))
+        if not game.get_legal_moves():
+            return None
+        return game
+
+    def brute_force_longest(self, game, player):
+        loc = game.get_player_location(player)
+        best = 0
+        for dr, dc in [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                       (1, -2), (1, 2), (2, -1), (2, 1)]:
+            move = (loc[0] + dr, loc[1] + dc)
+            if game.move_is_legal(move):
+                new_game = game.copy()
+                new_game._board_state[move[0] + move[1] * game.height] = 1
+                new_game._board_state[
+                    -1 if player == game._player_1 else -2] = (
+                        move[0] + move[1] * game.height)
+                new_game.rehash()
+                best = max(best, 1 + self.brute_force_longest(new_game, player))
+        return best
+
+    def test_partition(self):
+        solver = game_agent.EndgameSolver()
+        game = isolation.Board("Player1", "Player2", width=5, height=5)
+        self.assertIsNone(solver.partition(game))
+        game.apply_move((0, 0))
+        game.apply_move((2, 2))
+        self.assertIsNone(solver.partition(game))
+
+        # block every cell but one open cell next to each player
+        game = isolation.Board("Player1", "Player2", width=4, height=4)
+        game._board_state[:16] = [1] * 16
+        game._board_state[6] = game._board_state[5] = isolation.Board.BLANK
+        game._board_state[-1] = 0
+        game._board_state[-2] = 3
+        game.rehash()
+        self.assertEqual(solver.partition(game), (1 << 6, 1 << 5))
+
+    def test_longest_path_is_exact(self):
+        solver = game_agent.EndgameSolver()
+        for seed in range(20):
+            game = self.play_until_partitioned(seed)
+            if game is None:
+                continue
+            for player in (game.active_player, game.inactive_player):
+                self.assertEqual(solver.longest_path(game, player),
+                                 self.brute_force_longest(game, player))
+
+    def test_alphabeta_uses_solver(self):
+        player = game_agent.AlphaBetaPlayer()
+        solver = game_agent.EndgameSolver()
+        for seed in range(20):
+            game = self.play_until_partitioned(seed)
+            if game is None:
+                continue
+            game._player_1, game._player_2 = player, "Player2"
+            if game.move_count % 2:
+                game._player_1, game._player_2 = "Player1", player
+            game._active_player = player
+            game._inactive_player = game.get_opponent(player)
+            move = player.get_move(game, lambda: 1000.)
+            self.assertEqual(player.stats.nodes, 0)
+            self.assertEqual(1 + solver.longest_path(game.forecast_move(move),
+                                                     player),
+                             solver.longest_path(game, player))
+
+
+class LazySMPTest(unittest.TestCase):
+    """Check the shared transposition table and the Lazy SMP search"""
+
+    def test_shared_table_round_trip(self):
+        table = game_agent.SharedTranspositionTable(size=64)
+        other = game_agent.SharedTranspositionTable(size=64, name=table.name)
+        try:
+            table.new_search()
+            table.store(12345, 3, -2.5, table.LOWER, (4, 6))
+            table.store(777, 0, float("-inf"), table.EXACT, None)
+            entry = other.probe(12345)
+            self.assertEqual(entry[:5], (12345, 3, -2.5, table.LOWER, (4, 6)))
+            self.assertEqual(other.probe(777).score, float("-inf"))
+            self.assertIsNone(other.probe(12345 + 64))
+            # a shallower result does not replace a deeper one from the
+            # same search
+            other.generation = table.generation
+            other.store(12345 + 64, 1, 0., table.EXACT, (0, 0))
+            self.assertIsNone(table.probe(12345 + 64))
+            self.assertEqual(len(table), 2)
+            table.clear()
+            self.assertIsNone(other.probe(12345))
+        finally:
+            other.close()
+            table.close()
+
+    def test_smp_search_returns_in_time(self):
+        import timeit
+        player = game_agent.AlphaBetaPlayer(smp_workers=2, tt_size=2**12)
+        game = isolation.Board(player, "Player2")
+        game.apply_move((3, 3))
+        game.apply_move((2, 4))
+        try:
+            for _ in range(2):
+                start = timeit.default_timer()
+                time_left = lambda: 150 - 1000 * (timeit.default_timer() - start)
+                move = player.get_move(game, time_left)
+                self.assertGreater(time_left(), 0)
+                self.assertIn(move, game.get_legal_moves())
+            self.assertGreater(len(player.tt), 0)
+        finally:
+            player._helpers.close()
+            player.tt.close()
+
+    def test_helpers_are_released_with_player(self):
+        from multiprocessing import shared_memory
+        player = game_agent.AlphaBetaPlayer(smp_workers=1, tt_size=64)
+        workers = list(player._start_helpers()._workers)
+        name = player.tt.name
+        # no reference cycle keeps the player and its helpers alive
+        del player
+        self.assertFalse(any(worker.is_alive() for worker in workers))
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+
+class PonderingTest(unittest.TestCase):
+    """Check the pondering hooks of Board.play() and AlphaBetaPlayer"""
+
+    def test_play_calls_hooks_outside_turns(self):
+        from sample_players import GreedyPlayer
+
+        events = []
+
+        class Recorder(GreedyPlayer):
+            def get_move(self, game, time_left):
+                events.append((self, "move"))
+                return super().get_move(game, time_left)
+
+            def start_pondering(self, game):
+                events.append((self, "start"))
+                assert game.inactive_player is self
+
+            def stop_pondering(self):
+                events.append((self, "stop"))
+
+        p1, p2 = Recorder(), Recorder()
+        isolation.Board(p1, p2, 5, 5).play()
+        self.assertEqual(events[:2], [(p1, "move"), (p2, "move")])
+
+        events.clear()
+        winner, history, _ = isolation.Board(p1, p2, 5, 5).play(ponder=True)
+        self.assertEqual(events[:5], [(p1, "stop"), (p1, "move"), (p1, "start"),
+                                      (p2, "stop"), (p2, "move")])
+        # both players stop pondering when the game ends
+        self.assertEqual(sorted(events[-2:], key=lambda e: e[0] is p2),
+                         [(p1, "stop"), (p2, "stop")])
+
+    def test_pondering_fills_table(self):
+        import time
+        player = game_agent.AlphaBetaPlayer(ponder=True, tt_size=2**12)
+        game = isolation.Board(player, "Player2")
+        game.apply_move((3, 3))
+        try:
+            player.start_pondering(game)
+            time.sleep(0.5)
+            player.stop_pondering()
+            reply = game.forecast_move(game.get_legal_moves()[0])
+            entry = player.tt.probe(reply.hash() ^ player._tt_salt(reply))
+            self.assertIsNotNone(entry)
+            self.assertIn(entry.move, reply.get_legal_moves())
+        finally:
+            player._helpers.close()
+            player.tt.close()
+
+
+class InstrumentationTest(unittest.TestCase):
+    """Check the per-move search records and their aggregation"""
+
+    def test_alphabeta_records_iterations(self):
+        import io
+        import json
+        import timeit
+        player = game_agent.AlphaBetaPlayer(score_fn=game_agent.custom_score)
+        player.search_log = game_agent.SearchLog("AB")
+        game = isolation.Board(player, "Player2")
+        game.apply_move((3, 3))
+        game.apply_move((2, 4))
+        start = timeit.default_timer()
+        player.get_move(game, lambda: 100 - 1000 * (timeit.default_timer() - start))
+
+        stats = player.stats
+        self.assertEqual(len(stats.iteration_nodes), stats.depth)
+        self.assertEqual(len(stats.iteration_times), stats.depth)
+        self.assertLessEqual(sum(stats.iteration_nodes), stats.nodes)
+        self.assertGreater(stats.evals, 0)
+        self.assertAlmostEqual(stats.effective_branching_factor ** stats.depth,
+                               stats.iteration_nodes[-1])
+
+        out = io.StringIO()
+        player.search_log.write(out)
+        record = json.loads(out.getvalue())
+        self.assertEqual((record["agent"], record["source"]), ("AB", "search"))
+        self.assertEqual(record["depth"], stats.depth)
+        summary = player.search_log.summary()
+        self.assertEqual(summary["nodes"], stats.nodes)
+        self.assertEqual(summary["cutoff_index"], stats.cutoff_index)
+
+    def test_minimax_records_fixed_depth(self):
+        player = game_agent.MinimaxPlayer(search_depth=2)
+        game = isolation.Board(player, "Player2", 5, 5)
+        game.apply_move((2, 2))
+        game.apply_move((0, 0))
+        player.get_move(game, lambda: 1000.)
+        self.assertEqual(player.stats.depth, 2)
+        # the root and each of its 8 children are expanded
+        self.assertEqual(player.stats.nodes, 9)
+        self.assertIsNone(player.search_log)
+
+    def test_round_collects_logs(self):
+        import tournament
+        from sample_players import RandomPlayer
+        cpu_agent = tournament.Agent(RandomPlayer(), "Random")
+        test_agent = tournament.Agent(
+            game_agent.MinimaxPlayer(search_depth=1), "MM")
+        test_agent.player.search_log = game_agent.SearchLog("MM")
+        logs = {test_agent.player: game_agent.SearchLog("MM")}
+        wins = {cpu_agent.player: 0, test_agent.player: 0}
+        tournament.play_round(cpu_agent, [test_agent], wins, 1,
+                              random.Random(1), logs=logs)
+        records = logs[test_agent.player].records
+        self.assertGreater(len(records), 0)
+        self.assertEqual(set(r["agent"] for r in records), {"MM"})
+        # the original player's log is only a marker and stays empty
+        self.assertEqual(test_agent.player.search_log.records, [])
+
+
+class BenchmarkTest(unittest.TestCase):
+    """Check that the benchmark is reproducible and detects regressions"""
+
+    def test_compare_with_baseline(self):
+        import copy
+        import benchmark
+        config = dict(board_sizes=[(5, 5, 4)], score_fns=[game_agent.custom_score],
+                      search_depths={game_agent.AlphaBetaPlayer: 3},
+                      positions_per_size=2, repeat=1)
+        results = benchmark.run_benchmarks(**config)
+        again = benchmark.run_benchmarks(**config)
+        name = "5x5.search.AlphaBetaPlayer.custom_score.d3"
+        self.assertEqual(results["metrics"][name]["nodes"],
+                         again["metrics"][name]["nodes"])
+        self.assertEqual(benchmark.compare(results, results, 0.), [])
+
+        baseline = copy.deepcopy(results)
+        baseline["metrics"][name]["value"] /= 2
+        baseline["metrics"]["5x5.movegen"]["value"] *= 2
+        self.assertEqual([r[0] for r in benchmark.compare(results, baseline, 0.2)],
+                         ["5x5.movegen", name])
+
+
+class TimeManagerTest(unittest.TestCase):
+    """Check the iteration predictions of TimeManager and amortised timer
+    checks"""
+
+    def test_phases(self):
+        manager = game_agent.TimeManager(opening_moves=2, endgame_fraction=0.5)
+        game = isolation.Board("Player1", "Player2", 3, 3)
+        self.assertEqual(manager.phase(game), "opening")
+        game.apply_move((0, 0))
+        game.apply_move((1, 1))
+        self.assertEqual(manager.phase(game), "midgame")
+        game.apply_move((1, 2))
+        game.apply_move((2, 2))
+        game.apply_move((2, 0))
+        self.assertEqual(manager.phase(game), "endgame")
+
+    def test_stops_before_iteration_that_cannot_finish(self):
+        clock = [1000.]
+        manager = game_agent.TimeManager(stable_iterations=10)
+        game = isolation.Board("Player1", "Player2")
+        for move in [(0, 0), (6, 6), (1, 2), (5, 4)]:
+            game.apply_move(move)
+        manager.start(game, lambda: clock[0], 100.)
+        self.assertEqual(manager.budget, 900.)
+        # iterations taking 10, 30 and 90 ms grow by a factor of 3
+        for depth, (elapsed, expected) in enumerate(
+                [(10., True), (30., True), (90., True), (270., False)], 1):
+            clock[0] -= elapsed
+            self.assertEqual(manager.should_continue(depth, (depth, 0)),
+                             expected)
+
+    def test_stable_move_shrinks_budget(self):
+        clock = [1000.]
+        manager = game_agent.TimeManager(stable_iterations=2,
+                                         stable_fraction=0.05)
+        game = isolation.Board("Player1", "Player2")
+        for move in [(0, 0), (6, 6), (1, 2), (5, 4)]:
+            game.apply_move(move)
+        manager.start(game, lambda: clock[0], 0.)
+        clock[0] -= 20.
+        self.assertTrue(manager.should_continue(1, (2, 1)))
+        clock[0] -= 20.
+        self.assertFalse(manager.should_continue(2, (2, 1)))
+
+    def test_amortised_timer_checks(self):
+        calls = []
+
+        def time_left():
+            calls.append(1)
+            return 1000.
+        player = game_agent.AlphaBetaPlayer(
+            time_manager=game_agent.TimeManager(check_interval=10))
+        player.time_left = time_left
+        game = isolation.Board(player, "Player2")
+        game.apply_move((3, 3))
+        game.apply_move((2, 4))
+        player.alphabeta(game, 4)
+        # each node visit checks the countdown twice
+        self.assertLess(len(calls), player.stats.nodes + player.stats.evals)
+        self.assertLessEqual(len(calls),
+                             1 + 2 * (player.stats.nodes + player.stats.evals) // 10)
+
+        # the search still stops once the timer runs out
+        player.time_left = lambda: 0.
+        with self.assertRaises(game_agent.SearchTimeout):
+            player.alphabeta(game, 4)
+
+    def test_get_move_stops_when_board_is_exhausted(self):
+        player = game_agent.AlphaBetaPlayer(
+            time_manager=game_agent.TimeManager())
+        game = isolation.Board(player, "Player2", 3, 3)
+        for move in [(0, 0), (2, 2), (1, 2)]:
+            game.apply_move(move)
+        # a clock that never runs out: only the time manager can stop the
+        # search
+        move = player.get_move(game, lambda: 1000.)
+        self.assertIn(move, game.get_legal_moves())
+        self.assertLessEqual(player.stats.depth, 6)
+
+
+class GameRecordTest(unittest.TestCase):
+    """Check that game records round trip and can be replayed"""
+
+    def setUp(self):
+        import os
+        import tempfile
+        fd, self.path = tempfile.mkstemp(suffix=".bin")
+        os.close(fd)
+        os.remove(self.path)
+
+    def tearDown(self):
+        import os
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_round_trip_and_replay(self):
+        import game_records
+        rng = random.Random(11)
+        games = []
+        for width, height in ((7, 7), (5, 9), (17, 17)):
+            for _ in range(3):
+                game = isolation.Board("Player1", "Player2", width, height)
+                moves = []
+                while game.get_legal_moves():
+                    moves.append(rng.choice(sorted(game.get_legal_moves())))
+                    game.apply_move(moves[-1])
+                games.append((width, height, moves))
+
+        # records are appended across writers
+        for chunk in (games[:4], games[4:]):
+            with game_records.GameRecordWriter(self.path) as writer:
+                for width, height, moves in chunk:
+                    writer.write(width, height, ("A", "B"), moves,
+                                 "illegal move", seed=len(moves))
+        with game_records.GameRecordReader(self.path) as reader:
+            records = list(reader)
+        self.assertEqual(len(records), len(games))
+        for record, (width, height, moves) in zip(records, games):
+            self.assertEqual((record.width, record.height), (width, height))
+            self.assertEqual(record.moves(), moves)
+            self.assertEqual(record.seed, len(moves))
+            final = record.replay()
+            self.assertFalse(final.get_legal_moves())
+            self.assertEqual(record.winner, 0 if final.active_player ==
+                             "Player2" else 1)
+
+        summary = game_records.summarize(records)
+        self.assertEqual(summary["games"], len(games))
+        self.assertEqual(summary["agents"]["A"]["games"], len(games))
+        self.assertEqual(summary["agents"]["A"]["wins"] +
+                         summary["agents"]["B"]["wins"], len(games))
+        openings = game_records.win_rate_by_opening(records, 1)
+        self.assertEqual(sum(games for games, _ in openings.values()),
+                         len(games))
+
+    def test_tournament_records_games(self):
+        from sample_players import RandomPlayer, GreedyPlayer
+        import game_records
+        import tournament
+
+        cpu_agent = tournament.Agent(RandomPlayer(), "Random")
+        test_agents = [tournament.Agent(GreedyPlayer(), "Greedy")]
+        wins = {cpu_agent.player: 0, test_agents[0].player: 0}
+        with game_records.GameRecordWriter(self.path) as writer:
+            tournament.play_round(cpu_agent, test_agents, wins, 2,
+                                  random.Random(3), records=writer)
+        with game_records.GameRecordReader(self.path) as reader:
+            records = list(reader)
+        self.assertEqual(len(records), 4)
+        agents = game_records.summarize(records)["agents"]
+        self.assertEqual(agents["Greedy"]["wins"], wins[test_agents[0].player])
+        for record in records:
+            record.replay()
+            self.assertEqual(set(record.players), {"Random", "Greedy"})
+
+
+class SelfPlayTest(unittest.TestCase):
+    """Check the self-play data pipeline and the linear heuristic"""
+
+    def test_linear_score_matches_custom_score_3(self):
+        score_fn = game_agent.LinearScore((10, -20, 1, -1))
+        rng = random.Random(9)
+        game = isolation.Board("Player1", "Player2")
+        for move in [(2, 3), (4, 4)]:
+            game.apply_move(move)
+        while game.get_legal_moves():
+            for player in ("Player1", "Player2"):
+                self.assertEqual(score_fn(game, player),
+                                 game_agent.custom_score_3(game, player))
+            game.apply_move(rng.choice(sorted(game.get_legal_moves())))
+        self.assertRaises(ValueError, game_agent.LinearScore, (1, 2))
+
+    def test_generate_chunks(self):
+        import os
+        import shutil
+        import tempfile
+        import self_play
+        directory = tempfile.mkdtemp()
+        try:
+            rows = self_play.generate(3, directory, depth=1, workers=1,
+                                      chunk_size=16, seed=4)
+            rows += self_play.generate(2, directory, depth=1, workers=1,
+                                       chunk_size=16, seed=5)
+            paths = self_play.chunk_paths(directory)
+            sizes = [os.path.getsize(path) // (4 * 5) for path in paths]
+            self.assertEqual(sum(sizes), rows)
+            self.assertTrue(all(size <= 16 for size in sizes))
+            self.assertEqual(self_play.play_self_play_game(
+                (1, (game_agent.custom_score, game_agent.custom_score_3),
+                 1, 7, 7, 2, 0.1)), self_play.play_self_play_game(
+                (1, (game_agent.custom_score, game_agent.custom_score_3),
+                 1, 7, 7, 2, 0.1)))
+            if importlib.util.find_spec("numpy") is None:
+                return
+            features, outcomes = self_play.load_chunks(directory)
+            self.assertEqual(features.shape, (rows, 4))
+            self.assertTrue(set(outcomes.tolist()) <= {0., 1.})
+            weights_path = os.path.join(directory, "weights.json")
+            weights = self_play.fit(directory, weights_path)
+            score_fn = game_agent.LinearScore.load(weights_path)
+            self.assertEqual(list(score_fn.weights), weights)
+        finally:
+            shutil.rmtree(directory)
+
+    @unittest.skipIf(importlib.util.find_spec("numpy") is None,
+                     "NumPy is not installed")
+    def test_fit_logistic_recovers_weights(self):
+        import numpy as np
+        import self_play
+        rng = np.random.RandomState(0)
+        features = rng.normal(size=(20000, 4))
+        true_weights = np.array([1.5, -1., 0.5, 0.])
+        p = 1. / (1. + np.exp(-(features.dot(true_weights) + 0.2)))
+        outcomes = (rng.uniform(size=len(p)) < p).astype(float)
+        weights, bias = self_play.fit_logistic(features, outcomes, l2=0.)
+        np.testing.assert_allclose(weights, true_weights, atol=0.1)
+        self.assertAlmostEqual(bias, 0.2, delta=0.1)
+
+
+class MatchServerTest(unittest.TestCase):
+    """Check the concurrent game server"""
+
+    def test_concurrent_games(self):
+        import asyncio
+        import os
+        import tempfile
+        import match_server
+        from game_records import GameRecordReader
+        from sample_players import RandomPlayer
+        agents = {"Random": RandomPlayer(),
+                  "MM_2": game_agent.MinimaxPlayer(search_depth=2),
+                  "Slow": SlowPlayer(), "Broken": BrokenPlayer()}
+        games = [("Random", "MM_2", 5, 5, (), 1),
+                 ("MM_2", "Random", 5, 5, ((2, 2), (0, 0)), 2),
+                 ("Slow", "Random", 5, 5, (), 3),
+                 ("Random", "Broken", 5, 5, (), 4)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "games.bin")
+            with self.assertWarns(UserWarning):
+                records = asyncio.run(match_server.serve(
+                    games, agents, workers=1, time_limit=100,
+                    record_path=path))
+            with GameRecordReader(path) as reader:
+                self.assertEqual(sorted(reader), sorted(records))
+
+        for record, (player_1, player_2, _, _, opening, seed) in zip(records,
+                                                                    games):
+            self.assertEqual(record.players, (player_1, player_2))
+            self.assertEqual(record.seed, seed)
+            self.assertEqual(record.moves()[:len(opening)], list(opening))
+        for record in records[:2]:
+            self.assertEqual(record.termination, "illegal move")
+            game = record.replay()
+            self.assertFalse(game.get_legal_moves())
+        self.assertEqual((records[2].termination, records[2].winner),
+                         ("timeout", 1))
+        self.assertEqual((records[3].termination, records[3].winner),
+                         ("forfeit", 0))
+
+    def test_hung_worker_is_replaced(self):
+        import asyncio
+        import match_server
+        from sample_players import RandomPlayer
+        agents = {"Random": RandomPlayer(), "Hung": HungPlayer(),
+                  "MM_1": game_agent.MinimaxPlayer(search_depth=1)}
+        games = [("Hung", "Random", 5, 5, (), 1),
+                 ("Random", "MM_1", 5, 5, (), 2)]
+
+        async def play():
+            async with match_server.MatchServer(
+                    agents, workers=1, time_limit=100,
+                    grace_period=0.2) as server:
+                return await server.play_games(games)
+        start = time.perf_counter()
+        records = asyncio.run(play())
+        self.assertLess(time.perf_counter() - start, 10.)
+        self.assertEqual((records[0].termination, records[0].winner),
+                         ("timeout", 1))
+        self.assertEqual(records[1].termination, "illegal move")
+
+    def test_agent_copies_per_game(self):
+        import asyncio
+        import match_server
+        agents = {"Sequential": SequentialPlayer()}
+        games = [("Sequential", "Sequential", 5, 5, (), seed)
+                 for seed in range(3)]
+        records = asyncio.run(match_server.serve(games, agents, workers=1,
+                                                 time_limit=100))
+        for record in records:
+            self.assertEqual(record.termination, "illegal move")
+
+
+class AgentWorkerTest(unittest.TestCase):
+    """Check that agents in preemptible workers cannot stall a game"""
+
+    def test_boards_pickle_without_tables(self):
+        import pickle
+        for board_class in (isolation.Board, isolation.BitBoard):
+            game = board_class("Player1", "Player2", 20, 20)
+            game.apply_move((0, 0))
+            game.apply_move((5, 5))
+            game.canonical_hash()
+            data = pickle.dumps(game)
+            self.assertLess(len(data), 2000)
+            copy = pickle.loads(data)
+            self.assertIs(copy._cells, game._cells)
+            self.assertIs(copy._zobrist, game._zobrist)
+            self.assertEqual(copy.hash(), game.hash())
+            self.assertEqual(copy.canonical_hash(), game.canonical_hash())
+            self.assertEqual(sorted(copy.get_legal_moves()),
+                             sorted(game.get_legal_moves()))
+
+    def test_hung_agent_is_killed(self):
+        from agent_workers import PreemptiblePlayer, WorkerPool
+        from sample_players import RandomPlayer
+        pool = WorkerPool(size=2)
+        try:
+            for _ in range(2):
+                player_1 = PreemptiblePlayer(RandomPlayer(), pool)
+                player_2 = PreemptiblePlayer(
+                    game_agent.MinimaxPlayer(search_depth=1), pool)
+                game = isolation.Board(player_1, player_2, 5, 5)
+                winner, history, termination = game.play(time_limit=100)
+                self.assertEqual(termination, "illegal move")
+                self.assertTrue(history)
+            # both games reused the same two workers
+            self.assertEqual((pool.started, pool.killed), (2, 0))
+
+            player_1 = PreemptiblePlayer(HungPlayer(), pool)
+            player_2 = PreemptiblePlayer(RandomPlayer(), pool)
+            game = isolation.Board(player_1, player_2, 5, 5)
+            start = time.perf_counter()
+            winner, history, termination = game.play(time_limit=100)
+            self.assertLess(time.perf_counter() - start, 1.)
+            self.assertIs(winner, player_2)
+            self.assertEqual((termination, history), ("timeout", []))
+            self.assertEqual(pool.killed, 1)
+
+            game = isolation.Board(PreemptiblePlayer(RandomPlayer(), pool),
+                                   PreemptiblePlayer(BrokenPlayer(), pool))
+            with self.assertWarns(UserWarning):
+                winner, history, termination = game.play(time_limit=100)
+            self.assertEqual(termination, "forfeit")
+        finally:
+            pool.close()
+
+
+class TournamentTest(unittest.TestCase):
+    """Check that parallel tournament rounds reproduce serial rounds"""
+
+    def test_parallel_round_matches_serial(self):
+        from concurrent.futures import ProcessPoolExecutor
+        from sample_players import RandomPlayer, GreedyPlayer
+        import tournament
+
+        cpu_agent = tournament.Agent(RandomPlayer(), "Random")
+        test_agents = [tournament.Agent(GreedyPlayer(), "Greedy"),
+                       tournament.Agent(RandomPlayer(), "Random_2")]
+        results = []
+        for executor in (None, ProcessPoolExecutor(max_workers=2)):
+            wins = {agent.player: 0 for agent in test_agents}
+            wins[cpu_agent.player] = 0
+            counts = tournament.play_round(cpu_agent, test_agents, wins, 3,
+                                           random.Random(7), executor)
+            if executor is not None:
+                executor.shutdown()
+            results.append((counts, [wins[cpu_agent.player]] +
+                            [wins[agent.player] for agent in test_agents]))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(sum(results[0][1]), 12)
+
+    def test_sprt_round(self):
+        from sample_players import RandomPlayer, GreedyPlayer
+        import tournament
+
+        sprt = tournament.SPRT(-50, 50)
+        self.assertEqual(sprt.status(30, 0), "H1")
+        self.assertEqual(sprt.status(0, 30), "H0")
+        self.assertIsNone(sprt.status(10, 10))
+        elo, low, high = tournament.elo_difference(15, 5)
+        self.assertLess(low, elo)
+        self.assertLess(elo, high)
+        self.assertEqual(tournament.elo_difference(10, 0)[0], float("inf"))
+
+        cpu_agent = tournament.Agent(RandomPlayer(), "Random")
+        test_agents = [tournament.Agent(GreedyPlayer(), "Greedy")]
+
+        def play(sprt):
+            wins = {cpu_agent.player: 0, test_agents[0].player: 0}
+            games = {}
+            tournament.play_round(cpu_agent, test_agents, wins, 8,
+                                  random.Random(5), sprt=sprt,
+                                  game_counts=games)
+            return wins[test_agents[0].player], games[test_agents[0].player]
+
+        # a test that can never decide plays the games of a fixed round
+        self.assertEqual(play(tournament.SPRT(alpha=1e-300, beta=1e-300)),
+                         play(None))
+        # a decided pairing stops before the last match
+        sprt = tournament.SPRT(-400, 400, alpha=0.1, beta=0.1)
+        wins, games = play(sprt)
+        self.assertLess(games, 16)
+        self.assertIsNotNone(sprt.status(wins, games - wins))
+
+    def test_sprt_pairings_share_the_workers(self):
+        from concurrent.futures import ProcessPoolExecutor
+        from sample_players import RandomPlayer, GreedyPlayer
+        import tournament
+
+        cpu_agents = [tournament.Agent(RandomPlayer(), "Random"),
+                      tournament.Agent(GreedyPlayer(), "Greedy")]
+        test_agents = [tournament.Agent(GreedyPlayer(), "Greedy_2"),
+                       tournament.Agent(RandomPlayer(), "Random_2")]
+        sprt = tournament.SPRT(-400, 400, alpha=0.1, beta=0.1)
+        results = []
+        for executor in (None, ProcessPoolExecutor(max_workers=2)):
+            wins = [{agent.player: 0 for agent in cpu_agents + test_agents}
+                    for _ in cpu_agents]
+            games = [{} for _ in cpu_agents]
+            tournament.play_pairings(cpu_agents, test_agents, wins, games, 6,
+                                     sprt, random.Random(11), executor)
+            if executor is not None:
+                executor.shutdown()
+            results.append([[(wins[idx][agent.player],
+                              games[idx][agent.player])
+                             for agent in test_agents]
+                            for idx in range(len(cpu_agents))])
+        self.assertEqual(results[0], results[1])
+        for pairings in results[0]:
+            for wins, games in pairings:
+                self.assertEqual(games % 2, 0)
+                self.assertTrue(sprt.status(wins, games - wins) is not None
+                                or games == 12)
+
+    def test_make_games_is_seeded(self):
+        import tournament
+        agents = [None, None]
+        games = tournament.make_games(agents, 2, random.Random(3))
+        self.assertEqual(games, tournament.make_games(agents, 2, random.Random(3)))
+        self.assertEqual(len(games), 8)
+        self.assertEqual(len(set(spec.opening for spec in games)), 2)
+
+    def test_large_board_games(self):
+        import tournament
+        board = tournament.BoardSpec(12, 9, isolation.BitBoard)
+        cpu = tournament.Agent(
+            game_agent.MinimaxPlayer(search_depth=1), "MM_1")
+        test = tournament.Agent(game_agent.AlphaBetaPlayer(
+            search_depth=1, prune_symmetric=True), "AB_1")
+        games = tournament.make_games([test], 1, random.Random(5), board)
+        for spec in games:
+            self.assertEqual(spec.board, board)
+            cpu_won, termination, game, _, _ = tournament.play_game(
+                cpu.player, test.player, spec)
+            width, height, moves = game
+            self.assertEqual((width, height), (12, 9))
+            self.assertEqual(moves[:2], list(spec.opening))
+            self.assertTrue(all(0 <= r < 9 and 0 <= c < 12 for r, c in moves))
+
+
 if __name__ == '__main__':
     unittest.main()
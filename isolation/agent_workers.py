@@ -0,0 +1,264 @@
+"""Run isolation agents in worker processes that are killed when a move is
+late, so that an agent that hangs loses on time instead of stalling the
+game (or the tournament) it plays in.
+
+`Board.play()` calls `get_move()` directly and only detects a timeout once
+the call returns. Wrapping an agent in a `PreemptiblePlayer` runs each of
+its moves in a worker process instead: the board is sent to the worker
+through a pipe, and the move comes back through the same pipe. If no move
+arrives before the time limit expires, the worker is killed, `get_move()`
+returns None after the deadline, and `Board.play()` records a timeout.
+An agent that raises an error forfeits the game.
+
+Workers are kept in a `WorkerPool` and reused from move to move and from
+game to game, so a process is only started when a worker was killed or
+every worker is busy. A worker keeps the agent it last played, so an agent
+that moves again on the same worker keeps its state (e.g., transposition
+tables) between moves. Workers are daemon processes, so agents that start
+processes of their own (pondering or Lazy SMP helpers) are not supported.
+
+Example: play a game in which both agents run in killable workers
+
+    game = Board(PreemptiblePlayer(player_1), PreemptiblePlayer(player_2))
+    winner, history, termination = game.play()
+"""
+import itertools
+import multiprocessing
+import os
+import random
+import timeit
+import traceback
+import warnings
+
+# Markers that stand in for the agent and its opponent on the boards sent to
+# the workers
+SELF = "<self>"
+OPPONENT = "<opponent>"
+
+# Seconds to wait past the deadline before a worker is killed, so that a
+# move that arrives just in time is not lost
+KILL_MARGIN = 0.005
+
+
+def _worker_main(conn):
+    """Serve move requests from the pipe until it is closed. A request is a
+    tuple (agent key, agent or None, game, time limit, seed); the agent is
+    only sent when this worker does not hold it yet.
+    """
+    key, player = None, None
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        request_key, request_player, game, time_limit, seed = request
+        if request_player is not None:
+            key, player = request_key, request_player
+        for attr in ("_player_1", "_player_2", "_active_player",
+                     "_inactive_player"):
+            if getattr(game, attr) == SELF:
+                setattr(game, attr, player)
+
+        random.seed(seed)
+        move_start = timeit.default_timer()
+        time_left = lambda: time_limit - 1000 * (timeit.default_timer() -
+                                                 move_start)
+        try:
+            result = (player.get_move(game, time_left), None)
+        except Exception:
+            result = (None, traceback.format_exc())
+        conn.send(result)
+
+
+class AgentWorker:
+    """A worker process connected to its parent by a pipe, which plays the
+    moves of one agent at a time.
+
+    Parameters
+    ----------
+    target : callable (optional)
+        The main loop of the worker, called with the worker's end of the
+        pipe followed by `args`. By default the worker serves the requests
+        of request_move().
+
+    args : tuple (optional)
+        The remaining arguments of the target.
+    """
+
+    def __init__(self, target=_worker_main, args=()):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=target, args=(child_conn,) + tuple(args), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.agent_key = None
+
+    def request_move(self, key, player, game, time_limit, seed):
+        """Send a move request to the worker, sending the agent along unless
+        the worker already holds the agent with this key.
+        """
+        if key != self.agent_key:
+            self.conn.send((key, player, game, time_limit, seed))
+            self.agent_key = key
+        else:
+            self.conn.send((key, None, game, time_limit, seed))
+
+    def wait_move(self, timeout):
+        """Return (move, error) if the worker answers within `timeout`
+        seconds; otherwise raise TimeoutError.
+        """
+        if not self.conn.poll(max(timeout, 0.)):
+            raise TimeoutError()
+        return self.conn.recv()
+
+    def kill(self):
+        """Stop the worker immediately, whatever it is doing."""
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def close(self):
+        """Stop an idle worker."""
+        self.conn.close()
+        self.process.join(1.)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+class WorkerPool:
+    """A pool of `AgentWorker`s.
+
+    Parameters
+    ----------
+    size : int (optional)
+        The number of workers kept running. An agent gets a worker of its
+        own while there are fewer, so the two agents of a game each keep
+        their state in their own worker; more workers are only started if
+        every worker is busy, and stop when they become idle.
+    """
+
+    def __init__(self, size=2):
+        self.size = size
+        self.started = 0
+        self.killed = 0
+        self._running = 0
+        self._idle = []
+
+    def acquire(self, key):
+        """Return an idle worker that holds the agent with this key if there
+        is one, otherwise a new worker if there are fewer than `size`
+        workers or none is idle, otherwise the least recently used idle
+        worker.
+        """
+        for idx, worker in enumerate(self._idle):
+            if worker.agent_key == key:
+                return self._idle.pop(idx)
+        if self._idle and self._running >= self.size:
+            return self._idle.pop(0)
+        self.started += 1
+        self._running += 1
+        return AgentWorker()
+
+    def release(self, worker):
+        """Return a worker whose move has been received to the pool."""
+        if self._running > self.size:
+            self._running -= 1
+            worker.close()
+        else:
+            self._idle.append(worker)
+
+    def discard(self, worker):
+        """Kill a worker that did not answer in time."""
+        self.killed += 1
+        self._running -= 1
+        worker.kill()
+
+    def close(self):
+        """Stop every idle worker."""
+        for worker in self._idle:
+            worker.close()
+        self._running -= len(self._idle)
+        del self._idle[:]
+
+
+_pool = None
+_pool_pid = None
+
+
+def default_pool():
+    """Return the worker pool of this process, created on first use."""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool, _pool_pid = WorkerPool(), os.getpid()
+    return _pool
+
+
+class PreemptiblePlayer:
+    """Wrap an agent so that each of its moves is searched in a worker
+    process that is killed if the move is not returned before the time
+    limit expires.
+
+    Copies of a PreemptiblePlayer (e.g., the copies of the agents made for
+    every game of a tournament) are separate agents, and play in the worker
+    pool of the process they are used in.
+
+    Parameters
+    ----------
+    player : object
+        The agent, which must be picklable.
+
+    pool : `WorkerPool` (optional)
+        The workers to play in; `default_pool()` if not set.
+    """
+
+    _keys = itertools.count()
+
+    def __init__(self, player, pool=None):
+        self.player = player
+        self.pool = pool
+        self._key = (os.getpid(), next(PreemptiblePlayer._keys))
+
+    def __getstate__(self):
+        # copies get their own key, and play in the pool of their process
+        state = self.__dict__.copy()
+        state["pool"] = None
+        state["_key"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._key = (os.getpid(), next(PreemptiblePlayer._keys))
+
+    def get_move(self, game, time_left):
+        """Search for a move in a worker process and return it, or return
+        None once the time limit has expired (after killing the worker) or
+        if the agent raised an error.
+
+        See `IsolationPlayer.get_move()` for the parameters.
+        """
+        pool = self.pool or default_pool()
+        board = game.copy()
+        for attr in ("_player_1", "_player_2", "_active_player",
+                     "_inactive_player"):
+            setattr(board, attr, SELF if getattr(board, attr) is self
+                    else OPPONENT)
+
+        worker = pool.acquire(self._key)
+        try:
+            # draw the seed of the worker from this process, so that seeded
+            # games are reproducible
+            worker.request_move(self._key, self.player, board, time_left(),
+                                random.getrandbits(32))
+            move, error = worker.wait_move(time_left() / 1000 + KILL_MARGIN)
+        except TimeoutError:
+            pool.discard(worker)
+            return None
+        except (EOFError, OSError) as e:
+            pool.discard(worker)
+            move, error = None, "Agent worker exited: {!r}".format(e)
+        else:
+            pool.release(worker)
+        if error is not None:
+            warnings.warn("Agent forfeits after raising an error:\n" + error)
+        return move
@@ -0,0 +1,236 @@
+"""Measure the search throughput of the isolation board and agents on a fixed
+set of seeded midgame positions, and compare the results with a stored
+baseline.
+
+Each metric is the best of several timed repeats on the same positions:
+
+- movegen: calls to `Board.get_legal_moves()` per second
+- forecast: microseconds per call to `Board.forecast_move()`
+- bitboard.movegen, bitboard.forecast: the same on `BitBoard` copies of the
+  positions
+- eval.<score>: calls to the heuristic per second
+- search.<player>.<score>.d<depth>: milliseconds to search every position
+  to the given depth (the number of nodes expanded is reported alongside,
+  and is identical across runs because every search is seeded)
+
+Example: save a baseline, then check a later change against it
+
+    python benchmark.py --save baseline.json
+    python benchmark.py --baseline baseline.json --tolerance 0.2
+
+The script exits with status 1 if any metric is worse than the baseline by
+more than the tolerance (a fraction of the baseline value).
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import timeit
+
+from isolation import Board, BitBoard
+from sample_players import open_move_score, improved_score, center_score
+from game_agent import (MinimaxPlayer, AlphaBetaPlayer, SearchStats,
+                        custom_score, custom_score_2, custom_score_3)
+
+# (width, height, moves played) of the benchmark positions
+BOARD_SIZES = [(5, 5, 6), (7, 7, 10), (9, 9, 16), (15, 15, 20),
+               (20, 20, 24)]
+POSITIONS_PER_SIZE = 8
+SEED = 2017
+
+SCORE_FNS = [open_move_score, improved_score, center_score, custom_score,
+             custom_score_2, custom_score_3]
+SEARCH_DEPTHS = {MinimaxPlayer: 3, AlphaBetaPlayer: 6}
+
+
+def make_positions(width, height, num_moves, count, seed):
+    """Return `count` games on a board of the given size after `num_moves`
+    random moves, chosen from a generator seeded with `seed`. Games that end
+    early are skipped.
+    """
+    rng = random.Random(seed)
+    player_1, player_2 = object(), object()
+    games = []
+    while len(games) < count:
+        game = Board(player_1, player_2, width=width, height=height)
+        for _ in range(num_moves):
+            moves = sorted(game.get_legal_moves())
+            if not moves:
+                break
+            game.apply_move(rng.choice(moves))
+        if game.has_legal_move() and game.move_count == num_moves:
+            games.append(game)
+    return games
+
+
+def best_time(func, number, repeat):
+    """Return the fastest time in seconds of `repeat` runs of `number` calls
+    to func().
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat))
+
+
+def bench_movegen(games, repeat):
+    def run():
+        for game in games:
+            game.get_legal_moves()
+            game.get_legal_moves(game.inactive_player)
+    number = 200
+    seconds = best_time(run, number, repeat)
+    return {"value": 2 * len(games) * number / seconds, "unit": "calls/s",
+            "better": "higher"}
+
+
+def bench_forecast(games, repeat):
+    moves = [(game, game.get_legal_moves()[0]) for game in games]
+
+    def run():
+        for game, move in moves:
+            game.forecast_move(move)
+    number = 200
+    seconds = best_time(run, number, repeat)
+    return {"value": 1e6 * seconds / (len(moves) * number), "unit": "us",
+            "better": "lower"}
+
+
+def bench_eval(games, score_fn, repeat):
+    # evaluate fresh copies so that cached mobility counts are not reused
+    def run():
+        for game in games:
+            score_fn(game.copy(), game.active_player)
+    number = 100
+    seconds = best_time(run, number, repeat)
+    return {"value": len(games) * number / seconds, "unit": "evals/s",
+            "better": "higher"}
+
+
+def bench_search(games, player_cls, score_fn, depth, repeat):
+    players = []
+    for game in games:
+        player = player_cls(search_depth=depth, score_fn=score_fn)
+        player.time_left = lambda: float("inf")
+        players.append(player)
+
+    def search(player, game):
+        # the searching player takes the place of the player to move
+        searched = game.copy()
+        old = game.active_player
+        for attr in ("_player_1", "_player_2", "_active_player",
+                     "_inactive_player"):
+            if getattr(searched, attr) is old:
+                setattr(searched, attr, player)
+        if player_cls is MinimaxPlayer:
+            player.minimax(searched, depth)
+        else:
+            player.alphabeta(searched, depth)
+
+    nodes = []
+
+    def run():
+        random.seed(SEED)
+        del nodes[:]
+        for player, game in zip(players, games):
+            player.stats = SearchStats()
+            search(player, game)
+            nodes.append(player.stats.nodes)
+    seconds = best_time(run, 1, repeat)
+    return {"value": 1000 * seconds, "unit": "ms", "better": "lower",
+            "nodes": sum(nodes)}
+
+
+def run_benchmarks(board_sizes=BOARD_SIZES, score_fns=SCORE_FNS,
+                   search_depths=SEARCH_DEPTHS,
+                   positions_per_size=POSITIONS_PER_SIZE, repeat=3,
+                   verbose=False):
+    """Run every benchmark and return a dictionary describing the results,
+    with one entry per metric under the "metrics" key.
+    """
+    metrics = {}
+    for width, height, num_moves in board_sizes:
+        games = make_positions(width, height, num_moves, positions_per_size,
+                               SEED)
+        size = "{}x{}".format(width, height)
+
+        def add(name, result):
+            metrics[name] = result
+            if verbose:
+                print("{:<48}{:>14.1f} {}".format(name, result["value"],
+                                                  result["unit"]))
+
+        add("{}.movegen".format(size), bench_movegen(games, repeat))
+        add("{}.forecast".format(size), bench_forecast(games, repeat))
+        bitboards = [BitBoard.from_board(game) for game in games]
+        add("{}.bitboard.movegen".format(size),
+            bench_movegen(bitboards, repeat))
+        add("{}.bitboard.forecast".format(size),
+            bench_forecast(bitboards, repeat))
+        for score_fn in score_fns:
+            add("{}.eval.{}".format(size, score_fn.__name__),
+                bench_eval(games, score_fn, repeat))
+        for player_cls, depth in search_depths.items():
+            for score_fn in score_fns:
+                add("{}.search.{}.{}.d{}".format(
+                    size, player_cls.__name__, score_fn.__name__, depth),
+                    bench_search(games, player_cls, score_fn, depth, repeat))
+
+    return {"info": {"python": platform.python_version(),
+                     "machine": platform.machine(), "seed": SEED},
+            "metrics": metrics}
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of (metric name, baseline value, new value, relative
+    change) for every metric of the results that is worse than the baseline
+    by more than `tolerance`. Metrics missing from either side are ignored.
+    """
+    regressions = []
+    for name, result in sorted(results["metrics"].items()):
+        base = baseline["metrics"].get(name)
+        if base is None or not base["value"]:
+            continue
+        change = (result["value"] - base["value"]) / base["value"]
+        worse = -change if result["better"] == "higher" else change
+        if worse > tolerance:
+            regressions.append((name, base["value"], result["value"], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--save", metavar="PATH",
+                        help="write the results to PATH as JSON")
+    parser.add_argument("--baseline", metavar="PATH",
+                        help="compare the results with a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="largest allowed slowdown relative to the "
+                             "baseline (default: 0.2)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of timed repeats of each benchmark")
+    args = parser.parse_args()
+
+    results = run_benchmarks(repeat=args.repeat, verbose=True)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for name, result in sorted(results["metrics"].items()):
+            base = baseline["metrics"].get(name, {})
+            if "nodes" in base and base["nodes"] != result["nodes"]:
+                print("NOTE {} searched {} nodes (baseline: {})".format(
+                    name, result["nodes"], base["nodes"]))
+        regressions = compare(results, baseline, args.tolerance)
+        for name, old, new, change in regressions:
+            print("REGRESSION {}: {:.1f} -> {:.1f} ({:+.0%})".format(
+                name, old, new, change))
+        if regressions:
+            sys.exit(1)
+        print("No regressions beyond {:.0%} of the baseline".format(
+            args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,16 @@ you choose.  This agent will compete against other students (and past
 champions) in a tournament.
 
          COMPLETING AND SUBMITTING A COMPETITION AGENT IS OPTIONAL
+
+The agent below uses Monte Carlo Tree Search (UCT). It only relies on the
+public `isolation.Board` interface and on the modules allowed by the PvP
+sandbox, so it can be submitted on its own.
 """
+import math
 import random
 
+from array import array
+
 
 class SearchTimeout(Exception):
     """Subclass base exception for code clarity. """
@@ -18,6 +25,9 @@ def custom_score(game, player):
 
     This should be the best heuristic function for your project submission.
 
+    The score is the difference between the number of moves available to the
+    player and twice the number of moves available to the opponent.
+
     Parameters
     ----------
     game : `isolation.Board`
@@ -33,7 +43,124 @@ def custom_score(game, player):
     float
         The heuristic value of the current game state to the specified player.
     """
-    raise NotImplementedError
+    if game.is_loser(player):
+        return float("-inf")
+
+    if game.is_winner(player):
+        return float("inf")
+
+    own_moves = len(game.get_legal_moves(player))
+    opp_moves = len(game.get_legal_moves(game.get_opponent(player)))
+    return float(own_moves - 2 * opp_moves)
+
+
+# Lists of the cells reachable by a knight from each cell, keyed by board size
+_NEIGHBOURS = {}
+
+
+def _neighbours(width, height):
+    """Return a tuple mapping each cell index (row + col * height) to a tuple
+    of the cell indices a knight can reach from it on an empty board.
+    """
+    size = (width, height)
+    if size not in _NEIGHBOURS:
+        directions = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                      (1, -2), (1, 2), (2, -1), (2, 1)]
+        _NEIGHBOURS[size] = tuple(
+            tuple(r + dr + (c + dc) * height for dr, dc in directions
+                  if 0 <= r + dr < height and 0 <= c + dc < width)
+            for c in range(width) for r in range(height))
+    return _NEIGHBOURS[size]
+
+
+def _symmetries(width, height):
+    """Return a list of cell index permutations, one for each rotation and
+    reflection of the board (same layout as `isolation.symmetries()`,
+    repeated here so that this module stays self-contained).
+    """
+    h, w = height - 1, width - 1
+    transforms = [lambda r, c: (r, c), lambda r, c: (h - r, c),
+                  lambda r, c: (r, w - c), lambda r, c: (h - r, w - c)]
+    if width == height:
+        transforms += [lambda r, c: (c, r), lambda r, c: (c, h - r),
+                       lambda r, c: (w - c, r), lambda r, c: (w - c, h - r)]
+    return [tuple(r + c * height for r, c in
+                  (t(i % height, i // height) for i in range(width * height)))
+            for t in transforms]
+
+
+def _load_book(data):
+    """Expand the positions of an opening book (the dictionary written by
+    `opening_book.OpeningBook.to_dict()`) to all of their symmetric variants.
+
+    Returns a dictionary mapping (width, height, blocked, p1, p2) keys to the
+    cell index of the book move.
+    """
+    width, height = data["width"], data["height"]
+    perms = _symmetries(width, height)
+    book = {}
+    for key, move in data["positions"].items():
+        blocked, p1, p2 = key.split(":")
+        blocked, p1, p2 = int(blocked, 16), int(p1), int(p2)
+        cells = [i for i in range(width * height) if blocked >> i & 1]
+        for perm in perms:
+            new_key = (width, height, sum(1 << perm[i] for i in cells),
+                       perm[p1] if p1 >= 0 else -1,
+                       perm[p2] if p2 >= 0 else -1)
+            book.setdefault(new_key, perm[move])
+    return book
+
+
+class CompactState:
+    """Minimal copy of an isolation game state used for tree descent and
+    random rollouts: a bitmask of blocked cells, the cell index of each
+    player (-1 before the first move), and the index (0 or 1) of the player
+    to move.
+    """
+    __slots__ = ("width", "height", "blocked", "locs", "to_move")
+
+    def __init__(self, width, height, blocked, locs, to_move):
+        self.width = width
+        self.height = height
+        self.blocked = blocked
+        self.locs = locs
+        self.to_move = to_move
+
+    @classmethod
+    def from_game(cls, game):
+        """Encode the state of an `isolation.Board` using its public API."""
+        height = game.height
+        blocked = (1 << (game.width * height)) - 1
+        for r, c in game.get_blank_spaces():
+            blocked &= ~(1 << (r + c * height))
+        locs = []
+        for player in (game.active_player, game.inactive_player):
+            loc = game.get_player_location(player)
+            locs.append(-1 if loc is None else loc[0] + loc[1] * height)
+        # locs are stored by player index; the active player moves next
+        to_move = game.move_count % 2
+        if to_move:
+            locs.reverse()
+        return cls(game.width, height, blocked, locs, to_move)
+
+    def copy(self):
+        return CompactState(self.width, self.height, self.blocked,
+                            list(self.locs), self.to_move)
+
+    def legal_moves(self, neighbours):
+        """Return the list of cell indices the player to move can reach."""
+        loc = self.locs[self.to_move]
+        blocked = self.blocked
+        if loc < 0:
+            return [i for i in range(self.width * self.height)
+                    if not blocked >> i & 1]
+        return [i for i in neighbours[loc] if not blocked >> i & 1]
+
+    def apply(self, idx):
+        """Move the player to move to the cell index in-place."""
+        self.blocked |= 1 << idx
+        self.locs[self.to_move] = idx
+        self.to_move ^= 1
 
 
 class CustomPlayer:
@@ -49,22 +176,45 @@ class CustomPlayer:
         COMPETITION.  IT IS NOT REQUIRED FOR THE ISOLATION PROJECT REVIEW.
     **************************************************************************
 
+    This agent chooses moves with Monte Carlo Tree Search using the UCT
+    selection rule. The search tree is stored in flat arrays (one entry per
+    node, with the children of a node stored contiguously), so its memory
+    use is bounded by `max_nodes`. The subtree below the actual game
+    continuation is kept between turns.
+
     Parameters
     ----------
-    data : string
-        The name of the search method to use in get_move().
+    data : dict (optional)
+        The contents of an opening book file built by `opening_book.py`.
+        Positions found in the book are played without searching.
 
     timeout : float (optional)
-        Time remaining (in milliseconds) when search is aborted.  Note that
-        the PvP competition uses more accurate timers that are not cross-
-        platform compatible, so a limit of 1ms (vs 10ms for the other classes)
-        is generally sufficient.
+        Time remaining (in milliseconds) when search is aborted. A batch of
+        rollouts is only started if twice the time of the slowest batch of
+        the turn still leaves this margin, so that a slow batch does not
+        overrun it.
+
+    exploration : float (optional)
+        The exploration constant of the UCT selection rule.
+
+    batch_size : int (optional)
+        The number of rollouts performed between checks of the timer.
+
+    max_nodes : int (optional)
+        The maximum number of nodes in the search tree. Once the tree is full,
+        leaves are no longer expanded but rollouts continue.
     """
 
-    def __init__(self, data=None, timeout=1.):
+    def __init__(self, data=None, timeout=10., exploration=math.sqrt(2),
+                 batch_size=32, max_nodes=2**17):
         self.score = custom_score
         self.time_left = None
         self.TIMER_THRESHOLD = timeout
+        self.exploration = exploration
+        self.batch_size = batch_size
+        self.max_nodes = max_nodes
+        self._book = _load_book(data) if data else {}
+        self._reset_tree(None)
 
     def get_move(self, game, time_left):
         """Search for the best move from the available legal moves and return a
@@ -93,5 +243,217 @@ class CustomPlayer:
             Board coordinates corresponding to a legal move; may return
             (-1, -1) if there are no available legal moves.
         """
-        # OPTIONAL: Finish this function!
-        raise NotImplementedError
+        self.time_left = time_left
+        state = CompactState.from_game(game)
+        neighbours = _neighbours(state.width, state.height)
+        legal_moves = state.legal_moves(neighbours)
+        if not legal_moves:
+            return (-1, -1)
+
+        move = self._book.get((state.width, state.height, state.blocked,
+                               state.locs[0], state.locs[1]))
+        if move is not None:
+            # the tree no longer follows the game; start over next turn
+            self._root_move = -1
+            return (move % state.height, move // state.height)
+
+        self._advance_tree(state)
+        try:
+            self.mcts(state, neighbours)
+        except SearchTimeout:
+            pass
+
+        # The tree is re-rooted at the start of the next turn rather than now
+        # so that the cost of compacting it is bounded by the timer checks
+        # of _reroot()
+        idx = self._best_child(0)
+        if idx < 0:
+            move = random.choice(legal_moves)
+        else:
+            move = self._move[idx]
+        self._root_state.apply(move)
+        self._root_move = idx
+        return (move % state.height, move // state.height)
+
+    def mcts(self, state, neighbours):
+        """Grow the search tree rooted at the state with batches of
+        select/expand/rollout/backpropagate iterations until the time limit
+        is about to expire.
+        """
+        batch_time = 0.
+        while True:
+            start = self.time_left()
+            if start - 2 * batch_time < self.TIMER_THRESHOLD:
+                raise SearchTimeout()
+            for _ in range(self.batch_size):
+                self._iterate(state, neighbours)
+            batch_time = max(batch_time, start - self.time_left())
+
+    def _iterate(self, root_state, neighbours):
+        """Run a single MCTS iteration from the root of the tree."""
+        state = root_state.copy()
+        node = 0
+        path = [0]
+
+        # Selection: descend through expanded nodes with the UCT rule
+        while self._num_children[node] > 0:
+            node = self._select(node)
+            state.apply(self._move[node])
+            path.append(node)
+
+        # Expansion: add all children of the leaf and descend into one
+        moves = state.legal_moves(neighbours)
+        if moves and self._visits[node] > 0 and self._expand(node, moves):
+            node = self._first_child[node] + random.randrange(len(moves))
+            state.apply(self._move[node])
+            path.append(node)
+
+        # Simulation: the index of the player who wins a random playout
+        winner = self._rollout(state, neighbours)
+
+        # Backpropagation: the mover into a node is the opponent of the
+        # player to move at that node
+        mover = root_state.to_move ^ 1
+        for node in path:
+            self._visits[node] += 1
+            if mover == winner:
+                self._wins[node] += 1
+            mover ^= 1
+
+    def _select(self, node):
+        """Return the child of the node that maximizes the UCT value."""
+        first = self._first_child[node]
+        last = first + self._num_children[node]
+        visits, wins = self._visits, self._wins
+        log_n = math.log(visits[node])
+        c = self.exploration
+        best, best_value = first, float("-inf")
+        for child in range(first, last):
+            n = visits[child]
+            if n == 0:
+                return child
+            value = wins[child] / n + c * math.sqrt(log_n / n)
+            if value > best_value:
+                best, best_value = child, value
+        return best
+
+    def _expand(self, node, moves):
+        """Append the children of the node to the node arrays. Returns False
+        if the tree is full.
+        """
+        if len(self._move) + len(moves) > self.max_nodes:
+            return False
+        self._first_child[node] = len(self._move)
+        self._num_children[node] = len(moves)
+        for move in moves:
+            self._append_node(node, move)
+        return True
+
+    @staticmethod
+    def _rollout(state, neighbours):
+        """Play uniformly random moves until the player to move is stuck, and
+        return the index of the winning player. The state is modified.
+        """
+        blocked = state.blocked
+        locs = state.locs
+        to_move = state.to_move
+        choice = random.choice
+        num_cells = state.width * state.height
+        while True:
+            loc = locs[to_move]
+            if loc < 0:
+                moves = [i for i in range(num_cells) if not blocked >> i & 1]
+            else:
+                moves = [i for i in neighbours[loc] if not blocked >> i & 1]
+            if not moves:
+                return to_move ^ 1
+            loc = choice(moves)
+            blocked |= 1 << loc
+            locs[to_move] = loc
+            to_move ^= 1
+
+    def _best_child(self, node):
+        """Return the most visited child of the node, or -1 if the node has
+        not been expanded.
+        """
+        first = self._first_child[node]
+        if first < 0:
+            return -1
+        last = first + self._num_children[node]
+        return max(range(first, last), key=lambda child: self._visits[child])
+
+    def _reset_tree(self, state):
+        """Discard the tree and start a new one rooted at the state."""
+        self._root_state = state.copy() if state is not None else None
+        self._root_move = -1
+        self._move = array("h")
+        self._parent = array("i")
+        self._first_child = array("i")
+        self._num_children = array("h")
+        self._visits = array("i")
+        self._wins = array("d")
+        self._append_node(-1, -1)
+
+    def _append_node(self, parent, move):
+        self._move.append(move)
+        self._parent.append(parent)
+        self._first_child.append(-1)
+        self._num_children.append(0)
+        self._visits.append(0)
+        self._wins.append(0.)
+
+    def _advance_tree(self, state):
+        """Re-root the tree kept from the previous turn at the current state,
+        following the move chosen on that turn and the opponent's reply, or
+        start a new tree if the state is not a continuation of the previous
+        search.
+        """
+        root = self._root_state
+        if (root is None or self._root_move < 0 or
+                root.width != state.width or root.height != state.height or
+                root.to_move == state.to_move):
+            return self._reset_tree(state)
+
+        reply = state.locs[root.to_move]
+        first = self._first_child[self._root_move]
+        child = -1
+        if first >= 0:
+            for idx in range(first, first + self._num_children[self._root_move]):
+                if self._move[idx] == reply:
+                    child = idx
+                    break
+        root.apply(reply)
+        if (child < 0 or root.blocked != state.blocked or
+                root.locs != state.locs):
+            return self._reset_tree(state)
+        self._reroot(child)
+
+    def _reroot(self, node):
+        """Make the node the root of the tree, compacting its subtree into
+        new arrays and discarding the rest of the tree.
+
+        The copy stops early if the timer is about to expire; the nodes
+        copied last are then kept as leaves, so the tree stays valid.
+        """
+        arrays = (self._move, self._parent, self._first_child,
+                  self._num_children, self._visits, self._wins)
+        self._reset_tree(self._root_state)
+        self._visits[0] = arrays[4][node]
+        self._wins[0] = arrays[5][node]
+
+        # Breadth-first copy keeps the children of each node contiguous
+        queue = [(node, 0)]
+        for old, new in queue:
+            if (new and new % self.batch_size == 0 and
+                    self.time_left() < self.TIMER_THRESHOLD):
+                break
+            first, count = arrays[2][old], arrays[3][old]
+            if first < 0:
+                continue
+            self._first_child[new] = len(self._move)
+            self._num_children[new] = count
+            for child in range(first, first + count):
+                queue.append((child, len(self._move)))
+                self._append_node(new, arrays[0][child])
+                self._visits[-1] = arrays[4][child]
+                self._wins[-1] = arrays[5][child]
@@ -2,6 +2,20 @@
 test your agent's strength against a set of known agents using tournament.py
 and include the results in your report.
 """
+import copy
+import json
+import multiprocessing
+import os
+import struct
+import time
+import weakref
+
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+from isolation.bitboard import knight_masks
+from isolation.isolation import board_cells, knight_neighbours
+
 
 class SearchTimeout(Exception):
     """Subclass base exception for code clarity. """
@@ -36,14 +50,16 @@ def custom_score(game, player):
     float
         The heuristic value of the current game state to the specified player.
     """
+    # count the moves first, so that the terminal tests reuse the counts
+    own_moves = game.count_legal_moves(player)
+    opp_moves = game.count_legal_moves(game.get_opponent(player))
+
     if game.is_loser(player):
         return float("-inf")
 
     if game.is_winner(player):
         return float("inf")
 
-    own_moves = len(game.get_legal_moves(player))
-    opp_moves = len(game.get_legal_moves(game.get_opponent(player)))
     return float(own_moves - 2 * opp_moves)**2
     
 
@@ -115,6 +131,10 @@ def custom_score_3(game, player):
     float
         The heuristic value of the current game state to the specified player.
     """
+    # count the moves first, so that the terminal tests reuse the counts
+    own_moves = game.count_legal_moves(player)
+    opp_moves = game.count_legal_moves(game.get_opponent(player))
+
     if game.is_loser(player):
         return float("-inf")
     if game.is_winner(player):
@@ -125,13 +145,949 @@ def custom_score_3(game, player):
     y2, x2 = game.get_player_location(game.get_opponent(player))    
     player_1_score = float((h - y1)**2 + (w - x1)**2)
     player_2_score = float((h - y2)**2 + (w - x2)**2) 
-    
-    own_moves = len(game.get_legal_moves(player))
-    opp_moves = len(game.get_legal_moves(game.get_opponent(player)))
    
     return float(10 * (own_moves - 2 * opp_moves) + (player_1_score - player_2_score))
 
 
+#%%
+def score_features(game, player):
+    """Return the features of a game state from the point of view of the
+    given player that the heuristics above combine: the number of legal
+    moves of the player and of the opponent, and the squared distances of
+    the player and of the opponent from the centre of the board (0 for a
+    player that has not moved yet).
+
+    Parameters
+    ----------
+    game : `isolation.Board`
+        An instance of `isolation.Board` encoding the current state of the
+        game (e.g., player locations and blocked cells).
+
+    player : object
+        A player instance in the current game.
+
+    Returns
+    -------
+    tuple of float
+        The features, in the order of `LinearScore.FEATURES`.
+    """
+    w, h = game.width / 2., game.height / 2.
+    opponent = game.get_opponent(player)
+    distances = []
+    for who in (player, opponent):
+        loc = game.get_player_location(who)
+        distances.append(0. if loc is None else
+                         float((h - loc[0])**2 + (w - loc[1])**2))
+    return (float(game.mobility(player)), float(game.mobility(opponent)),
+            distances[0], distances[1])
+
+
+class LinearScore:
+    """Heuristic that scores a game state by a weighted sum of its
+    `score_features`, for example with weights fitted to self-play games
+    by `self_play.py`. `custom_score_3` is the linear score with weights
+    (10, -20, 1, -1).
+
+    Parameters
+    ----------
+    weights : sequence of float
+        One weight for each of the `FEATURES`.
+    """
+
+    FEATURES = ("own_moves", "opp_moves", "own_centre", "opp_centre")
+
+    def __init__(self, weights):
+        if len(weights) != len(LinearScore.FEATURES):
+            raise ValueError("Expected {} weights, got {}".format(
+                len(LinearScore.FEATURES), len(weights)))
+        self.weights = tuple(float(weight) for weight in weights)
+        self.__name__ = "linear_score"
+
+    def __call__(self, game, player):
+        if game.is_loser(player):
+            return float("-inf")
+
+        if game.is_winner(player):
+            return float("inf")
+
+        return sum(weight * feature for weight, feature in
+                   zip(self.weights, score_features(game, player)))
+
+    def __repr__(self):
+        return "LinearScore({!r})".format(self.weights)
+
+    @classmethod
+    def load(cls, path):
+        """Create the heuristic from a weights file written by
+        `self_play.py fit`.
+        """
+        with open(path) as f:
+            data = json.load(f)
+        if tuple(data["features"]) != LinearScore.FEATURES:
+            raise ValueError("{} has weights for features {}".format(
+                path, data["features"]))
+        return cls(data["weights"])
+
+
+#%%
+class BatchEvaluator:
+    """Evaluate a heuristic for many leaf positions at once with NumPy.
+
+    A batch of positions on a board with n cells is encoded as arrays: a
+    (batch, n) boolean array of the blank cells, the cell indices of the
+    player and of the opponent (-1 if they have not moved), and whether the
+    player is the one to move. Mobility is then computed for the whole batch
+    from a precomputed knight-move adjacency matrix, and the centre distance
+    from a precomputed table of squared distances, giving exactly the same
+    scores as the heuristic itself.
+
+    Requires NumPy, which is imported when the evaluator is created.
+
+    Parameters
+    ----------
+    score_fn : callable (optional)
+        The heuristic to evaluate; one of the functions named in `SCORES`.
+    """
+
+    SCORES = ("open_move_score", "improved_score", "center_score",
+              "custom_score", "custom_score_2", "custom_score_3")
+
+    def __init__(self, score_fn=custom_score_3):
+        import numpy  # fail early if NumPy is missing
+        if score_fn.__name__ not in BatchEvaluator.SCORES:
+            raise ValueError("Batch evaluation is not supported for {}".format(
+                score_fn.__name__))
+        self.score_fn = score_fn
+        self._name = score_fn.__name__
+        self._size = None
+        self._adjacency = None
+        self._centre = None
+
+    def encode(self, games, player):
+        """Return the arrays (blank, own, opp, own_active) encoding the games
+        (all of the same size) from the point of view of the player.
+        """
+        import numpy as np
+        width, height = games[0].width, games[0].height
+        self._set_size(width, height)
+        blank = np.zeros((len(games), width * height), dtype=bool)
+        own = np.empty(len(games), dtype=np.intp)
+        opp = np.empty(len(games), dtype=np.intp)
+        own_active = np.empty(len(games), dtype=bool)
+        for i, game in enumerate(games):
+            blank[i, [r + c * height for r, c in game.iter_blank_spaces()]] = True
+            for locs, who in ((own, player), (opp, game.get_opponent(player))):
+                loc = game.get_player_location(who)
+                locs[i] = -1 if loc is None else loc[0] + loc[1] * height
+            own_active[i] = game.active_player == player
+        return blank, own, opp, own_active
+
+    def evaluate(self, blank, own, opp, own_active):
+        """Return an array of the scores of the positions encoded by the
+        arrays returned by encode().
+        """
+        adjacency = self._adjacency
+        own_moves = (adjacency[own] & blank).sum(axis=1)
+        opp_moves = (adjacency[opp] & blank).sum(axis=1)
+        return self._scores(own_moves, opp_moves, own, opp, own_active)
+
+    def _scores(self, own_moves, opp_moves, own, opp, own_active):
+        """Return the array of scores for the given mobility counts and
+        locations of the player and the opponent. own_active is a boolean
+        array, or a bool shared by the whole batch.
+        """
+        import numpy as np
+        centre = self._centre
+        own_active = np.asarray(own_active)
+        name = self._name
+        if name == "open_move_score":
+            scores = own_moves.astype(float)
+        elif name == "improved_score":
+            scores = (own_moves - opp_moves).astype(float)
+        elif name == "center_score":
+            scores = centre[own]
+        elif name == "custom_score":
+            scores = ((own_moves - 2 * opp_moves)**2).astype(float)
+        elif name == "custom_score_2":
+            scores = centre[own] - centre[opp]
+        else:
+            scores = 10 * (own_moves - 2 * opp_moves) + (centre[own] -
+                                                         centre[opp])
+
+        scores[own_active & (own_moves == 0)] = -np.inf
+        scores[~own_active & (opp_moves == 0)] = np.inf
+        return scores
+
+    def score(self, games, player):
+        """Return the list of the scores of the games for the player."""
+        return self.evaluate(*self.encode(games, player)).tolist()
+
+    def score_moves(self, game, moves, player):
+        """Return the list of the scores for the player of the positions
+        reached by each of the moves of the active player. The position is
+        encoded once, and the children are derived from it in the arrays,
+        without creating a board for each of them.
+        """
+        import numpy as np
+        width, height = game.width, game.height
+        self._set_size(width, height)
+        adjacency = self._adjacency
+        blank = np.zeros(width * height, dtype=bool)
+        blank[[r + c * height for r, c in game.iter_blank_spaces()]] = True
+        cells = np.array([r + c * height for r, c in moves], dtype=np.intp)
+        loc = game.get_player_location(game.inactive_player)
+        loc = -1 if loc is None else loc[0] + loc[1] * height
+
+        # The mover has moved to each of the cells; the other player keeps
+        # its location, and loses a move wherever the mover blocked one
+        mover_moves = (adjacency[cells] & blank).sum(axis=1)
+        other_moves = (adjacency[loc] & blank).sum() - adjacency[loc, cells]
+        if game.active_player == player:
+            return self._scores(mover_moves, other_moves, cells,
+                                np.full(len(cells), loc), False).tolist()
+        return self._scores(other_moves, mover_moves, np.full(len(cells), loc),
+                            cells, True).tolist()
+
+    def _set_size(self, width, height):
+        """Build the lookup tables for a board size. Both tables have an
+        extra last row, used for the index -1 of a player that has not moved
+        yet: every cell is adjacent to it, matching `Board.get_legal_moves()`.
+        """
+        import numpy as np
+        if self._size == (width, height):
+            return
+        self._size = (width, height)
+        size = width * height
+        adjacency = np.zeros((size + 1, size), dtype=bool)
+        for idx, neighbours in enumerate(knight_neighbours(width, height)):
+            adjacency[idx, list(neighbours)] = True
+        adjacency[size] = True
+        centre = np.zeros(size + 1)
+        w, h = width / 2., height / 2.
+        for idx, (r, c) in enumerate(board_cells(width, height)):
+            centre[idx] = (h - r)**2 + (w - c)**2
+        self._adjacency = adjacency
+        self._centre = centre
+
+
+#%%
+TTEntry = namedtuple("TTEntry", ["key", "depth", "score", "flag", "move",
+                                 "generation"])
+
+
+class TranspositionTable:
+    """Bounded cache of search results keyed by the Zobrist hash returned by
+    `isolation.Board.hash()`.
+
+    Each entry records the depth of the subtree searched below the position,
+    the score found, whether that score is exact or only a lower or upper
+    bound on the true value, and the best move found at the position.
+
+    Parameters
+    ----------
+    size : int (optional)
+        The number of slots in the table. Each position maps to exactly one
+        slot, so the table never holds more than `size` entries.
+
+    policy : str (optional)
+        The replacement policy used when a new result maps to an occupied
+        slot. "depth" (depth-preferred) keeps the existing entry if it was
+        searched deeper during the current search, and "always" replaces
+        the existing entry unconditionally.
+    """
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+    POLICIES = ("depth", "always")
+
+    def __init__(self, size=2**16, policy="depth"):
+        if policy not in TranspositionTable.POLICIES:
+            raise ValueError("Unknown replacement policy: {}".format(policy))
+        self.size = size
+        self.policy = policy
+        self.generation = 0
+        self._entries = [None] * size
+
+    def __len__(self):
+        return sum(entry is not None for entry in self._entries)
+
+    def new_search(self):
+        """Mark the start of a new search. Entries stored by earlier searches
+        can always be replaced under the depth-preferred policy.
+        """
+        self.generation += 1
+
+    def clear(self):
+        """ Remove all entries from the table. """
+        self._entries = [None] * self.size
+
+    def probe(self, key):
+        """Return the entry stored for the hash key, or None if there is no
+        entry for the key.
+        """
+        entry = self._entries[key % self.size]
+        if entry is not None and entry.key == key:
+            return entry
+        return None
+
+    def store(self, key, depth, score, flag, move):
+        """Store a search result for the hash key, subject to the
+        replacement policy of the table.
+        """
+        slot = key % self.size
+        old = self._entries[slot]
+        if (self.policy == "depth" and old is not None and
+                old.generation == self.generation and old.depth > depth):
+            return
+        self._entries[slot] = TTEntry(key, depth, score, flag, move,
+                                      self.generation)
+
+
+#%%
+class SharedTranspositionTable(TranspositionTable):
+    """Transposition table stored in a `multiprocessing.shared_memory` block
+    so that several processes can search with the same table.
+
+    Each slot holds three 64-bit words: a check word, the packed depth, flag,
+    move and generation, and the bits of the score. The check word is the
+    XOR of the key with the other two words, so an entry that was torn by
+    concurrent writes from two processes fails the key comparison in
+    probe() and is ignored, without any locking.
+
+    Parameters
+    ----------
+    name : str (optional)
+        The name of an existing shared table to attach to. If None, a new
+        shared memory block is created; it is released when the table that
+        created it is garbage collected.
+
+    See `TranspositionTable` for the remaining parameters.
+    """
+    _SLOT = struct.Struct("<QQQ")
+    _DOUBLE = struct.Struct("<d")
+    _BITS = struct.Struct("<Q")
+    _VALID = 1 << 63
+
+    def __init__(self, size=2**16, policy="depth", name=None):
+        if policy not in TranspositionTable.POLICIES:
+            raise ValueError("Unknown replacement policy: {}".format(policy))
+        self.size = size
+        self.policy = policy
+        self.generation = 0
+        nbytes = size * self._SLOT.size
+        # Forked processes inherit the finalizer, so the block is only
+        # unlinked by the process that created it
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self._finalizer = weakref.finalize(self, _release_shared_memory,
+                                               self._shm, os.getpid())
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._finalizer = weakref.finalize(self, _release_shared_memory,
+                                               self._shm, None)
+        self.name = self._shm.name
+
+    def __getstate__(self):
+        # Copies get a new, empty table of their own
+        return {"size": self.size, "policy": self.policy}
+
+    def __setstate__(self, state):
+        self.__init__(state["size"], state["policy"])
+
+    def __len__(self):
+        buf = self._shm.buf
+        return sum(bool(self._SLOT.unpack_from(buf, slot * self._SLOT.size)[1])
+                   for slot in range(self.size))
+
+    def clear(self):
+        """ Remove all entries from the table. """
+        self._shm.buf[:self.size * self._SLOT.size] = bytes(
+            self.size * self._SLOT.size)
+
+    def close(self):
+        """Detach from the shared memory block, and free it if this table
+        created it.
+        """
+        self._finalizer()
+
+    def probe(self, key):
+        """Return the entry stored for the hash key, or None if there is no
+        valid entry for the key.
+        """
+        check, data, bits = self._SLOT.unpack_from(
+            self._shm.buf, (key % self.size) * self._SLOT.size)
+        if not data or check ^ data ^ bits != key:
+            return None
+        row = (data >> 18 & 0xff) - 1
+        move = None if row < 0 else (row, (data >> 26 & 0xff) - 1)
+        score = self._DOUBLE.unpack(self._BITS.pack(bits))[0]
+        return TTEntry(key, data & 0xffff, score, data >> 16 & 3, move,
+                       data >> 34 & 0xffff)
+
+    def store(self, key, depth, score, flag, move):
+        """Store a search result for the hash key, subject to the
+        replacement policy of the table.
+        """
+        offset = (key % self.size) * self._SLOT.size
+        generation = self.generation & 0xffff
+        if self.policy == "depth":
+            _, data, _ = self._SLOT.unpack_from(self._shm.buf, offset)
+            if (data and data >> 34 & 0xffff == generation and
+                    data & 0xffff > depth):
+                return
+        data = (self._VALID | generation << 34 | depth | flag << 16)
+        if move is not None:
+            data |= (move[0] + 1) << 18 | (move[1] + 1) << 26
+        bits = self._BITS.unpack(self._DOUBLE.pack(score))[0]
+        self._SLOT.pack_into(self._shm.buf, offset, key ^ data ^ bits, data,
+                             bits)
+
+
+def _release_shared_memory(shm, owner_pid):
+    shm.close()
+    if owner_pid == os.getpid():
+        shm.unlink()
+
+
+#%%
+class MoveOrdering:
+    """Order the moves searched at each node of an alpha-beta search so that
+    the moves most likely to cause a cutoff are searched first.
+
+    Moves are ordered by priority: the hash move (the best move found for
+    the position by a previous iteration, taken from the transposition table
+    or the previous root search), then the killer moves recorded for the
+    current ply, then the remaining moves by their history score. Each part
+    can be disabled to compare orderings; subclasses can override `order()`
+    and `record_cutoff()` to plug in a different scheme.
+
+    Parameters
+    ----------
+    hash_move : bool (optional)
+        Search the move from the previous iteration first.
+
+    killers : bool (optional)
+        Search the moves that caused the most recent cutoffs at the same ply
+        next.
+
+    history : bool (optional)
+        Order the remaining moves by the history heuristic, which rewards a
+        (from, to) cell pair each time the move causes a cutoff.
+
+    num_killers : int (optional)
+        The number of killer moves remembered for each ply.
+    """
+
+    def __init__(self, hash_move=True, killers=True, history=True,
+                 num_killers=2):
+        self.use_hash_move = hash_move
+        self.use_killers = killers
+        self.use_history = history
+        self.num_killers = num_killers
+        self.killers = {}
+        self.history = {}
+
+    def new_search(self):
+        """Reset the killer moves and age the history scores at the start of
+        a new search so that stale statistics fade out over the game.
+        """
+        self.killers = {}
+        self.history = {key: value // 2 for key, value in self.history.items()
+                        if value > 1}
+
+    def order(self, game, moves, ply, hash_move=None):
+        """Return the legal moves for the active player in the order they
+        should be searched.
+
+        Parameters
+        ----------
+        game : `isolation.Board`
+            The game state at the node being searched.
+
+        moves : list<(int, int)>
+            The legal moves for the active player in the game state.
+
+        ply : int
+            The distance in plies of the node from the root of the search.
+
+        hash_move : (int, int) (optional)
+            The best move found for the game state by a previous search.
+        """
+        first = []
+        if self.use_hash_move and hash_move in moves:
+            first.append(hash_move)
+        if self.use_killers:
+            first.extend(m for m in self.killers.get(ply, ())
+                         if m in moves and m not in first)
+        rest = [m for m in moves if m not in first]
+        if self.use_history and self.history:
+            origin = game.get_player_location(game.active_player)
+            history = self.history
+            rest.sort(key=lambda m: history.get((origin, m), 0), reverse=True)
+        return first + rest
+
+    def record_cutoff(self, game, move, ply, depth):
+        """Update the killer and history tables after a move causes a cutoff
+        at a node with `depth` plies left to search below it.
+        """
+        if self.use_killers:
+            killers = self.killers.setdefault(ply, [])
+            if move not in killers:
+                killers.insert(0, move)
+                del killers[self.num_killers:]
+        if self.use_history:
+            key = (game.get_player_location(game.active_player), move)
+            self.history[key] = self.history.get(key, 0) + depth * depth
+
+
+class SearchStats:
+    """Counters describing the pruning achieved by a search.
+
+    Attributes
+    ----------
+    nodes : int
+        The number of interior nodes whose children were expanded.
+
+    cutoffs : int
+        The number of interior nodes that were cut off before all children
+        were searched.
+
+    cutoff_index : list<int>
+        Histogram of the position (0 = first move searched) of the move that
+        caused each cutoff. Good move ordering concentrates the cutoffs at
+        index 0.
+
+    researches : int
+        The number of times a subtree was searched again with a wider window
+        after a null-window or aspiration-window search failed.
+
+    evals : int
+        The number of calls to the heuristic at leaf and terminal nodes.
+
+    depth : int
+        The depth of the deepest completed search iteration.
+
+    iteration_nodes : list<int>
+        The number of interior nodes expanded by each completed iteration.
+
+    iteration_times : list<float>
+        The time in seconds taken by each completed iteration.
+    """
+
+    def __init__(self):
+        self.nodes = 0
+        self.cutoffs = 0
+        self.cutoff_index = []
+        self.researches = 0
+        self.evals = 0
+        self.depth = 0
+        self.iteration_nodes = []
+        self.iteration_times = []
+
+    def record_iteration(self, depth, nodes, elapsed):
+        """Record a completed search iteration to the given depth that
+        expanded `nodes` interior nodes in `elapsed` seconds.
+        """
+        self.depth = depth
+        self.iteration_nodes.append(nodes)
+        self.iteration_times.append(elapsed)
+
+    def record_cutoff(self, index):
+        """Count a cutoff caused by the move searched at position `index`."""
+        self.cutoffs += 1
+        while len(self.cutoff_index) <= index:
+            self.cutoff_index.append(0)
+        self.cutoff_index[index] += 1
+
+    @property
+    def cutoff_rate(self):
+        """The fraction of interior nodes that were cut off."""
+        return self.cutoffs / self.nodes if self.nodes else 0.
+
+    @property
+    def first_move_cutoff_rate(self):
+        """The fraction of cutoffs caused by the first move searched."""
+        if not self.cutoffs:
+            return 0.
+        return self.cutoff_index[0] / self.cutoffs
+
+    @property
+    def effective_branching_factor(self):
+        """The branching factor b of a uniform tree with the same number of
+        nodes as the deepest completed iteration, i.e., nodes ** (1 / depth).
+        """
+        if not self.depth or not self.iteration_nodes:
+            return 0.
+        return self.iteration_nodes[-1] ** (1. / self.depth)
+
+    def as_dict(self):
+        """Return the counters as a dictionary."""
+        return {"nodes": self.nodes, "cutoffs": self.cutoffs,
+                "cutoff_index": list(self.cutoff_index),
+                "researches": self.researches,
+                "evals": self.evals, "depth": self.depth,
+                "iteration_nodes": list(self.iteration_nodes),
+                "iteration_times": list(self.iteration_times),
+                "cutoff_rate": self.cutoff_rate,
+                "first_move_cutoff_rate": self.first_move_cutoff_rate,
+                "effective_branching_factor": self.effective_branching_factor}
+
+
+class SearchLog:
+    """Collect a record of the search statistics of every move made by a
+    player, for export as JSON lines and aggregation across games.
+
+    Logging is off unless a `SearchLog` is assigned to the `search_log`
+    attribute of a player; the search counters themselves are always kept.
+
+    Parameters
+    ----------
+    name : str (optional)
+        A name added to every record (e.g., the name of the agent in a
+        tournament).
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self.records = []
+
+    def record(self, game, move, source, elapsed, stats):
+        """Add the record of a move chosen in the game state.
+
+        Parameters
+        ----------
+        source : str
+            How the move was chosen: "search", "book" or "endgame".
+
+        elapsed : float
+            The time in seconds spent choosing the move.
+
+        stats : `SearchStats`
+            The statistics of the search for the move.
+        """
+        record = {"agent": self.name, "move_count": game.move_count,
+                  "move": list(move), "source": source, "time": elapsed}
+        record.update(stats.as_dict())
+        self.records.append(record)
+
+    def extend(self, records):
+        """Add records collected by another log (e.g., a copy of this log
+        used in a worker process).
+        """
+        self.records.extend(records)
+
+    def write(self, f):
+        """Write the records to a file object, one JSON object per line."""
+        for record in self.records:
+            f.write(json.dumps(record) + "\n")
+
+    def summary(self):
+        """Return a dictionary of statistics aggregated over the searched
+        moves: the number of moves, the mean depth, nodes per second, mean
+        effective branching factor, the overall cutoff rates, and the
+        combined cutoff position histogram.
+        """
+        searched = [r for r in self.records if r["source"] == "search"]
+        nodes = sum(r["nodes"] for r in searched)
+        cutoffs = sum(r["cutoffs"] for r in searched)
+        seconds = sum(r["time"] for r in searched)
+        cutoff_index = []
+        for r in searched:
+            for idx, count in enumerate(r["cutoff_index"]):
+                if idx == len(cutoff_index):
+                    cutoff_index.append(0)
+                cutoff_index[idx] += count
+        count = len(searched) or 1
+        return {
+            "moves": len(self.records), "searched": len(searched),
+            "nodes": nodes, "evals": sum(r["evals"] for r in searched),
+            "depth": sum(r["depth"] for r in searched) / count,
+            "nodes_per_second": nodes / seconds if seconds else 0.,
+            "effective_branching_factor": sum(
+                r["effective_branching_factor"] for r in searched) / count,
+            "cutoff_rate": cutoffs / nodes if nodes else 0.,
+            "first_move_cutoff_rate": (
+                cutoff_index[0] / cutoffs if cutoffs else 0.),
+            "cutoff_index": cutoff_index}
+
+
+#%%
+class EndgameSolver:
+    """Exact solver for endgames where the players can no longer interfere
+    with each other.
+
+    Once the cells reachable by the two players (by a flood fill over the
+    knight-move graph of the blank cells) are disjoint, each player simply
+    makes as many moves as possible inside their own region, and the player
+    to move wins if and only if their longest path is longer than the
+    opponent's. The solver finds the longest path of the active player by
+    depth-first search, memoized on the bitmask of the region still
+    reachable from the current cell and the cell itself.
+
+    Parameters
+    ----------
+    max_entries : int (optional)
+        The memo is cleared when it grows beyond this many entries. Entries
+        only depend on the board size, so they are kept between turns.
+    """
+
+    def __init__(self, max_entries=2**20):
+        self.max_entries = max_entries
+        self.time_left = None
+        self.TIMER_THRESHOLD = 0.
+        self._size = None
+        self._masks = None
+        self._memo = {}
+
+    def partition(self, game):
+        """Return the bitmasks of the blank cells reachable by the active and
+        inactive players, or None if both players can reach a common cell
+        (or either player has not moved yet).
+        """
+        self._set_size(game.width, game.height)
+        height = game.height
+        locs = []
+        for player in (game.active_player, game.inactive_player):
+            loc = game.get_player_location(player)
+            if loc is None:
+                return None
+            locs.append(loc[0] + loc[1] * height)
+        free = 0
+        for r, c in game.iter_blank_spaces():
+            free |= 1 << (r + c * height)
+        own = self._reachable(locs[0], free)
+        opp = self._reachable(locs[1], free)
+        if own & opp:
+            return None
+        return own, opp
+
+    def longest_path(self, game, player):
+        """Return the number of moves the player can make if the opponent
+        never blocks a cell again (i.e., the longest path of knight moves
+        through blank cells starting at the player's location).
+        """
+        self._set_size(game.width, game.height)
+        self.time_left = None
+        loc = game.get_player_location(player)
+        free = 0
+        for r, c in game.iter_blank_spaces():
+            free |= 1 << (r + c * game.height)
+        return self._longest(loc[0] + loc[1] * game.height, free)
+
+    def get_move(self, game, time_left, timeout=0.):
+        """Return the first move of the longest path of the active player if
+        the game is partitioned, or None otherwise.
+
+        If the time limit expires before every path has been explored, the
+        first move of the longest path found so far is returned.
+        """
+        regions = self.partition(game)
+        if regions is None:
+            return None
+        self.time_left = time_left
+        self.TIMER_THRESHOLD = timeout
+        if len(self._memo) > self.max_entries:
+            self._memo.clear()
+
+        height = game.height
+        loc = game.get_player_location(game.active_player)
+        start = loc[0] + loc[1] * height
+        region = regions[0]
+        moves = self._masks[start] & region
+        if not moves:
+            return (-1, -1)
+
+        # Try the moves with the fewest onward moves first (Warnsdorff's
+        # rule), which tends to find the longest paths early
+        candidates = []
+        while moves:
+            low = moves & -moves
+            moves ^= low
+            rest = region ^ low
+            idx = low.bit_length() - 1
+            candidates.append((self._count(self._masks[idx] & rest), idx))
+        candidates.sort()
+
+        best_move, best_length = candidates[0][1], -1
+        size = self._count(region)
+        try:
+            for _, idx in candidates:
+                length = 1 + self._longest(idx, region ^ (1 << idx))
+                if length > best_length:
+                    best_move, best_length = idx, length
+                if best_length == size:
+                    break
+        except SearchTimeout:
+            pass
+        return (best_move % height, best_move // height)
+
+    def _set_size(self, width, height):
+        if self._size != (width, height):
+            self._size = (width, height)
+            self._masks = knight_masks(width, height)
+            self._memo = {}
+
+    def _count(self, mask):
+        return bin(mask).count("1")
+
+    def _reachable(self, start, free):
+        """Return the bitmask of the cells in `free` reachable from the cell
+        index `start` by a sequence of knight moves through `free`.
+        """
+        masks = self._masks
+        region = 0
+        frontier = masks[start] & free
+        while frontier:
+            region |= frontier
+            step = 0
+            while frontier:
+                low = frontier & -frontier
+                step |= masks[low.bit_length() - 1]
+                frontier ^= low
+            frontier = step & free & ~region
+        return region
+
+    def _longest(self, loc, free):
+        """Return the length of the longest path of knight moves from the
+        cell index `loc` through the cells in `free`.
+        """
+        region = self._reachable(loc, free)
+        key = (region, loc)
+        length = self._memo.get(key)
+        if length is not None:
+            return length
+        if self.time_left is not None and self.time_left() < self.TIMER_THRESHOLD:
+            raise SearchTimeout()
+
+        masks = self._masks
+        size = self._count(region)
+        length = 0
+        moves = masks[loc] & region
+        while moves:
+            low = moves & -moves
+            moves ^= low
+            length = max(length,
+                         1 + self._longest(low.bit_length() - 1, region ^ low))
+            if length == size:
+                break
+        self._memo[key] = length
+        return length
+
+
+#%%
+class TimeManager:
+    """Decide when the iterative deepening of an `AlphaBetaPlayer` should stop
+    before the turn's time runs out.
+
+    The manager sets a soft time budget for each move: a fraction of the
+    time available that depends on the phase of the game, reduced further
+    once the best move has been the same for several iterations. After each
+    completed iteration it predicts the time of the next one from the
+    growth ratio of the previous iterations, and stops the search if that
+    iteration would not finish within the budget, instead of starting an
+    iteration whose partial result would be thrown away. It also stops once
+    the search reaches every remaining cell of the board, since deeper
+    iterations cannot change the result.
+
+    Parameters
+    ----------
+    check_interval : int (optional)
+        The search calls `time_left()` only once every `check_interval` node
+        visits instead of at every node.
+
+    phase_fractions : dict (optional)
+        The fraction of the available time budgeted for the move in each
+        phase ("opening", "midgame" and "endgame").
+
+    opening_moves : int (optional)
+        Positions with fewer moves played than this are in the opening.
+
+    endgame_fraction : float (optional)
+        Positions with at most this fraction of the board left blank are in
+        the endgame.
+
+    stable_iterations : int (optional)
+        The number of consecutive iterations that must return the same best
+        move for it to be considered stable.
+
+    stable_fraction : float (optional)
+        The budget is multiplied by this factor while the best move is
+        stable.
+
+    default_growth : float (optional)
+        The growth ratio assumed until two iterations have been timed.
+    """
+    PHASES = ("opening", "midgame", "endgame")
+
+    def __init__(self, check_interval=32, phase_fractions=None,
+                 opening_moves=4, endgame_fraction=0.3, stable_iterations=3,
+                 stable_fraction=0.6, default_growth=4.):
+        self.check_interval = check_interval
+        self.phase_fractions = {"opening": 0.5, "midgame": 1., "endgame": 1.}
+        self.phase_fractions.update(phase_fractions or {})
+        self.opening_moves = opening_moves
+        self.endgame_fraction = endgame_fraction
+        self.stable_iterations = stable_iterations
+        self.stable_fraction = stable_fraction
+        self.default_growth = default_growth
+        self.time_left = None
+        self.budget = 0.
+        self._start = 0.
+        self._last = 0.
+        self._times = []
+        self._best_move = None
+        self._stable = 0
+        self._blank = 0
+
+    def phase(self, game):
+        """Return the phase of the game: "opening", "midgame" or "endgame"."""
+        if game.move_count < self.opening_moves:
+            return "opening"
+        blank = game.count_blank()
+        if blank <= self.endgame_fraction * game.width * game.height:
+            return "endgame"
+        return "midgame"
+
+    def start(self, game, time_left, threshold):
+        """Set the budget (in milliseconds) for a new move, leaving
+        `threshold` milliseconds of the time left as a safety margin.
+        """
+        self.time_left = time_left
+        self._start = self._last = time_left()
+        self.budget = ((self._start - threshold) *
+                       self.phase_fractions[self.phase(game)])
+        self._times = []
+        self._best_move = None
+        self._stable = 0
+        self._blank = game.count_blank()
+
+    def should_continue(self, depth, best_move):
+        """Record a completed iteration to the given depth and its best move,
+        and return True if the next iteration is expected to finish within
+        the budget.
+        """
+        now = self.time_left()
+        self._times.append(self._last - now)
+        self._last = now
+        if depth >= self._blank:
+            return False
+
+        if best_move == self._best_move:
+            self._stable += 1
+        else:
+            self._best_move = best_move
+            self._stable = 1
+        budget = self.budget
+        if self._stable >= self.stable_iterations:
+            budget *= self.stable_fraction
+
+        growth = self.default_growth
+        if len(self._times) >= 2 and self._times[-2] > 0:
+            growth = max(1., self._times[-1] / self._times[-2])
+        predicted = self._times[-1] * growth
+        return (self._start - now) + predicted <= budget
+
+
 #%%
 class IsolationPlayer:
     """Base class for minimax and alphabeta agents -- this class is never
@@ -154,12 +1110,64 @@ class IsolationPlayer:
         Time remaining (in milliseconds) when search is aborted. Should be a
         positive value large enough to allow the function to return before the
         timer expires.
+
+    in_place : bool (optional)
+        If True, search by applying and undoing moves on a single board with
+        `Board.push_move()` and `Board.pop_move()` instead of allocating a new
+        board for every node with `Board.forecast_move()`.
+
+    Attributes
+    ----------
+    stats : `SearchStats`
+        Statistics of the search for the most recent move.
+
+    search_log : `SearchLog`
+        If set, a record of `stats` is added to the log for every move.
     """
-    def __init__(self, search_depth=3, score_fn=custom_score, timeout=30.):
+    def __init__(self, search_depth=3, score_fn=custom_score, timeout=30.,
+                 in_place=False):
         self.search_depth = search_depth
         self.score = score_fn
         self.time_left = None
         self.TIMER_THRESHOLD = timeout
+        self.in_place = in_place
+        self.stats = SearchStats()
+        self.search_log = None
+
+    def start_pondering(self, game):
+        """Called by `Board.play()` with pondering enabled right after this
+        player's move has been applied, outside of any player's timed turn.
+        Players that search on the opponent's time start doing so here.
+        """
+        pass
+
+    def stop_pondering(self):
+        """Called by `Board.play()` with pondering enabled right before this
+        player's turn starts, outside of the timed turn. Must return
+        promptly.
+        """
+        pass
+
+    def _log_move(self, game, move, source, start):
+        """Add the move to the search log (if any), timed from `start`."""
+        if self.search_log is not None:
+            self.search_log.record(game, move, source,
+                                   time.perf_counter() - start, self.stats)
+
+    def _successor(self, game, move):
+        """Return the game state that results from applying the move. In
+        in-place mode the move is pushed onto the input board, and the caller
+        must undo it with `_restore()` once the successor has been searched.
+        """
+        if self.in_place:
+            game.push_move(move)
+            return game
+        return game.forecast_move(move)
+
+    def _restore(self, game):
+        """Undo a move applied by `_successor()` in in-place mode."""
+        if self.in_place:
+            game.pop_move()
 
 #%%
 class MinimaxPlayer(IsolationPlayer):
@@ -197,6 +1205,8 @@ class MinimaxPlayer(IsolationPlayer):
             (-1, -1) if there are no available legal moves.
         """
         self.time_left = time_left
+        self.stats = SearchStats()
+        start = time.perf_counter()
 
         # Initialize the best move so that this function returns something
         # in case the search fails due to timeout
@@ -205,12 +1215,15 @@ class MinimaxPlayer(IsolationPlayer):
         try:
             # The try/except block will automatically catch the exception
             # raised when the timer is about to expire.
-            return self.minimax(game, self.search_depth)
+            best_move = self.minimax(game, self.search_depth)
+            self.stats.record_iteration(self.search_depth, self.stats.nodes,
+                                        time.perf_counter() - start)
 
         except SearchTimeout:
             pass  # Handle any actions required after timeout as needed
 
         # Return the best move from the last completed search iteration
+        self._log_move(game, best_move, "search", start)
         return best_move
 
     def minimax(self, game, depth, maximizing_player=True):
@@ -248,6 +1261,8 @@ class MinimaxPlayer(IsolationPlayer):
         if self.time_left() < self.TIMER_THRESHOLD:
             raise SearchTimeout()
        
+        stats = self.stats
+
         def terminal_test(game):
             """A state is terminal if it is won or
             there are no more legal moves
@@ -256,7 +1271,7 @@ class MinimaxPlayer(IsolationPlayer):
                 raise SearchTimeout()
             
             return game.is_winner(game.active_player) or \
-                    not game.get_legal_moves()
+                    not game.has_legal_move()
         
         def min_value(game, depth):
             """ Return the value for a win if the game is over or reach the
@@ -267,12 +1282,17 @@ class MinimaxPlayer(IsolationPlayer):
                 raise SearchTimeout()
     
             if terminal_test(game) or depth == 1:
+                stats.evals += 1
                 return self.score(game, self)
     
+            stats.nodes += 1
             score = float("inf")
             for move in game.get_legal_moves():
-               score = min(score, max_value(game.forecast_move(move),\
-                                            depth - 1))
+                child = self._successor(game, move)
+                try:
+                    score = min(score, max_value(child, depth - 1))
+                finally:
+                    self._restore(game)
             return score
 
         def max_value(game, depth):
@@ -284,12 +1304,17 @@ class MinimaxPlayer(IsolationPlayer):
                 raise SearchTimeout()
     
             if terminal_test(game) or depth == 1:
+                stats.evals += 1
                 return self.score(game, self)
     
+            stats.nodes += 1
             score = float("-inf")
             for move in game.get_legal_moves():
-                score = max(score, min_value(game.forecast_move(move),\
-                                             depth - 1))
+                child = self._successor(game, move)
+                try:
+                    score = max(score, min_value(child, depth - 1))
+                finally:
+                    self._restore(game)
             return score  
         
         # Body of minimax
@@ -298,9 +1323,14 @@ class MinimaxPlayer(IsolationPlayer):
         
         best_score = float("-inf")
         best_move = (-1, -1)
+        stats.nodes += 1
         
         for move in game.get_legal_moves():
-            score = min_value(game.forecast_move(move), depth)
+            child = self._successor(game, move)
+            try:
+                score = min_value(child, depth)
+            finally:
+                self._restore(game)
             if score > best_score:
                 best_score = score
                 best_move = move
@@ -312,8 +1342,131 @@ class AlphaBetaPlayer(IsolationPlayer):
     """Game-playing agent that chooses a move using iterative deepening minimax
     search with alpha-beta pruning. You must finish and test this player to
     make sure it returns a good move before the search time limit expires.
+
+    Parameters
+    ----------
+    tt_size : int (optional)
+        The number of slots in the transposition table shared by every search
+        of this player. The table is disabled if tt_size is 0.
+
+    tt_policy : str (optional)
+        The replacement policy of the transposition table; either "depth"
+        (depth-preferred) or "always" (always-replace).
+
+    ordering : `MoveOrdering` (optional)
+        The move ordering used by the search. If None, moves are searched in
+        the order returned by `Board.get_legal_moves()`.
+
+    search_mode : str (optional)
+        Either "alphabeta" for plain alpha-beta search, or "pvs" for
+        principal variation search (NegaScout), which searches every move
+        after the first at each node with a null window and only re-searches
+        it with the full window if it turns out to be better.
+
+    aspiration_window : float (optional)
+        If set, each iteration of iterative deepening after the first starts
+        with the window (score - aspiration_window, score + aspiration_window)
+        centred on the score of the previous iteration, widening the window
+        on a fail-high or fail-low until the score falls inside it.
+
+    book : `opening_book.OpeningBook` (optional)
+        If set, positions found in the opening book are played from the book
+        without searching.
+
+    endgame : bool (optional)
+        If True, once the players can no longer reach a common cell the move
+        is chosen by an exact `EndgameSolver` instead of the heuristic search.
+
+    smp_workers : int (optional)
+        The number of helper processes that search the same position as
+        this player in parallel (Lazy SMP). The helpers only share their
+        results through the transposition table, which is then kept in
+        shared memory; the move is always chosen by this process, so a
+        helper can never delay it past the time limit.
+
+    time_manager : `TimeManager` (optional)
+        If set, decides when iterative deepening stops (see `TimeManager`),
+        and the search only checks the timer once every
+        `time_manager.check_interval` nodes. Otherwise the search deepens
+        until the timer expires, checking it at every node.
+
+    ponder : bool (optional)
+        If True, start_pondering() searches every reply of the opponent on
+        helper processes while the opponent thinks (at least one helper is
+        started), and the results are kept in the shared transposition table
+        for this player's next search.
+
+    canonical_tt : bool (optional)
+        If True, positions are stored in the transposition table under their
+        `Board.canonical_hash()`, so that positions that are rotations or
+        reflections of each other share an entry, and the stored moves are
+        mapped between orientations. This is only sound if the heuristic
+        gives the same score to symmetric positions: `custom_score` and the
+        mobility heuristics of `sample_players.py` do, but `center_score`,
+        `custom_score_2` and `custom_score_3` (which measure distances to the
+        centre cell at (width / 2, height / 2)) do not.
+
+    batch_eval : bool (optional)
+        If True, the nodes one ply above the search horizon score all of
+        their children in a single call to a `BatchEvaluator` instead of
+        searching them one at a time. Every child is evaluated (there are no
+        cutoffs within the last ply), but without creating a board for each
+        child. Requires NumPy and a heuristic supported by `BatchEvaluator`.
+
+    prune_symmetric : bool (optional)
+        If True, the root of every search only tries one of the moves that
+        lead to symmetric positions (see `Board.unique_moves()`), which
+        divides the moves searched for the first moves of a game by up to 8
+        on a square board, where they are most numerous. Like
+        `canonical_tt`, this is only sound for heuristics that give the
+        same score to symmetric positions.
+
+    See `IsolationPlayer` for the remaining parameters.
+
+    See `IsolationPlayer` for the `stats` and `search_log` attributes.
     """
 
+    SEARCH_MODES = ("alphabeta", "pvs")
+
+    # Width of the null window used by principal variation search; scores
+    # are floats, so a null window is a very narrow window rather than an
+    # empty one
+    NULL_WINDOW = 1e-6
+
+    def __init__(self, search_depth=3, score_fn=custom_score, timeout=30.,
+                 in_place=False, tt_size=0, tt_policy="depth", ordering=None,
+                 search_mode="alphabeta", aspiration_window=None, book=None,
+                 endgame=True, smp_workers=0, ponder=False, time_manager=None,
+                 canonical_tt=False, batch_eval=False, prune_symmetric=False):
+        super().__init__(search_depth, score_fn, timeout, in_place)
+        if search_mode not in AlphaBetaPlayer.SEARCH_MODES:
+            raise ValueError("Unknown search mode: {}".format(search_mode))
+        self.tt = None
+        if smp_workers or ponder:
+            self.tt = SharedTranspositionTable(tt_size or 2**16, tt_policy)
+        elif tt_size:
+            self.tt = TranspositionTable(tt_size, tt_policy)
+        self.ordering = ordering
+        self.search_mode = search_mode
+        self.aspiration_window = aspiration_window
+        self.book = book
+        self.endgame = EndgameSolver() if endgame else None
+        self.smp_workers = smp_workers
+        self.ponder = ponder
+        self.time_manager = time_manager
+        self.canonical_tt = canonical_tt
+        self.batch = BatchEvaluator(score_fn) if batch_eval else None
+        self.prune_symmetric = prune_symmetric
+        self._prev_best = None
+        self._helpers = None
+
+    def __getstate__(self):
+        # Helper processes belong to the original player; copies start their
+        # own on the first call to get_move()
+        state = self.__dict__.copy()
+        state["_helpers"] = None
+        return state
+
     def get_move(self, game, time_left):
         """Search for the best move from the available legal moves and return a
         result before the time limit expires.
@@ -345,28 +1498,82 @@ class AlphaBetaPlayer(IsolationPlayer):
             (-1, -1) if there are no available legal moves.
         """
         self.time_left = time_left
+        self.stats = SearchStats()
+        self._prev_best = None
+        start = time.perf_counter()
+        if self.book is not None:
+            move = self.book.lookup(game)
+            if move is not None:
+                self._log_move(game, move, "book", start)
+                return move
+        if self.endgame is not None:
+            move = self.endgame.get_move(game, time_left,
+                                         self.TIMER_THRESHOLD)
+            if move is not None:
+                self._log_move(game, move, "endgame", start)
+                return move
+        if self.tt is not None:
+            self.tt.new_search()
+        if self.ordering is not None:
+            self.ordering.new_search()
+        
+        if self.smp_workers:
+            self._start_helpers().start_search(game, time_left)
         
         # Initialize the best move so that this function returns something
         # in case the search fails due to timeout
         best_move = (-1, -1)
 
+        time_manager = self.time_manager
         try:
             # The try/except block will automatically catch the exception
             # raised when the timer is about to expire.
             depth = 1
+            score = None
+            if time_manager is not None:
+                time_manager.start(game, time_left, self.TIMER_THRESHOLD)
             
             # Iterative deepening search implementation
             while True:
-                move = self.alphabeta(game, depth)
+                nodes, iteration_start = self.stats.nodes, time.perf_counter()
+                move, score = self._aspiration_search(game, depth, score)
                 best_move = move
+                self._prev_best = move
+                self.stats.record_iteration(
+                    depth, self.stats.nodes - nodes,
+                    time.perf_counter() - iteration_start)
+                if (time_manager is not None and
+                        not time_manager.should_continue(depth, move)):
+                    break
                 depth += 1
                 
         except SearchTimeout:
             pass # Handle any actions required after timeout as needed
+        finally:
+            if self._helpers is not None:
+                self._helpers.stop_search()
 
         # Return the best move from the last completed search iteration		
+        self._log_move(game, best_move, "search", start)
         return best_move
 
+    def start_pondering(self, game):
+        """Search the opponent's replies on the helper processes until
+        stop_pondering() is called, if pondering is enabled.
+        """
+        if self.ponder and game.has_legal_move():
+            self._start_helpers().start_pondering(game)
+
+    def stop_pondering(self):
+        """Stop the helper processes started by start_pondering()."""
+        if self._helpers is not None:
+            self._helpers.stop_search()
+
+    def _start_helpers(self):
+        if self._helpers is None:
+            self._helpers = LazySMPHelpers(self, max(self.smp_workers, 1))
+        return self._helpers
+
     def alphabeta(self, game, depth, alpha=float("-inf"), beta=float("inf")):
         """Implement depth-limited minimax search with alpha-beta pruning as
         described in the lectures.
@@ -412,38 +1619,216 @@ class AlphaBetaPlayer(IsolationPlayer):
                 each helper function or else your agent will timeout during
                 testing.
         """
-        if self.time_left() < self.TIMER_THRESHOLD:
+        move, _ = self._search_root(game, depth, alpha, beta)
+        return move
+
+    def _aspiration_search(self, game, depth, guess):
+        """Search the game to a fixed depth with an aspiration window centred
+        on the score `guess` from the previous iteration, and return the best
+        move and its score. The window is widened and the search repeated
+        until the score falls inside the window.
+        """
+        inf = float("inf")
+        delta = self.aspiration_window
+        if delta is None or guess is None or abs(guess) == inf:
+            return self._search_root(game, depth, -inf, inf)
+
+        alpha, beta = guess - delta, guess + delta
+        while True:
+            move, score = self._search_root(game, depth, alpha, beta)
+            if score <= alpha and alpha > -inf:
+                alpha = score - delta
+            elif score >= beta and beta < inf:
+                beta = score + delta
+            else:
+                return move, score
+            delta *= 2
+            self.stats.researches += 1
+
+    def _search_root(self, game, depth, alpha, beta):
+        """Search the game to a fixed depth with the window (alpha, beta) and
+        return the best move and its score. The score is a bound (fail-soft)
+        if it falls outside the window.
+        """
+        time_left = self.time_left
+        threshold = self.TIMER_THRESHOLD
+        if time_left() < threshold:
             raise SearchTimeout()
 
+        interval = 1
+        if self.time_manager is not None:
+            interval = self.time_manager.check_interval
+        countdown = interval
+
+        def check_time():
+            """Raise SearchTimeout if the timer is about to expire, calling
+            time_left() only once every `interval` calls.
+            """
+            nonlocal countdown
+            countdown -= 1
+            if countdown <= 0:
+                countdown = interval
+                if time_left() < threshold:
+                    raise SearchTimeout()
+
         def terminal_test(game):
             """A state is terminal if it is won or
             there are no more legal moves
             """
-            if self.time_left() < self.TIMER_THRESHOLD:
-                raise SearchTimeout()
+            check_time()
             
             return game.is_winner(game.active_player) or \
-                    not game.get_legal_moves()
+                    not game.has_legal_move()
         
+        tt = self.tt
+        salt = self._tt_salt(game)
+        ordering = self.ordering
+        stats = self.stats
+        root_depth = depth
+        pvs = self.search_mode == "pvs"
+        null_window = AlphaBetaPlayer.NULL_WINDOW
+        inf = float("inf")
+        canonical = self.canonical_tt
+        batch = self.batch
+
+        def tt_key(game):
+            """ Return the transposition table key of a position and the
+            symmetry that maps it to the orientation of the stored moves,
+            which is None unless the table is keyed by canonical hashes.
+            """
+            if canonical:
+                key, sym = game.canonical_hash()
+                return key ^ salt, sym
+            return game.hash() ^ salt, None
+
+        def tt_probe(game, key, sym, depth, alpha, beta):
+            """ Return the stored score if the transposition table entry for
+            the key settles the node, otherwise return None together with
+            the search window narrowed by any stored bound. The best move
+            stored for the key is returned in both cases.
+            """
+            entry = tt.probe(key)
+            if entry is None:
+                return None, alpha, beta, None
+            move = entry.move
+            if sym is not None and move is not None:
+                move = game.from_canonical(move, sym)
+            if entry.depth < depth - 1:
+                return None, alpha, beta, move
+            if entry.flag == TranspositionTable.EXACT:
+                return entry.score, alpha, beta, move
+            if entry.flag == TranspositionTable.LOWER:
+                alpha = max(alpha, entry.score)
+            else:
+                beta = min(beta, entry.score)
+            if alpha >= beta:
+                return entry.score, alpha, beta, move
+            return None, alpha, beta, move
+
+        def legal_moves(game, depth, hash_move):
+            """ Return the legal moves at a node in search order. """
+            moves = game.get_legal_moves()
+            if ordering is not None:
+                moves = ordering.order(game, moves, root_depth - depth + 1,
+                                       hash_move)
+            return moves
+
+        def cutoff(game, move, index, depth):
+            """ Record a cutoff caused by the move at position index. """
+            stats.record_cutoff(index)
+            if ordering is not None:
+                ordering.record_cutoff(game, move, root_depth - depth + 1,
+                                       depth - 1)
+
+        def batch_value(game, depth, alpha, beta, hash_move, maximizing):
+            """ Return the value and best move of a node one ply above the
+            search horizon, scoring every child in one batch. Cutoffs are
+            recorded for the first move that reaches the window, as in the
+            sequential search.
+            """
+            moves = legal_moves(game, depth, hash_move)
+            values = batch.score_moves(game, moves, self)
+            stats.evals += len(values)
+            best = max if maximizing else min
+            score = best(values)
+            best_move = moves[values.index(score)]
+            for i, value in enumerate(values):
+                if value >= beta if maximizing else value <= alpha:
+                    cutoff(game, moves[i], i, depth)
+                    break
+            return score, best_move
+
+        def tt_store(game, key, sym, depth, score, alpha, beta, move):
+            """ Store the result of a node searched with window (alpha, beta)
+            in the transposition table. When no move reached the window for
+            the player at the node, the caller passes the previous hash
+            move instead of an arbitrary best move.
+            """
+            if sym is not None and move is not None:
+                move = game.to_canonical(move, sym)
+            if score <= alpha:
+                flag = TranspositionTable.UPPER
+            elif score >= beta:
+                flag = TranspositionTable.LOWER
+            else:
+                flag = TranspositionTable.EXACT
+            tt.store(key, depth - 1, score, flag, move)
+
         def min_value(game, depth, alpha, beta):
             """ Return the value for a win if the game is over or reach the
             search depth, otherwise return the minimum value over all 
             legal child nodes.
             """            
-            if self.time_left() < self.TIMER_THRESHOLD:
-                raise SearchTimeout()
+            check_time()
     
             if terminal_test(game) or depth == 1:
+                stats.evals += 1
                 return self.score(game, self)
+
+            hash_move = None
+            if tt is not None:
+                key, sym = tt_key(game)
+                score, alpha, beta, hash_move = tt_probe(game, key, sym, depth,
+                                                         alpha, beta)
+                if score is not None:
+                    return score
+                alpha_0, beta_0 = alpha, beta
     
+            stats.nodes += 1
             score = float("inf")
-            for move in game.get_legal_moves():
-               score = min(score, max_value(game.forecast_move(move),\
-                                            depth - 1, alpha, beta))
+            best_move = None
+            if batch is not None and depth == 2:
+                score, best_move = batch_value(game, depth, alpha, beta,
+                                               hash_move, False)
+                moves = ()
+            else:
+                moves = legal_moves(game, depth, hash_move)
+            for i, move in enumerate(moves):
+               child = self._successor(game, move)
+               try:
+                   if pvs and i > 0 and beta < inf:
+                       value = max_value(child, depth - 1, beta - null_window,
+                                         beta)
+                       if alpha < value < beta:
+                           stats.researches += 1
+                           value = max_value(child, depth - 1, alpha, beta)
+                   else:
+                       value = max_value(child, depth - 1, alpha, beta)
+               finally:
+                   self._restore(game)
+               if value < score:
+                   score, best_move = value, move
                if score <= alpha:
-                   return score
+                   cutoff(game, move, i, depth)
+                   break
                
                beta = min(beta, score)
+
+            if tt is not None:
+                if score >= beta_0:
+                    best_move = hash_move
+                tt_store(game, key, sym, depth, score, alpha_0, beta_0,
+                         best_move)
                
             return score
 
@@ -453,34 +1838,257 @@ class AlphaBetaPlayer(IsolationPlayer):
             search depth, otherwise return the maximum value over all 
             legal child nodes.
             """                  
-            if self.time_left() < self.TIMER_THRESHOLD:
-                raise SearchTimeout()
+            check_time()
     
             if terminal_test(game) or depth == 1:
+                stats.evals += 1
                 return self.score(game, self)
+
+            hash_move = None
+            if tt is not None:
+                key, sym = tt_key(game)
+                score, alpha, beta, hash_move = tt_probe(game, key, sym, depth,
+                                                         alpha, beta)
+                if score is not None:
+                    return score
+                alpha_0, beta_0 = alpha, beta
     
+            stats.nodes += 1
             score = float("-inf")
-            for move in game.get_legal_moves():
-                score = max(score, min_value(game.forecast_move(move),\
-                                             depth - 1, alpha, beta))
+            best_move = None
+            if batch is not None and depth == 2:
+                score, best_move = batch_value(game, depth, alpha, beta,
+                                               hash_move, True)
+                moves = ()
+            else:
+                moves = legal_moves(game, depth, hash_move)
+            for i, move in enumerate(moves):
+                child = self._successor(game, move)
+                try:
+                    if pvs and i > 0 and alpha > -inf:
+                        value = min_value(child, depth - 1, alpha,
+                                          alpha + null_window)
+                        if alpha < value < beta:
+                            stats.researches += 1
+                            value = min_value(child, depth - 1, alpha, beta)
+                    else:
+                        value = min_value(child, depth - 1, alpha, beta)
+                finally:
+                    self._restore(game)
+                if value > score:
+                    score, best_move = value, move
                 if score >= beta:
-                    return score
+                    cutoff(game, move, i, depth)
+                    break
                 
                 alpha = max(alpha, score)
+
+            if tt is not None:
+                if score <= alpha_0:
+                    best_move = hash_move
+                tt_store(game, key, sym, depth, score, alpha_0, beta_0,
+                         best_move)
                 
             return score
 
         # Body of Alphabeta
         best_score = float("-inf")
-        beta = float("inf")
         best_move = None
+
+        hash_move = self._prev_best
+        if tt is not None:
+            key, sym = tt_key(game)
+            entry_move = tt_probe(game, key, sym, depth + 1, alpha, beta)[3]
+            if entry_move is not None:
+                hash_move = entry_move
+        stats.nodes += 1
         
-        for move in game.get_legal_moves():
-            score = min_value(game.forecast_move(move), depth,\
-                              best_score, beta)
-            if score > best_score:
+        root_moves = legal_moves(game, depth + 1, hash_move)
+        if self.prune_symmetric:
+            root_moves = game.unique_moves(root_moves)
+        for move in root_moves:
+            lower = max(alpha, best_score)
+            child = self._successor(game, move)
+            try:
+                if pvs and best_move is not None and lower > -inf:
+                    score = min_value(child, depth, lower, lower + null_window)
+                    if lower < score < beta:
+                        stats.researches += 1
+                        score = min_value(child, depth, lower, beta)
+                else:
+                    score = min_value(child, depth, lower, beta)
+            finally:
+                self._restore(game)
+            # Always keep a legal move, even if every move loses
+            if score > best_score or best_move is None:
                 best_score = score
                 best_move = move
+            if best_score >= beta:
+                break
+
+        if tt is not None and best_move is not None:
+            tt_store(game, key, sym, depth + 1, best_score, alpha, beta,
+                     best_move)
         
-        return best_move     
+        return best_move, best_score
 
+    def _tt_salt(self, game):
+        """Return a key that is XORed into every position hash stored in the
+        transposition table.
+
+        Scores are always computed from the point of view of this player, so
+        the same position must be cached separately depending on whether
+        this player moved first or second in the game.
+        """
+        active_is_first = game.move_count % 2 == 0
+        if active_is_first == (game.active_player == self):
+            return 0
+        return 0x9e3779b97f4a7c15     
+
+
+#%%
+class LazySMPHelpers:
+    """Pool of helper processes for the Lazy SMP search of an
+    `AlphaBetaPlayer`.
+
+    Each helper runs its own iterative deepening search of the root position
+    and stores its results in the player's `SharedTranspositionTable`, which
+    the main search reads for move ordering and cutoffs. Helpers start at
+    staggered depths so that they tend to fill in the table ahead of the
+    main search. They return nothing: a search job ends when the turn's
+    deadline passes or when stop_search() is called, whichever is first.
+
+    Parameters
+    ----------
+    player : `AlphaBetaPlayer`
+        The player whose search is shared. Its transposition table must be a
+        `SharedTranspositionTable`.
+
+    num_workers : int
+        The number of helper processes.
+    """
+
+    def __init__(self, player, num_workers):
+        template = AlphaBetaPlayer(
+            player.search_depth, player.score, player.TIMER_THRESHOLD,
+            player.in_place, ordering=copy.deepcopy(player.ordering),
+            search_mode=player.search_mode,
+            aspiration_window=player.aspiration_window, endgame=False)
+        # The player holds its helpers, so a weak reference back lets both be
+        # collected together
+        self._player = weakref.ref(player)
+        self._job = multiprocessing.Value("i", 0, lock=False)
+        self._queues = []
+        self._workers = []
+        for idx in range(num_workers):
+            jobs = multiprocessing.SimpleQueue()
+            worker = multiprocessing.Process(
+                target=_lazy_smp_worker, daemon=True,
+                args=(template, player.tt.name, player.tt.size,
+                      player.tt.policy, 2 + idx % 2, jobs, self._job))
+            worker.start()
+            self._queues.append(jobs)
+            self._workers.append(worker)
+        self._finalizer = weakref.finalize(self, _stop_workers, self._queues,
+                                           self._workers, os.getpid())
+
+    def start_search(self, game, time_left):
+        """Start every helper on the game position of the player to move,
+        searching until `time_left()` reaches the player's timer threshold.
+        """
+        deadline = time.monotonic() + time_left() / 1000.
+        self._post(game, self._player().tt.generation, deadline, False)
+
+    def start_pondering(self, game):
+        """Start every helper searching the positions after each reply of the
+        opponent (who is to move in the game) until stop_search() is called.
+
+        The results are stored under the generation of the player's next
+        search, so they are not replaced by shallower results of that search.
+        """
+        self._post(game, self._player().tt.generation + 1, float("inf"),
+                   True)
+
+    def stop_search(self):
+        """Signal every helper to abandon the current job."""
+        self._job.value += 1
+
+    def close(self):
+        """Shut down the helper processes."""
+        self._finalizer()
+
+    def _post(self, game, generation, deadline, ponder):
+        player = self._player()
+        state = game.copy()
+        _replace_player(state, game.get_opponent(player), "opponent")
+        _replace_player(state, player, "self")
+        self._job.value += 1
+        for jobs in self._queues:
+            jobs.put((self._job.value, state, generation, deadline, ponder))
+
+
+def _replace_player(game, old, new):
+    for attr in ("_player_1", "_player_2", "_active_player",
+                 "_inactive_player"):
+        if getattr(game, attr) == old:
+            setattr(game, attr, new)
+
+
+def _stop_workers(queues, workers, owner_pid):
+    # Only the process that started the helpers can stop them
+    if owner_pid != os.getpid():
+        return
+    for jobs in queues:
+        jobs.put(None)
+    for worker in workers:
+        worker.join(timeout=1.)
+        if worker.is_alive():
+            worker.terminate()
+
+
+def _lazy_smp_worker(player, tt_name, tt_size, tt_policy, start_depth, jobs,
+                     current_job):
+    """Main loop of a Lazy SMP helper process."""
+    player.tt = SharedTranspositionTable(tt_size, tt_policy, name=tt_name)
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, game, generation, deadline, ponder = job
+        if current_job.value != job_id:
+            continue
+        _replace_player(game, "self", player)
+        player.tt.generation = generation
+        player.stats = SearchStats()
+        player._prev_best = None
+        if player.ordering is not None:
+            player.ordering.new_search()
+
+        def time_left():
+            if current_job.value != job_id:
+                return float("-inf")
+            return (deadline - time.monotonic()) * 1000.
+        player.time_left = time_left
+
+        try:
+            if ponder:
+                # Search every reply of the opponent one depth at a time
+                replies = [game.forecast_move(m) for m in game.get_legal_moves()]
+                depth = 1
+                while replies:
+                    for reply in replies:
+                        player._prev_best = None
+                        player._search_root(reply, depth, float("-inf"),
+                                            float("inf"))
+                    depth += 1
+            else:
+                depth = start_depth
+                while True:
+                    move, _ = player._search_root(game, depth, float("-inf"),
+                                                  float("inf"))
+                    if move is None:
+                        break
+                    player._prev_best = move
+                    depth += 1
+        except SearchTimeout:
+            pass
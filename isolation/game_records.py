@@ -0,0 +1,262 @@
+"""Store isolation games in a compact binary format, and replay them in bulk
+to compute statistics.
+
+A record file starts with the 8 byte header `MAGIC`, followed by any number
+of game records appended one after the other. Each record is
+
+- a fixed header (`RECORD_HEADER`): board width and height, termination
+  reason (an index into `TERMINATIONS`), the game's random seed, the number
+  of moves, and the lengths of the two agent names
+- the names of the first and second player (UTF-8)
+- one byte per move (the cell index row + col * height of the move), or two
+  bytes per move (little-endian) on boards with more than 256 cells
+
+The loser of a game is always the player to move after the last recorded
+move, so the winner is not stored. Records are self-delimiting, so games
+can be appended while a tournament is running, and files can be
+concatenated (after dropping the header of every file but the first).
+
+Example: record the games of a tournament, then summarize them
+
+    python tournament.py --record games.bin
+    python game_records.py games.bin --openings 2
+
+The reader memory-maps the file, so files much larger than the available
+memory can be scanned.
+"""
+import argparse
+import mmap
+import struct
+
+from collections import namedtuple
+
+MAGIC = b"ISOGAME1"
+
+RECORD_HEADER = struct.Struct("<BBBIHBB")
+
+TERMINATIONS = ("illegal move", "timeout", "forfeit")
+
+
+class GameRecord(namedtuple("GameRecord", ["width", "height", "players",
+                                           "seed", "termination", "cells"])):
+    """A recorded game. `players` is the pair of agent names (first player
+    first), and `cells` is the sequence of the cell indices of the moves,
+    including any opening moves applied before the game was played.
+    """
+    __slots__ = ()
+
+    @property
+    def winner(self):
+        """The index of the winner: 0 for the first player, 1 for the
+        second player.
+        """
+        return 1 - len(self.cells) % 2
+
+    def moves(self):
+        """Return the list of moves as (row, column) pairs."""
+        height = self.height
+        return [(idx % height, idx // height) for idx in self.cells]
+
+    def replay(self, player_1="Player1", player_2="Player2"):
+        """Return the board after applying every move of the game; raises
+        ValueError if a move is not legal.
+        """
+        from isolation import Board
+        game = Board(player_1, player_2, self.width, self.height)
+        for move in self.moves():
+            if not game.move_is_legal(move):
+                raise ValueError("Illegal move {} after {} moves".format(
+                    move, game.move_count))
+            game.apply_move(move)
+        return game
+
+
+class GameRecordWriter:
+    """Append game records to a file, writing the file header first if the
+    file is new or empty. Every record is flushed as soon as it is written,
+    so a reader sees complete games while a tournament is still running.
+
+    Parameters
+    ----------
+    path : str
+        The record file.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+            self._file.flush()
+
+    def write(self, width, height, players, moves, termination, seed=0):
+        """Append a game, given the board size, the names of the first and
+        second player, the list of moves (row, column) and the termination
+        reason returned by `Board.play()`.
+        """
+        names = [name.encode("utf-8")[:255] for name in players]
+        cell_format = "<B" if width * height <= 256 else "<H"
+        cells = b"".join(struct.pack(cell_format, r + c * height)
+                         for r, c in moves)
+        self._file.write(RECORD_HEADER.pack(
+            width, height, TERMINATIONS.index(termination), seed, len(moves),
+            len(names[0]), len(names[1])))
+        self._file.write(names[0] + names[1] + cells)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GameRecordReader:
+    """Read the games of a record file through a memory map. Iterating over
+    the reader yields `GameRecord`s in file order; the file is scanned
+    lazily, so a loop over the games never holds more than one of them.
+
+    Parameters
+    ----------
+    path : str
+        The record file.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("{} is not a game record file".format(path))
+            f.seek(0, 2)
+            self._size = f.tell()
+            self._map = None
+            if self._size > len(MAGIC):
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __iter__(self):
+        data = self._map
+        if data is None:
+            return
+        offset = len(MAGIC)
+        header = RECORD_HEADER
+        names = {}
+        while offset + header.size <= self._size:
+            (width, height, termination, seed, num_moves, len_1,
+             len_2) = header.unpack_from(data, offset)
+            offset += header.size
+            # agent names repeat across games, so decode each pair once
+            raw = data[offset:offset + len_1 + len_2]
+            players = names.get(raw)
+            if players is None:
+                players = names[raw] = (raw[:len_1].decode("utf-8"),
+                                        raw[len_1:].decode("utf-8"))
+            offset += len_1 + len_2
+            wide = width * height > 256
+            end = offset + (2 if wide else 1) * num_moves
+            if end > self._size:
+                raise ValueError("Truncated game record at byte {}".format(
+                    offset))
+            if wide:
+                cells = struct.unpack_from("<{}H".format(num_moves), data,
+                                           offset)
+            else:
+                cells = tuple(data[offset:end])
+            yield GameRecord(width, height, players, seed,
+                             TERMINATIONS[termination], cells)
+            offset = end
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def summarize(records):
+    """Return a dictionary of statistics over the games: the number of
+    games, the average game length in moves, the fraction of games won by
+    the first player, the number of games per termination reason, and the
+    number of games and wins of each agent.
+    """
+    games = moves = first_wins = 0
+    terminations = dict.fromkeys(TERMINATIONS, 0)
+    agents = {}
+    for record in records:
+        games += 1
+        moves += len(record.cells)
+        winner = record.winner
+        first_wins += winner == 0
+        terminations[record.termination] += 1
+        for idx, name in enumerate(record.players):
+            counts = agents.setdefault(name, [0, 0])
+            counts[0] += 1
+            counts[1] += winner == idx
+    return {"games": games,
+            "average_length": moves / games if games else 0.,
+            "first_player_win_rate": first_wins / games if games else 0.,
+            "terminations": terminations,
+            "agents": {name: {"games": counts[0], "wins": counts[1]}
+                       for name, counts in agents.items()}}
+
+
+def win_rate_by_opening(records, plies=2):
+    """Return a dictionary mapping each opening (the tuple of the cell
+    indices of the first `plies` moves) to a pair (games, first player
+    wins).
+    """
+    openings = {}
+    for record in records:
+        if len(record.cells) < plies:
+            continue
+        counts = openings.setdefault(record.cells[:plies], [0, 0])
+        counts[0] += 1
+        counts[1] += record.winner == 0
+    return {opening: tuple(counts) for opening, counts in openings.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("paths", nargs="+", metavar="PATH",
+                        help="game record files")
+    parser.add_argument("--openings", type=int, default=0, metavar="PLIES",
+                        help="also print the first player win rate of each "
+                             "opening of this many moves")
+    parser.add_argument("--top", type=int, default=20,
+                        help="number of openings to print (most played first)")
+    args = parser.parse_args()
+
+    def records():
+        for path in args.paths:
+            with GameRecordReader(path) as reader:
+                for record in reader:
+                    yield record
+
+    summary = summarize(records())
+    print("Games: {}".format(summary["games"]))
+    print("Average length: {:.1f} moves".format(summary["average_length"]))
+    print("First player win rate: {:.1%}".format(
+        summary["first_player_win_rate"]))
+    for termination, count in sorted(summary["terminations"].items()):
+        print("{:>14}: {}".format(termination, count))
+    print("\n{:^13}{:>8}{:>9}".format("Agent", "Games", "Win Rate"))
+    for name, counts in sorted(summary["agents"].items()):
+        print("{:^13}{:>8}{:>9.1%}".format(
+            name, counts["games"], counts["wins"] / counts["games"]))
+
+    if args.openings:
+        openings = win_rate_by_opening(records(), args.openings)
+        print("\n{:<28}{:>8}{:>9}".format("Opening", "Games", "1st Wins"))
+        for opening, (games, wins) in sorted(
+                openings.items(), key=lambda item: -item[1][0])[:args.top]:
+            print("{:<28}{:>8}{:>9.1%}".format(
+                " ".join(str(idx) for idx in opening), games, wins / games))
+
+
+if __name__ == "__main__":
+    main()
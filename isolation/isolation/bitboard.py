@@ -0,0 +1,377 @@
+"""
+This file contains the `BitBoard` class, a drop-in replacement for the
+`Board` class that packs the game state into Python integers instead of a
+list. The set of blocked cells is a single bitmask (bit `r + c * height`
+is set once cell (r, c) has been occupied) and each player location is a
+cell index, so copying a board only copies a handful of integers.
+
+Knight moves are looked up in a table of bitmasks that is computed once for
+each board size and shared by every `BitBoard` of that size.
+"""
+import random
+
+from .isolation import Board, board_cells, knight_neighbours, zobrist_keys
+
+# Tables of knight-move bitmasks, keyed by board size
+_KNIGHT_MASKS = {}
+
+
+def knight_masks(width, height):
+    """Return a tuple mapping each cell index to a bitmask of the cells that
+    a knight can reach from that cell on an empty board of the given size.
+
+    The table is built on the first call for each board size and cached for
+    the lifetime of the process.
+    """
+    size = (width, height)
+    if size not in _KNIGHT_MASKS:
+        _KNIGHT_MASKS[size] = tuple(
+            sum(1 << i for i in neighbours)
+            for neighbours in knight_neighbours(width, height))
+    return _KNIGHT_MASKS[size]
+
+
+class BitBoard(Board):
+    """Implement the same model of Isolation as `isolation.Board` using
+    integer bitmasks for the board state.
+
+    `BitBoard` supports the full public interface of `Board`, so it can be
+    used anywhere a `Board` is expected (e.g., `Board.play()` and the agents
+    in `game_agent.py`).
+
+    Parameters
+    ----------
+    player_1 : object
+        An object with a get_move() function. This is the only function
+        directly called by the Board class for each player.
+
+    player_2 : object
+        An object with a get_move() function. This is the only function
+        directly called by the Board class for each player.
+
+    width : int (optional)
+        The number of columns that the board should have.
+
+    height : int (optional)
+        The number of rows that the board should have.
+    """
+
+    def __init__(self, player_1, player_2, width=7, height=7):
+        self.width = width
+        self.height = height
+        self.move_count = 0
+        self._player_1 = player_1
+        self._player_2 = player_2
+        self._active_player = player_1
+        self._inactive_player = player_2
+
+        self._masks = knight_masks(width, height)
+        self._cells = board_cells(width, height)
+        self._full = (1 << (width * height)) - 1
+        self._occupied = 0
+        self._p1_loc = Board.NOT_MOVED
+        self._p2_loc = Board.NOT_MOVED
+        self._zobrist = zobrist_keys(width, height)
+        self._hash = 0
+        self._sym_hashes = None
+        self._mobility = {}
+        self._undo_stack = []
+
+    def __getstate__(self):
+        # the lookup tables are rebuilt from the module caches when unpickled
+        state = self.__dict__.copy()
+        del state["_masks"], state["_cells"], state["_zobrist"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._masks = knight_masks(self.width, self.height)
+        self._cells = board_cells(self.width, self.height)
+        self._zobrist = zobrist_keys(self.width, self.height)
+
+    @classmethod
+    def from_board(cls, board):
+        """Return a `BitBoard` encoding the same game state as the input
+        `isolation.Board` instance.
+        """
+        new_board = cls(board._player_1, board._player_2,
+                        width=board.width, height=board.height)
+        new_board.move_count = board.move_count
+        new_board._active_player = board._active_player
+        new_board._inactive_player = board._inactive_player
+        new_board._hash = board._hash
+        new_board._sym_hashes = board._sym_hashes
+        if isinstance(board, BitBoard):
+            new_board._occupied = board._occupied
+            new_board._p1_loc = board._p1_loc
+            new_board._p2_loc = board._p2_loc
+            return new_board
+        state = board._board_state
+        for idx in range(board.width * board.height):
+            if state[idx] != Board.BLANK:
+                new_board._occupied |= 1 << idx
+        new_board._p1_loc = state[-1]
+        new_board._p2_loc = state[-2]
+        return new_board
+
+    def hash(self):
+        return self._hash
+
+    def copy(self):
+        """ Return a deep copy of the current board. """
+        new_board = BitBoard.__new__(BitBoard)
+        new_board.__dict__.update(self.__dict__)
+        new_board._mobility = dict(self._mobility)
+        new_board._undo_stack = []
+        return new_board
+
+    def move_is_legal(self, move):
+        """Test whether a move is legal in the current game state.
+
+        Parameters
+        ----------
+        move : (int, int)
+            A coordinate pair (row, column) indicating the next position for
+            the active player on the board.
+
+        Returns
+        -------
+        bool
+            Returns True if the move is legal, False otherwise
+        """
+        return (0 <= move[0] < self.height and 0 <= move[1] < self.width and
+                not self._occupied >> (move[0] + move[1] * self.height) & 1)
+
+    def get_blank_spaces(self):
+        """Return a list of the locations that are still available on the board.
+        """
+        return self._to_moves(self._full & ~self._occupied)
+
+    def iter_blank_spaces(self):
+        """Generate the locations that are still available on the board,
+        in the same order as get_blank_spaces().
+        """
+        return self._iter_moves(self._full & ~self._occupied)
+
+    def count_blank(self):
+        """Return the number of locations that are still available on the
+        board.
+        """
+        return bin(self._full & ~self._occupied).count("1")
+
+    def get_player_location(self, player):
+        """Find the current location of the specified player on the board.
+
+        Parameters
+        ----------
+        player : object
+            An object registered as a player in the current game.
+
+        Returns
+        -------
+        (int, int) or None
+            The coordinate pair (row, column) of the input player, or None
+            if the player has not moved.
+        """
+        idx = self._get_location_idx(player)
+        if idx == Board.NOT_MOVED:
+            return Board.NOT_MOVED
+        return self._cells[idx]
+
+    def get_legal_moves(self, player=None):
+        """Return the list of all legal moves for the specified player.
+
+        Parameters
+        ----------
+        player : object (optional)
+            An object registered as a player in the current game. If None,
+            return the legal moves for the active player on the board.
+
+        Returns
+        -------
+        list<(int, int)>
+            The list of coordinate pairs (row, column) of all legal moves
+            for the player constrained by the current game state.
+        """
+        if player is None:
+            player = self._active_player
+        if self._get_location_idx(player) == Board.NOT_MOVED:
+            return self.get_blank_spaces()
+        valid_moves = self._to_moves(self._moves_mask(player))
+        random.shuffle(valid_moves)
+        return valid_moves
+
+    def iter_legal_moves(self, player=None):
+        """Generate the legal moves for the specified player in increasing
+        order of cell index. See `isolation.Board.iter_legal_moves()`.
+        """
+        if player is None:
+            player = self._active_player
+        return self._iter_moves(self._moves_mask(player))
+
+    def has_legal_move(self, player=None):
+        """Return True if the specified player (the active player if None)
+        has at least one legal move.
+        """
+        if player is None:
+            player = self._active_player
+        return self._moves_mask(player) != 0
+
+    def count_legal_moves(self, player=None):
+        """Return the number of legal moves of the specified player, counted
+        from the cells on every call like `isolation.Board.count_legal_moves()`.
+        """
+        if player is None:
+            player = self._active_player
+        return bin(self._moves_mask(player)).count("1")
+
+    def apply_move(self, move):
+        """Move the active player to a specified location.
+
+        Parameters
+        ----------
+        move : (int, int)
+            A coordinate pair (row, column) indicating the next position for
+            the active player on the board.
+        """
+        idx = move[0] + move[1] * self.height
+        blocked, p1_keys, p2_keys, initiative = self._zobrist
+        if self._active_player == self._player_2:
+            if self._sym_hashes is not None:
+                self._update_sym_hashes(idx, self._p2_loc, True)
+            if self._p2_loc != Board.NOT_MOVED:
+                self._hash ^= p2_keys[self._p2_loc]
+            self._hash ^= p2_keys[idx]
+            self._p2_loc = idx
+        else:
+            if self._sym_hashes is not None:
+                self._update_sym_hashes(idx, self._p1_loc, False)
+            if self._p1_loc != Board.NOT_MOVED:
+                self._hash ^= p1_keys[self._p1_loc]
+            self._hash ^= p1_keys[idx]
+            self._p1_loc = idx
+        self._hash ^= blocked[idx] ^ initiative
+        self._occupied |= 1 << idx
+        self._active_player, self._inactive_player = self._inactive_player, self._active_player
+        self.move_count += 1
+        self._mobility = {}
+
+    def push_move(self, move):
+        """Apply a move to the current game in-place and remember how to undo
+        it. See `isolation.Board.push_move()` for details.
+        """
+        self._undo_stack.append((self._occupied, self._p1_loc, self._p2_loc,
+                                 self._hash, self._sym_hashes, self._mobility))
+        self.apply_move(move)
+
+    def pop_move(self):
+        """Undo the last move applied with push_move(). """
+        (self._occupied, self._p1_loc, self._p2_loc, self._hash,
+         self._sym_hashes, self._mobility) = self._undo_stack.pop()
+        self._active_player, self._inactive_player = self._inactive_player, self._active_player
+        self.move_count -= 1
+
+    def mobility(self, player=None):
+        """Return the number of legal moves available to the specified player,
+        cached until the next move is applied. See `isolation.Board.mobility()`
+        for details.
+        """
+        if player is None:
+            player = self._active_player
+        key = int(player == self._player_2)
+        count = self._mobility.get(key)
+        if count is None:
+            count = bin(self._moves_mask(player)).count("1")
+            self._mobility[key] = count
+        return count
+
+    def is_winner(self, player):
+        """ Test whether the specified player has won the game. """
+        return (player == self._inactive_player and
+                not self.has_legal_move(self._active_player))
+
+    def is_loser(self, player):
+        """ Test whether the specified player has lost the game. """
+        return (player == self._active_player and
+                not self.has_legal_move(self._active_player))
+
+    def utility(self, player):
+        """Returns the utility of the current game state from the perspective
+        of the specified player (+inf for a win, -inf for a loss, and 0
+        otherwise). See `isolation.Board.utility()` for details.
+        """
+        if not self.has_legal_move(self._active_player):
+
+            if player == self._inactive_player:
+                return float("inf")
+
+            if player == self._active_player:
+                return float("-inf")
+
+        return 0.
+
+    def to_string(self, symbols=['1', '2']):
+        """Generate a string representation of the current game state, marking
+        the location of each player and indicating which cells have been
+        blocked, and which remain open.
+        """
+        col_margin = len(str(self.height - 1)) + 1
+        prefix = "{:<" + "{}".format(col_margin) + "}"
+        offset = " " * (col_margin + 3)
+        out = offset + '   '.join(map(str, range(self.width))) + '\n\r'
+        for i in range(self.height):
+            out += prefix.format(i) + ' | '
+            for j in range(self.width):
+                idx = i + j * self.height
+                if not self._occupied >> idx & 1:
+                    out += ' '
+                elif self._p1_loc == idx:
+                    out += symbols[0]
+                elif self._p2_loc == idx:
+                    out += symbols[1]
+                else:
+                    out += '-'
+                out += ' | '
+            out += '\n\r'
+
+        return out
+
+    def _get_location_idx(self, player):
+        """Return the cell index of the specified player, or None if the
+        player has not moved.
+        """
+        if player == self._player_1:
+            return self._p1_loc
+        elif player == self._player_2:
+            return self._p2_loc
+        raise RuntimeError(
+            "Invalid player in get_player_location: {}".format(player))
+
+    def _moves_mask(self, player):
+        """Return a bitmask of the cells the specified player can move to."""
+        idx = self._get_location_idx(player)
+        if idx == Board.NOT_MOVED:
+            return self._full & ~self._occupied
+        return self._masks[idx] & ~self._occupied
+
+    def _iter_moves(self, mask):
+        """Generate the (row, column) pairs of the cells in a bitmask in
+        increasing order of cell index.
+        """
+        cells = self._cells
+        while mask:
+            low = mask & -mask
+            yield cells[low.bit_length() - 1]
+            mask ^= low
+
+    def _to_moves(self, mask):
+        """Convert a bitmask of cells into a list of (row, column) pairs in
+        increasing order of cell index.
+        """
+        cells = self._cells
+        moves = []
+        while mask:
+            low = mask & -mask
+            moves.append(cells[low.bit_length() - 1])
+            mask ^= low
+        return moves
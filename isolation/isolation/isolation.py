@@ -13,6 +13,118 @@ from copy import copy
 
 TIME_LIMIT_MILLIS = 150
 
+# Tables of Zobrist keys, keyed by board size
+_ZOBRIST = {}
+
+
+def zobrist_keys(width, height):
+    """Return the Zobrist keys used to hash positions on a board of the given
+    size as a tuple (blocked, p1_locations, p2_locations, initiative).
+
+    The first three items are tuples of random 64-bit integers indexed by
+    cell, and the last is a single key that is XORed into the hash when the
+    second player holds the initiative. The keys are generated from a fixed
+    seed, so hashes are identical across processes and program runs.
+    """
+    size = (width, height)
+    if size not in _ZOBRIST:
+        rng = random.Random("zobrist-{}x{}".format(width, height))
+        num_cells = width * height
+        _ZOBRIST[size] = (
+            tuple(rng.getrandbits(64) for _ in range(num_cells)),
+            tuple(rng.getrandbits(64) for _ in range(num_cells)),
+            tuple(rng.getrandbits(64) for _ in range(num_cells)),
+            rng.getrandbits(64))
+    return _ZOBRIST[size]
+
+
+# Tables of knight-move neighbours and cell coordinates, keyed by board size
+_NEIGHBOURS = {}
+_CELLS = {}
+
+_DIRECTIONS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
+               (1, -2), (1, 2), (2, -1), (2, 1)]
+
+
+def knight_neighbours(width, height):
+    """Return a tuple mapping each cell index (row + col * height) to a tuple
+    of the indices of the cells a knight can reach from that cell on an
+    empty board of the given size.
+
+    The table is built on the first call for each board size and cached for
+    the lifetime of the process.
+    """
+    size = (width, height)
+    if size not in _NEIGHBOURS:
+        _NEIGHBOURS[size] = tuple(
+            tuple(r + dr + (c + dc) * height for dr, dc in _DIRECTIONS
+                  if 0 <= r + dr < height and 0 <= c + dc < width)
+            for c in range(width) for r in range(height))
+    return _NEIGHBOURS[size]
+
+
+def board_cells(width, height):
+    """Return a tuple mapping each cell index to its (row, column) pair."""
+    size = (width, height)
+    if size not in _CELLS:
+        _CELLS[size] = tuple((idx % height, idx // height)
+                             for idx in range(width * height))
+    return _CELLS[size]
+
+
+# Tables of the cell permutations of the board symmetries, their inverses
+# and the matching Zobrist keys, keyed by board size
+_SYMMETRIES = {}
+
+
+def symmetries(width, height):
+    """Return a list of tuples, one for each symmetry of a board of the given
+    size, mapping each cell index (row + col * height) to the index of the
+    cell it is moved to by the symmetry. The identity is always first.
+
+    Square boards have 8 symmetries (the rotations and reflections of the
+    square); other boards have 4 (identity, both reflections, and the half
+    turn).
+    """
+    return _symmetry_tables(width, height)[0]
+
+
+def _symmetry_tables(width, height):
+    """Return the tuple (permutations, inverse permutations, Zobrist keys)
+    for the symmetries of a board of the given size. The Zobrist keys of
+    each symmetry are a tuple (blocked, p1_locations, p2_locations) such
+    that hashing a position with them gives the hash of the transformed
+    position.
+    """
+    size = (width, height)
+    if size not in _SYMMETRIES:
+        h, w = height - 1, width - 1
+        transforms = [lambda r, c: (r, c),
+                      lambda r, c: (h - r, c),
+                      lambda r, c: (r, w - c),
+                      lambda r, c: (h - r, w - c)]
+        if width == height:
+            transforms += [lambda r, c: (c, r),
+                           lambda r, c: (c, h - r),
+                           lambda r, c: (w - c, r),
+                           lambda r, c: (w - c, h - r)]
+        perms, inverses, keys = [], [], []
+        blocked, p1_keys, p2_keys, _ = zobrist_keys(width, height)
+        for transform in transforms:
+            perm = []
+            for idx in range(width * height):
+                r, c = transform(idx % height, idx // height)
+                perm.append(r + c * height)
+            inverse = [0] * len(perm)
+            for idx, new_idx in enumerate(perm):
+                inverse[new_idx] = idx
+            perms.append(tuple(perm))
+            inverses.append(tuple(inverse))
+            keys.append(tuple(tuple(table[i] for i in perm)
+                              for table in (blocked, p1_keys, p2_keys)))
+        _SYMMETRIES[size] = (perms, inverses, keys)
+    return _SYMMETRIES[size]
+
 
 class Board(object):
     """Implement a model for the game Isolation assuming each player moves like
@@ -52,8 +164,93 @@ class Board(object):
         self._board_state[-1] = Board.NOT_MOVED
         self._board_state[-2] = Board.NOT_MOVED
 
+        # Shared lookup tables for move generation; moves are handled as cell
+        # indices internally and only converted to (row, column) pairs when
+        # they are returned to the caller
+        self._neighbours = knight_neighbours(width, height)
+        self._cells = board_cells(width, height)
+
+        # Zobrist hash of the current state, updated by apply_move() and
+        # recomputed by rehash()
+        self._zobrist = zobrist_keys(width, height)
+        self._hash = 0
+
+        # Hashes of the position under each board symmetry, computed by the
+        # first call to canonical_hash() and then updated by apply_move()
+        self._sym_hashes = None
+
+        # Number of legal moves for each player in the current state, keyed
+        # by player (0 for player 1, 1 for player 2); computed lazily by
+        # mobility(), cleared by apply_move() and rehash(), and never shared
+        # between copies of the board
+        self._mobility = {}
+
+        # Each entry records the cell index of a move applied by push_move(),
+        # the location the moving player occupied before that move, and the
+        # hashes and mobility cache of the state before the move
+        self._undo_stack = []
+
+    def __getstate__(self):
+        # the lookup tables are shared by every board of the same size, so
+        # they are rebuilt from the module caches instead of being pickled
+        state = self.__dict__.copy()
+        del state["_neighbours"], state["_cells"], state["_zobrist"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._neighbours = knight_neighbours(self.width, self.height)
+        self._cells = board_cells(self.width, self.height)
+        self._zobrist = zobrist_keys(self.width, self.height)
+
     def hash(self):
-        return str(self._board_state).__hash__()
+        return self._hash
+
+    def rehash(self):
+        """Recompute the Zobrist hash (and the symmetric hashes) of the
+        position from scratch, and clear the cached mobility counts.
+
+        The hashes and counts are only updated by apply_move(), so this must
+        be called after the cells or player locations of the board were set
+        directly; otherwise the board keeps those of the position before the
+        edit.
+        """
+        self._sym_hashes = self._compute_sym_hashes()
+        self._hash = self._sym_hashes[0]
+        self._mobility = {}
+
+    def canonical_hash(self):
+        """Return a pair (key, symmetry) where key is the smallest Zobrist
+        hash of the position under all the symmetries of the board, so that
+        symmetric positions have the same key, and symmetry is the index (in
+        `symmetries()`) of the symmetry that maps the position to the
+        canonical orientation.
+
+        The symmetric hashes are computed on the first call and updated
+        incrementally by every move applied afterwards (also on copies of
+        the board), so only the first call costs more than `hash()`.
+        """
+        hashes = self._sym_hashes
+        if hashes is None:
+            hashes = self._sym_hashes = self._compute_sym_hashes()
+        key = min(hashes)
+        return key, hashes.index(key)
+
+    def to_canonical(self, move, symmetry):
+        """Map a move (row, column) on this board to the canonical
+        orientation given by the symmetry returned by canonical_hash().
+        """
+        idx = symmetries(self.width, self.height)[symmetry][
+            move[0] + move[1] * self.height]
+        return (idx % self.height, idx // self.height)
+
+    def from_canonical(self, move, symmetry):
+        """Map a move (row, column) in the canonical orientation given by the
+        symmetry returned by canonical_hash() back to this board.
+        """
+        idx = _symmetry_tables(self.width, self.height)[1][symmetry][
+            move[0] + move[1] * self.height]
+        return (idx % self.height, idx // self.height)
 
     @property
     def active_player(self):
@@ -97,6 +294,9 @@ class Board(object):
         new_board._active_player = self._active_player
         new_board._inactive_player = self._inactive_player
         new_board._board_state = copy(self._board_state)
+        new_board._hash = self._hash
+        new_board._sym_hashes = self._sym_hashes
+        new_board._mobility = dict(self._mobility)
         return new_board
 
     def forecast_move(self, move):
@@ -139,8 +339,26 @@ class Board(object):
     def get_blank_spaces(self):
         """Return a list of the locations that are still available on the board.
         """
-        return [(i, j) for j in range(self.width) for i in range(self.height)
-                if self._board_state[i + j * self.height] == Board.BLANK]
+        state = self._board_state
+        return [cell for idx, cell in enumerate(self._cells)
+                if state[idx] == Board.BLANK]
+
+    def iter_blank_spaces(self):
+        """Generate the locations that are still available on the board,
+        in the same order as get_blank_spaces(), without building a list.
+        """
+        state = self._board_state
+        for idx, cell in enumerate(self._cells):
+            if state[idx] == Board.BLANK:
+                yield cell
+
+    def count_blank(self):
+        """Return the number of locations that are still available on the
+        board. The cells are counted rather than derived from the move
+        counter, so that the count stays right for boards whose cells were
+        set directly.
+        """
+        return self._board_state[:self.width * self.height].count(Board.BLANK)
 
     def get_player_location(self, player):
         """Find the current location of the specified player on the board.
@@ -156,20 +374,10 @@ class Board(object):
             The coordinate pair (row, column) of the input player, or None
             if the player has not moved.
         """
-        if player == self._player_1:
-            if self._board_state[-1] == Board.NOT_MOVED:
-                return Board.NOT_MOVED
-            idx = self._board_state[-1]
-        elif player == self._player_2:
-            if self._board_state[-2] == Board.NOT_MOVED:
-                return Board.NOT_MOVED
-            idx = self._board_state[-2]
-        else:
-            raise RuntimeError(
-                "Invalid player in get_player_location: {}".format(player))
-        w = idx // self.height
-        h = idx % self.height
-        return (h, w)
+        idx = self._get_location_idx(player)
+        if idx == Board.NOT_MOVED:
+            return Board.NOT_MOVED
+        return self._cells[idx]
 
     def get_legal_moves(self, player=None):
         """Return the list of all legal moves for the specified player.
@@ -188,7 +396,50 @@ class Board(object):
         """
         if player is None:
             player = self.active_player
-        return self.__get_moves(self.get_player_location(player))
+        return self.__get_moves(self._get_location_idx(player))
+
+    def iter_legal_moves(self, player=None):
+        """Generate the legal moves for the specified player (the active
+        player if None) without building a list. Unlike get_legal_moves(),
+        the moves are generated in a fixed order rather than shuffled.
+        """
+        if player is None:
+            player = self._active_player
+        idx = self._get_location_idx(player)
+        if idx == Board.NOT_MOVED:
+            yield from self.iter_blank_spaces()
+            return
+        state = self._board_state
+        cells = self._cells
+        for i in self._neighbours[idx]:
+            if state[i] == Board.BLANK:
+                yield cells[i]
+
+    def has_legal_move(self, player=None):
+        """Return True if the specified player (the active player if None)
+        has at least one legal move, stopping at the first legal move found.
+        """
+        if player is None:
+            player = self._active_player
+        idx = self._get_location_idx(player)
+        if idx == Board.NOT_MOVED:
+            return self.count_blank() > 0
+        state = self._board_state
+        for i in self._neighbours[idx]:
+            if state[i] == Board.BLANK:
+                return True
+        return False
+
+    def count_legal_moves(self, player=None):
+        """Return the number of legal moves of the specified player (the
+        active player if None) without building the list of moves. Like
+        count_blank(), and unlike mobility(), the moves are counted from the
+        cells on every call, so the count stays right for boards whose cells
+        were set directly.
+        """
+        if player is None:
+            player = self._active_player
+        return self._count_moves(self._get_location_idx(player))
 
     def apply_move(self, move):
         """Move the active player to a specified location.
@@ -201,19 +452,88 @@ class Board(object):
         """
         idx = move[0] + move[1] * self.height
         last_move_idx = int(self.active_player == self._player_2) + 1
+        blocked, p1_keys, p2_keys, initiative = self._zobrist
+        loc_keys = p2_keys if last_move_idx == 2 else p1_keys
+        prev_idx = self._board_state[-last_move_idx]
+        if prev_idx != Board.NOT_MOVED:
+            self._hash ^= loc_keys[prev_idx]
+        self._hash ^= loc_keys[idx] ^ blocked[idx] ^ initiative
+        if self._sym_hashes is not None:
+            self._update_sym_hashes(idx, prev_idx, last_move_idx == 2)
         self._board_state[-last_move_idx] = idx
         self._board_state[idx] = 1
         self._board_state[-3] ^= 1
         self._active_player, self._inactive_player = self._inactive_player, self._active_player
         self.move_count += 1
+        self._mobility = {}
+
+    def push_move(self, move):
+        """Apply a move to the current game in-place and remember how to undo
+        it. Every call must be matched by a call to pop_move(), which makes
+        push_move()/pop_move() a copy-free alternative to forecast_move()
+        during search.
+
+        Parameters
+        ----------
+        move : (int, int)
+            A coordinate pair (row, column) indicating the next position for
+            the active player on the board.
+        """
+        last_move_idx = int(self._active_player == self._player_2) + 1
+        idx = move[0] + move[1] * self.height
+        self._undo_stack.append((idx, self._board_state[-last_move_idx],
+                                 self._hash, self._sym_hashes, self._mobility))
+        self.apply_move(move)
+
+    def pop_move(self):
+        """Undo the last move applied with push_move(), restoring the game
+        to the state it had before that move.
+        """
+        (idx, prev_loc, self._hash, self._sym_hashes,
+         self._mobility) = self._undo_stack.pop()
+        self._active_player, self._inactive_player = self._inactive_player, self._active_player
+        last_move_idx = int(self._active_player == self._player_2) + 1
+        self._board_state[-last_move_idx] = prev_loc
+        self._board_state[idx] = Board.BLANK
+        self._board_state[-3] ^= 1
+        self.move_count -= 1
+
+    def mobility(self, player=None):
+        """Return the number of legal moves available to the specified player.
+
+        The count for each player is computed at most once per game state
+        and cached on the board until the next move is applied, so heuristics
+        and terminal tests can call this method repeatedly for free.
+
+        Parameters
+        ----------
+        player : object (optional)
+            An object registered as a player in the current game. If None,
+            return the mobility of the active player on the board.
+
+        Returns
+        -------
+        int
+            The number of legal moves for the player.
+        """
+        if player is None:
+            player = self._active_player
+        key = int(player == self._player_2)
+        count = self._mobility.get(key)
+        if count is None:
+            count = self._count_moves(self._get_location_idx(player))
+            self._mobility[key] = count
+        return count
 
     def is_winner(self, player):
         """ Test whether the specified player has won the game. """
-        return player == self._inactive_player and not self.get_legal_moves(self._active_player)
+        return (player == self._inactive_player and
+                not self.has_legal_move(self._active_player))
 
     def is_loser(self, player):
         """ Test whether the specified player has lost the game. """
-        return player == self._active_player and not self.get_legal_moves(self._active_player)
+        return (player == self._active_player and
+                not self.has_legal_move(self._active_player))
 
     def utility(self, player):
         """Returns the utility of the current game state from the perspective
@@ -237,7 +557,7 @@ class Board(object):
             a value of -inf if the player has lost, and a value of 0
             otherwise.
         """
-        if not self.get_legal_moves(self._active_player):
+        if not self.has_legal_move(self._active_player):
 
             if player == self._inactive_player:
                 return float("inf")
@@ -247,21 +567,112 @@ class Board(object):
 
         return 0.
 
-    def __get_moves(self, loc):
+    def unique_moves(self, moves=None):
+        """Return the legal moves of the active player (or the given moves),
+        keeping only the first of any moves that lead to symmetric
+        positions, i.e., moves that a symmetry of the board maps to each
+        other while leaving the current position unchanged.
+
+        Such symmetries exist mostly in the opening, where they remove up to
+        7 in 8 of the first moves on a square board. The symmetries of the
+        position are found by comparing its hash under every board symmetry,
+        which takes time proportional to the size of the board unless the
+        symmetric hashes are already maintained for canonical_hash().
+        """
+        if moves is None:
+            moves = self.get_legal_moves()
+        hashes = self._sym_hashes
+        if hashes is None:
+            hashes = self._compute_sym_hashes()
+        perms = [perm for perm, value in
+                 zip(symmetries(self.width, self.height), hashes)
+                 if value == self._hash]
+        if len(perms) == 1:
+            return moves
+        height = self.height
+        seen = set()
+        unique = []
+        for move in moves:
+            idx = move[0] + move[1] * height
+            key = min(perm[idx] for perm in perms)
+            if key not in seen:
+                seen.add(key)
+                unique.append(move)
+        return unique
+
+    def _compute_sym_hashes(self):
+        """Return the tuple of the hashes of the position under each board
+        symmetry, computed from scratch.
+        """
+        height = self.height
+        occupied = set(range(self.width * height))
+        occupied.difference_update(r + c * height
+                                   for r, c in self.iter_blank_spaces())
+        p1 = self._get_location_idx(self._player_1)
+        p2 = self._get_location_idx(self._player_2)
+        initiative = self._zobrist[3] if self.move_count % 2 else 0
+        hashes = []
+        for blocked, p1_keys, p2_keys in _symmetry_tables(self.width, height)[2]:
+            value = initiative
+            for idx in occupied:
+                value ^= blocked[idx]
+            if p1 != Board.NOT_MOVED:
+                value ^= p1_keys[p1]
+            if p2 != Board.NOT_MOVED:
+                value ^= p2_keys[p2]
+            hashes.append(value)
+        return tuple(hashes)
+
+    def _update_sym_hashes(self, idx, prev_idx, second_player):
+        """Update the symmetric hashes for a move of the active player from
+        the cell index prev_idx (NOT_MOVED before the first move) to idx.
+        """
+        initiative = self._zobrist[3]
+        loc = 2 if second_player else 1
+        hashes = []
+        for keys, value in zip(_symmetry_tables(self.width, self.height)[2],
+                               self._sym_hashes):
+            value ^= keys[0][idx] ^ keys[loc][idx] ^ initiative
+            if prev_idx != Board.NOT_MOVED:
+                value ^= keys[loc][prev_idx]
+            hashes.append(value)
+        self._sym_hashes = tuple(hashes)
+
+    def _get_location_idx(self, player):
+        """Return the cell index of the specified player, or None if the
+        player has not moved.
+        """
+        if player == self._player_1:
+            return self._board_state[-1]
+        elif player == self._player_2:
+            return self._board_state[-2]
+        raise RuntimeError(
+            "Invalid player in get_player_location: {}".format(player))
+
+    def __get_moves(self, idx):
         """Generate the list of possible moves for an L-shaped motion (like a
-        knight in chess).
+        knight in chess) from the cell index `idx`.
         """
-        if loc == Board.NOT_MOVED:
+        if idx == Board.NOT_MOVED:
             return self.get_blank_spaces()
 
-        r, c = loc
-        directions = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
-                      (1, -2), (1, 2), (2, -1), (2, 1)]
-        valid_moves = [(r + dr, c + dc) for dr, dc in directions
-                       if self.move_is_legal((r + dr, c + dc))]
+        state = self._board_state
+        cells = self._cells
+        valid_moves = [cells[i] for i in self._neighbours[idx]
+                       if state[i] == Board.BLANK]
         random.shuffle(valid_moves)
         return valid_moves
 
+    def _count_moves(self, idx):
+        """Count the possible moves for an L-shaped motion (like a knight in
+        chess) from the cell index `idx` without building the list of moves.
+        """
+        if idx == Board.NOT_MOVED:
+            return self.count_blank()
+
+        state = self._board_state
+        return sum(1 for i in self._neighbours[idx] if state[i] == Board.BLANK)
+
     def print_board(self):
         """DEPRECATED - use Board.to_string()"""
         return self.to_string()
@@ -295,7 +706,7 @@ class Board(object):
 
         return out
 
-    def play(self, time_limit=TIME_LIMIT_MILLIS):
+    def play(self, time_limit=TIME_LIMIT_MILLIS, ponder=False):
         """Execute a match between the players by alternately soliciting them
         to select a move and applying it in the game.
 
@@ -305,6 +716,13 @@ class Board(object):
             The maximum number of milliseconds to allow before timeout
             during each turn.
 
+        ponder : bool (optional)
+            If True, call `start_pondering(game)` on each player (if it has
+            that method) after its move has been applied, and
+            `stop_pondering()` before its next turn starts. Both hooks run
+            outside of the timed turns, so a pondering player can only gain
+            time that the opponent leaves unused on a spare CPU core.
+
         Returns
         ----------
         (player, list<[(int, int),]>, str)
@@ -316,27 +734,39 @@ class Board(object):
 
         time_millis = lambda: 1000 * timeit.default_timer()
 
-        while True:
+        try:
+            while True:
+
+                legal_player_moves = self.get_legal_moves()
+                game_copy = self.copy()
+                if ponder and hasattr(self._active_player, "stop_pondering"):
+                    self._active_player.stop_pondering()
 
-            legal_player_moves = self.get_legal_moves()
-            game_copy = self.copy()
+                move_start = time_millis()
+                time_left = lambda : time_limit - (time_millis() - move_start)
+                curr_move = self._active_player.get_move(game_copy, time_left)
+                move_end = time_left()
 
-            move_start = time_millis()
-            time_left = lambda : time_limit - (time_millis() - move_start)
-            curr_move = self._active_player.get_move(game_copy, time_left)
-            move_end = time_left()
+                if curr_move is None:
+                    curr_move = Board.NOT_MOVED
 
-            if curr_move is None:
-                curr_move = Board.NOT_MOVED
+                if move_end < 0:
+                    return self._inactive_player, move_history, "timeout"
 
-            if move_end < 0:
-                return self._inactive_player, move_history, "timeout"
+                if curr_move not in legal_player_moves:
+                    if len(legal_player_moves) > 0:
+                        return self._inactive_player, move_history, "forfeit"
+                    return self._inactive_player, move_history, "illegal move"
 
-            if curr_move not in legal_player_moves:
-                if len(legal_player_moves) > 0:
-                    return self._inactive_player, move_history, "forfeit"
-                return self._inactive_player, move_history, "illegal move"
+                move_history.append(list(curr_move))
 
-            move_history.append(list(curr_move))
+                self.apply_move(curr_move)
 
-            self.apply_move(curr_move)
+                if ponder and hasattr(self._inactive_player, "start_pondering"):
+                    self._inactive_player.start_pondering(self.copy())
+        finally:
+            # Pondering never outlives the game
+            if ponder:
+                for player in (self._player_1, self._player_2):
+                    if hasattr(player, "stop_pondering"):
+                        player.stop_pondering()
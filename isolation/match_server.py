@@ -0,0 +1,376 @@
+"""Host many concurrent isolation games on a pool of agent worker processes.
+
+`Board.play()` runs one game at a time and lets the agents time themselves.
+A `MatchServer` instead keeps the state of every game in an asyncio event
+loop, and sends each move request (the board and the time limit) to a pool
+of worker processes that host the agents. Any number of games can be in
+progress at once: a game waiting for a move costs nothing, and a move
+request is only sent to a worker that is idle, so the time an agent is
+given is spent searching rather than waiting in a queue.
+
+The server enforces the time limit itself. A move is lost on time if the
+worker measured a search longer than the limit (as in `Board.play()`), or
+if no move came back within the limit plus a grace period for the round
+trip to the worker; in the latter case the worker is killed and replaced
+by a new one, so an agent that never returns cannot hold on to a worker.
+An agent that raises an exception forfeits the game.
+
+Every worker holds its own copy of the agent in each seat (first or
+second player) of each game it has played a move of, so agents keep their
+state (transposition tables, move ordering tables) from move to move of a
+game when its moves are searched by the same worker, and never share it
+with other games. The copies are dropped when the game ends. Agents that
+start processes of their own (pondering or Lazy SMP helpers) are not
+supported.
+
+Finished games are returned as `game_records.GameRecord`s, put on the
+server's `results` queue as they end, and optionally appended to a game
+record file.
+
+Example: play 200 games between the stand-in agents on 4 workers
+
+    python match_server.py --games 200 --workers 4 --record ladder.bin
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import timeit
+import warnings
+
+from collections import namedtuple
+from copy import deepcopy
+
+from isolation import Board
+from agent_workers import AgentWorker
+from game_records import GameRecord, GameRecordWriter, summarize
+from tournament import TIME_LIMIT, available_cpus, pin_to_cpu
+from sample_players import (RandomPlayer, GreedyPlayer, open_move_score,
+                            improved_score)
+from game_agent import (MinimaxPlayer, AlphaBetaPlayer, custom_score,
+                        custom_score_3)
+
+# Seconds allowed on top of the time limit for a move request to reach a
+# worker and for its result to come back
+GRACE_PERIOD = 1.
+
+# The cpu of a worker, the games it holds agent copies for, and the games
+# that have ended since its last move request
+WorkerGames = namedtuple("WorkerGames", ["cpu", "games", "ended"])
+
+
+def _serve_moves(conn, agents, cpu):
+    """Main loop of a match server worker pinned to a cpu. A request is a
+    tuple (game, time limit, seed, ended games), answered with (move, time
+    left in milliseconds, error) for the active player of the game. The
+    players of the board are (game id, seat, agent name) tuples, which are
+    replaced by this worker's copies of the agents for that game and seat;
+    the copies for the ended games are dropped first.
+    """
+    pin_to_cpu(cpu)
+    seats = {}
+    while True:
+        try:
+            game, time_limit, seed, ended = conn.recv()
+        except EOFError:
+            return
+        for game_id in ended:
+            seats.pop((game_id, 0), None)
+            seats.pop((game_id, 1), None)
+        for attr in ("_player_1", "_player_2", "_active_player",
+                     "_inactive_player"):
+            game_id, seat, name = getattr(game, attr)
+            player = seats.get((game_id, seat))
+            if player is None:
+                player = seats[game_id, seat] = deepcopy(agents[name])
+            setattr(game, attr, player)
+
+        random.seed(seed)
+        move_start = timeit.default_timer()
+        time_left = lambda: time_limit - 1000 * (timeit.default_timer() -
+                                                 move_start)
+        try:
+            result = (game.active_player.get_move(game, time_left),
+                      time_left(), None)
+        except Exception as e:
+            result = (None, time_left(), "{}: {}".format(type(e).__name__, e))
+        conn.send(result)
+
+
+class MatchServer:
+    """Play isolation games concurrently between agents that run in a pool
+    of worker processes. Use the server as an asynchronous context manager,
+    which starts and stops the workers.
+
+    Parameters
+    ----------
+    agents : dict
+        The agents that can play, by name. The agents are copied into every
+        worker when it starts.
+
+    workers : int (optional)
+        The number of worker processes, which is also the number of moves
+        searched at the same time; at most (and by default) one per
+        available cpu, so that concurrent searches do not compete for cores.
+
+    time_limit : numeric (optional)
+        The number of milliseconds an agent may search for each move.
+
+    grace_period : float (optional)
+        The number of seconds allowed on top of the time limit for a move to
+        come back from its worker before it is lost on time.
+
+    record_path : str (optional)
+        If set, every game is appended to this game record file.
+
+    Attributes
+    ----------
+    results : asyncio.Queue
+        The `GameRecord` of every game, in the order the games end.
+    """
+
+    def __init__(self, agents, workers=None, time_limit=TIME_LIMIT,
+                 grace_period=GRACE_PERIOD, record_path=None):
+        cpus = available_cpus()
+        workers = workers or len(cpus)
+        if workers > len(cpus):
+            warnings.warn(("Requested {} workers but only {} cpus are " +
+                           "available; using {} workers.").format(
+                               workers, len(cpus), len(cpus)))
+            workers = len(cpus)
+        self.agents = agents
+        self.workers = workers
+        self.time_limit = time_limit
+        self.grace_period = grace_period
+        self.record_path = record_path
+        self.results = None
+        self._cpus = cpus
+        self._workers = {}
+        self._idle = None
+        self._records = None
+        self._game_ids = itertools.count()
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def start(self):
+        """Start the worker processes; must be called from the event loop
+        that plays the games.
+        """
+        self._idle = asyncio.Queue()
+        for idx in range(self.workers):
+            self._idle.put_nowait(
+                self._start_worker(self._cpus[idx % len(self._cpus)]))
+        self.results = asyncio.Queue()
+        if self.record_path is not None:
+            self._records = GameRecordWriter(self.record_path)
+
+    def close(self):
+        """Stop the worker processes, without waiting for moves that are
+        still being searched.
+        """
+        for worker in self._workers:
+            worker.kill()
+        self._workers = {}
+        if self._records is not None:
+            self._records.close()
+            self._records = None
+
+    def _start_worker(self, cpu):
+        worker = AgentWorker(_serve_moves, (self.agents, cpu))
+        self._workers[worker] = WorkerGames(cpu, set(), set())
+        return worker
+
+    def _end_game(self, game_id):
+        """Tell the workers that hold agent copies for the game to drop them
+        with their next move request.
+        """
+        for state in self._workers.values():
+            if game_id in state.games:
+                state.games.remove(game_id)
+                state.ended.add(game_id)
+
+    async def request_move(self, game, seed=0):
+        """Ask the active player of the game for a move, and return a tuple
+        (move, error), where move is None if the player ran out of time or
+        raised an error (described by the error string).
+
+        The players of the game must be (game id, seat, agent name) tuples.
+        """
+        loop = asyncio.get_running_loop()
+        worker = await self._idle.get()
+        state = self._workers[worker]
+        state.games.add(game.active_player[0])
+        ended = tuple(state.ended)
+        state.ended.clear()
+        timeout = self.time_limit / 1000 + self.grace_period
+        try:
+            worker.conn.send((game, self.time_limit, seed, ended))
+            # wait on the pipe in a thread, so that the event loop keeps
+            # serving the other games
+            move, move_end, error = await loop.run_in_executor(
+                None, worker.wait_move, timeout)
+        except TimeoutError:
+            error = "timeout"
+        except (EOFError, OSError) as e:
+            error = "Agent worker exited: {!r}".format(e)
+        else:
+            self._idle.put_nowait(worker)
+            if error is not None:
+                return None, error
+            if move_end < 0:
+                return None, "timeout"
+            return move, None
+
+        # the worker is stuck or gone: replace it by a new one on its cpu
+        del self._workers[worker]
+        worker.kill()
+        self._idle.put_nowait(self._start_worker(state.cpu))
+        return None, error
+
+    async def play_game(self, player_1, player_2, width=7, height=7,
+                        opening=(), seed=0):
+        """Play a game between the agents named player_1 (who moves first)
+        and player_2 from the given opening moves, and return its
+        `GameRecord`, which is also put on the results queue.
+        """
+        for name in (player_1, player_2):
+            if name not in self.agents:
+                raise ValueError("Unknown agent: {}".format(name))
+        game_id = next(self._game_ids)
+        game = Board((game_id, 0, player_1), (game_id, 1, player_2), width,
+                     height)
+        moves = []
+        for move in opening:
+            game.apply_move(move)
+            moves.append(move)
+
+        while True:
+            legal_player_moves = game.get_legal_moves()
+            move, error = await self.request_move(
+                game.copy(), seed + game.move_count)
+            if error == "timeout":
+                termination = "timeout"
+                break
+            if error is not None:
+                warnings.warn("{} forfeits after raising {}".format(
+                    game.active_player[2], error))
+            if move is None:
+                move = Board.NOT_MOVED
+            if move not in legal_player_moves:
+                if legal_player_moves:
+                    termination = "forfeit"
+                else:
+                    termination = "illegal move"
+                break
+            game.apply_move(move)
+            moves.append(tuple(move))
+        self._end_game(game_id)
+
+        record = GameRecord(width, height, (player_1, player_2), seed,
+                            termination, tuple(r + c * height
+                                               for r, c in moves))
+        if self._records is not None:
+            self._records.write(width, height, record.players, moves,
+                                termination, seed)
+        await self.results.put(record)
+        return record
+
+    async def play_games(self, games):
+        """Play every game concurrently, given as tuples of the arguments of
+        play_game(), and return their `GameRecord`s in the same order.
+        """
+        return await asyncio.gather(*(self.play_game(*args)
+                                      for args in games))
+
+
+def make_ladder_games(names, num_games, rng, width=7, height=7):
+    """Return `num_games` games (the arguments of `MatchServer.play_game()`)
+    between random pairs of different agents, each from two random opening
+    moves, drawn from the random generator.
+    """
+    games = []
+    for _ in range(num_games):
+        player_1, player_2 = rng.sample(names, 2)
+        board = Board(None, None, width, height)
+        opening = []
+        for _ in range(2):
+            move = rng.choice(sorted(board.get_legal_moves()))
+            board.apply_move(move)
+            opening.append(move)
+        games.append((player_1, player_2, width, height, tuple(opening),
+                      rng.getrandbits(32)))
+    return games
+
+
+def stand_in_agents():
+    """Return the agents played by the command line server, by name."""
+    return {
+        "Random": RandomPlayer(),
+        "Greedy": GreedyPlayer(score_fn=improved_score),
+        "MM_Open": MinimaxPlayer(score_fn=open_move_score),
+        "AB_Improved": AlphaBetaPlayer(score_fn=improved_score),
+        "AB_Custom": AlphaBetaPlayer(score_fn=custom_score),
+        "AB_Custom_3": AlphaBetaPlayer(score_fn=custom_score_3),
+    }
+
+
+async def serve(games, agents, workers=None, time_limit=TIME_LIMIT,
+                record_path=None, verbose=False):
+    """Play the games on a new `MatchServer`, printing each result as it
+    arrives if verbose, and return the list of `GameRecord`s.
+    """
+    async with MatchServer(agents, workers, time_limit,
+                           record_path=record_path) as server:
+        play = asyncio.ensure_future(server.play_games(games))
+        start = timeit.default_timer()
+        for idx in range(len(games)):
+            record = await server.results.get()
+            if verbose:
+                print("{:>5} {:>13} vs {:<13} winner: {:<13} ({}, {:.1f}s)"
+                      .format(idx + 1, record.players[0], record.players[1],
+                              record.players[record.winner],
+                              record.termination,
+                              timeit.default_timer() - start))
+        return await play
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--games", type=int, default=100,
+                        help="number of games to play")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: one per "
+                             "cpu)")
+    parser.add_argument("--time-limit", type=int, default=TIME_LIMIT,
+                        help="milliseconds per move (default: {})".format(
+                            TIME_LIMIT))
+    parser.add_argument("--width", type=int, default=7)
+    parser.add_argument("--height", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--record", default=None, metavar="PATH",
+                        help="append every game to the game record file PATH")
+    args = parser.parse_args()
+
+    agents = stand_in_agents()
+    rng = random.Random(args.seed)
+    games = make_ladder_games(sorted(agents), args.games, rng, args.width,
+                              args.height)
+    records = asyncio.run(serve(games, agents, args.workers, args.time_limit,
+                                args.record, verbose=True))
+
+    summary = summarize(records)
+    print("\n{:^13}{:>8}{:>9}".format("Agent", "Games", "Win Rate"))
+    for name, counts in sorted(summary["agents"].items()):
+        print("{:^13}{:>8}{:>9.1%}".format(
+            name, counts["games"], counts["wins"] / counts["games"]))
+    for termination, count in sorted(summary["terminations"].items()):
+        print("{:>14}: {}".format(termination, count))
+
+
+if __name__ == "__main__":
+    main()
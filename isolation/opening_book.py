@@ -0,0 +1,217 @@
+"""Build and query an opening book for isolation agents.
+
+The first moves of a game are searched offline to a fixed depth and the best
+move for each position is written to a JSON file. Positions that are
+symmetric to each other (by the rotations and reflections of the board)
+share a single entry, so the book only stores one position from each
+equivalence class. When the book is loaded, every entry is expanded to all
+of its symmetric variants, so looking up a position is a single dictionary
+access.
+
+Example: build a book for all 7x7 positions with fewer than four moves
+played, searching each position to depth 5
+
+    python opening_book.py --moves 4 --depth 5 --output data.json
+
+and load it into an agent
+
+    book = OpeningBook.load("data.json")
+    player = AlphaBetaPlayer(score_fn=custom_score, book=book)
+"""
+import argparse
+import json
+import timeit
+
+from isolation.isolation import symmetries
+
+
+def position_key(game):
+    """Return the key (blocked, p1, p2) of the game state, where blocked is
+    a bitmask of the occupied cells and p1 and p2 are the cell indices of
+    the players (-1 if the player has not moved). The key is built from the
+    public `isolation.Board` interface.
+    """
+    height = game.height
+    blocked = (1 << (game.width * height)) - 1
+    for r, c in game.iter_blank_spaces():
+        blocked &= ~(1 << (r + c * height))
+    locs = []
+    for player in (game.active_player, game.inactive_player):
+        loc = game.get_player_location(player)
+        locs.append(-1 if loc is None else loc[0] + loc[1] * height)
+    # the first player is active whenever an even number of moves were played
+    if game.move_count % 2:
+        locs.reverse()
+    return (blocked, locs[0], locs[1])
+
+
+def transform_key(key, perm):
+    """Apply a cell permutation from symmetries() to a position key."""
+    blocked, p1, p2 = key
+    new_blocked = 0
+    while blocked:
+        low = blocked & -blocked
+        new_blocked |= 1 << perm[low.bit_length() - 1]
+        blocked ^= low
+    return (new_blocked,
+            perm[p1] if p1 >= 0 else -1,
+            perm[p2] if p2 >= 0 else -1)
+
+
+def canonical_key(width, height, key):
+    """Return the smallest of the keys symmetric to the position key and the
+    index of the symmetry that produces it.
+    """
+    return min((transform_key(key, perm), idx)
+               for idx, perm in enumerate(symmetries(width, height)))
+
+
+class OpeningBook:
+    """Map early game positions to the best move found for the player to
+    move by an offline search.
+
+    Parameters
+    ----------
+    width : int
+        The number of columns of the board the book was built for.
+
+    height : int
+        The number of rows of the board the book was built for.
+
+    entries : dict (optional)
+        Map from canonical position keys (see `canonical_key()`) to the cell
+        index of the best move.
+
+    info : dict (optional)
+        Description of how the book was built (search depth, heuristic...)
+    """
+
+    def __init__(self, width, height, entries=None, info=None):
+        self.width = width
+        self.height = height
+        self.info = dict(info or {})
+        self.entries = {}
+        self._table = {}
+        for key, move in (entries or {}).items():
+            self.add(key, move)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, key, move):
+        """Add the best move (a cell index) for a canonical position key, and
+        index every symmetric variant of the position for lookup.
+        """
+        self.entries[key] = move
+        for perm in symmetries(self.width, self.height):
+            self._table.setdefault(transform_key(key, perm), perm[move])
+
+    def lookup(self, game):
+        """Return the book move (row, column) for the game state, or None if
+        the position is not in the book.
+        """
+        if game.width != self.width or game.height != self.height:
+            return None
+        move = self._table.get(position_key(game))
+        if move is None:
+            return None
+        return (move % self.height, move // self.height)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create a book from the dictionary written by to_dict()."""
+        entries = {}
+        for key, move in data["positions"].items():
+            blocked, p1, p2 = key.split(":")
+            entries[(int(blocked, 16), int(p1), int(p2))] = move
+        return cls(data["width"], data["height"], entries, data.get("info"))
+
+    def to_dict(self):
+        """Return a JSON-serializable dictionary describing the book."""
+        positions = {"{:x}:{}:{}".format(*key): move
+                     for key, move in sorted(self.entries.items())}
+        return {"width": self.width, "height": self.height,
+                "info": self.info, "positions": positions}
+
+    @classmethod
+    def load(cls, path):
+        """Load a book from a JSON file written by save()."""
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, path):
+        """Write the book to a JSON file."""
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, separators=(",", ":"))
+
+
+def build_book(max_moves, depth, score_fn, width=7, height=7, verbose=False):
+    """Search every position with fewer than `max_moves` moves played (up to
+    symmetry) to a fixed depth, and return an `OpeningBook` of the best move
+    found for each position.
+    """
+    from isolation import Board
+    from game_agent import AlphaBetaPlayer, MoveOrdering
+
+    players = [AlphaBetaPlayer(score_fn=score_fn, ordering=MoveOrdering(),
+                               tt_size=2**18) for _ in range(2)]
+    for player in players:
+        player.time_left = lambda: float("inf")
+
+    book = OpeningBook(width, height, info={
+        "moves": max_moves, "depth": depth, "score_fn": score_fn.__name__})
+    start = timeit.default_timer()
+    frontier = [()]
+    for num_moves in range(max_moves):
+        next_frontier = []
+        for history in frontier:
+            game = Board(players[0], players[1], width=width, height=height)
+            for move in history:
+                game.apply_move(move)
+            key, sym = canonical_key(width, height, position_key(game))
+            if key in book.entries:
+                continue
+
+            move = game.active_player.alphabeta(game, depth)
+            if move is None:
+                continue
+            # store the move in the orientation of the canonical key
+            perm = symmetries(width, height)[sym]
+            book.add(key, perm[move[0] + move[1] * height])
+            next_frontier.extend(history + (m,) for m in game.get_legal_moves())
+
+        if verbose:
+            print("{} moves: {} positions ({:.1f}s)".format(
+                num_moves, len(book), timeit.default_timer() - start))
+        frontier = next_frontier
+    return book
+
+
+def main():
+    import game_agent
+    import sample_players
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--moves", type=int, default=4,
+                        help="book positions with fewer than this many moves")
+    parser.add_argument("--depth", type=int, default=5,
+                        help="search depth for each book position")
+    parser.add_argument("--score", default="custom_score",
+                        help="name of the heuristic in game_agent.py or "
+                             "sample_players.py")
+    parser.add_argument("--width", type=int, default=7)
+    parser.add_argument("--height", type=int, default=7)
+    parser.add_argument("--output", default="data.json")
+    args = parser.parse_args()
+
+    score_fn = getattr(game_agent, args.score, None)
+    if score_fn is None:
+        score_fn = getattr(sample_players, args.score)
+    book = build_book(args.moves, args.depth, score_fn, args.width,
+                      args.height, verbose=True)
+    book.save(args.output)
+    print("Wrote {} positions to {}".format(len(book), args.output))
+
+
+if __name__ == "__main__":
+    main()
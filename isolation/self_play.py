@@ -0,0 +1,293 @@
+"""Generate self-play training data for isolation heuristics, and fit the
+weights of a `game_agent.LinearScore` heuristic to it.
+
+The `generate` command plays games between fixed-depth `AlphaBetaPlayer`
+variants (one heuristic per variant) across a pool of worker processes.
+Every game starts from a few random moves, and each player makes a random
+move with a small probability so that the games cover more positions.
+Every position after the opening is recorded as the `score_features` of
+the player to move and the outcome of the game for that player (1 for a
+win, 0 for a loss). Records are streamed to numbered chunk files of
+little-endian float32 rows (the features followed by the outcome), so the
+data set can grow over several runs and never has to fit in memory while
+it is generated.
+
+The `fit` command loads the chunks (with NumPy) and fits a logistic
+regression of the outcome on the features by Newton's method, then writes
+the weights to a JSON file that `LinearScore.load()` reads.
+
+Example: generate games, fit weights, and play with them
+
+    python self_play.py generate --games 2000 --depth 3 --output selfplay
+    python self_play.py fit selfplay --output weights.json
+
+    player = AlphaBetaPlayer(score_fn=LinearScore.load("weights.json"))
+"""
+import argparse
+import array
+import glob
+import json
+import multiprocessing
+import os
+import random
+import sys
+import timeit
+
+from isolation import Board
+from sample_players import improved_score
+from game_agent import (AlphaBetaPlayer, LinearScore, score_features,
+                        custom_score, custom_score_3)
+
+SCORE_FNS = [custom_score, custom_score_3, improved_score]
+CHUNK_SIZE = 100000
+
+
+def play_self_play_game(args):
+    """Play one game between fixed-depth alpha-beta players and return the
+    list of rows (features..., outcome) for every position after the
+    opening, each from the point of view of the player to move.
+
+    args is a tuple (seed, score_fns, depth, width, height, opening_moves,
+    epsilon), where score_fns is the pair of heuristics of the first and
+    second player.
+    """
+    seed, score_fns, depth, width, height, opening_moves, epsilon = args
+    rng = random.Random(seed)
+    random.seed(seed)
+    players = [AlphaBetaPlayer(search_depth=depth, score_fn=score_fn)
+               for score_fn in score_fns]
+    for player in players:
+        player.time_left = lambda: float("inf")
+    game = Board(players[0], players[1], width=width, height=height)
+
+    positions = []
+    while True:
+        moves = game.get_legal_moves()
+        if not moves:
+            break
+        if game.move_count < opening_moves or rng.random() < epsilon:
+            move = rng.choice(sorted(moves))
+        else:
+            positions.append((game.active_player,
+                              score_features(game, game.active_player)))
+            move = game.active_player.alphabeta(game, depth)
+        game.apply_move(move)
+
+    # the player to move when the game ends has lost
+    loser = game.active_player
+    return [features + (0. if player is loser else 1.,)
+            for player, features in positions]
+
+
+class ChunkWriter:
+    """Buffer rows of float32 values and write them to numbered chunk files
+    (chunk-00000.f32, chunk-00001.f32...) in a directory, continuing the
+    numbering of the chunks already there.
+
+    Parameters
+    ----------
+    directory : str
+        The output directory, created if needed.
+
+    chunk_size : int (optional)
+        The number of rows per chunk file.
+    """
+
+    def __init__(self, directory, chunk_size=CHUNK_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self._next = len(chunk_paths(directory))
+        self._buffer = array.array("f")
+        self._pending = 0
+
+    def write(self, rows):
+        for row in rows:
+            self._buffer.extend(row)
+            self._pending += 1
+            if self._pending == self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        """Write the buffered rows (if any) to a new chunk file."""
+        if not self._pending:
+            return
+        if sys.byteorder != "little":
+            self._buffer.byteswap()
+        path = os.path.join(self.directory,
+                            "chunk-{:05d}.f32".format(self._next))
+        with open(path, "wb") as f:
+            self._buffer.tofile(f)
+        self._next += 1
+        self.rows += self._pending
+        self._buffer = array.array("f")
+        self._pending = 0
+
+
+def chunk_paths(directory):
+    """Return the sorted list of the chunk files in a directory."""
+    return sorted(glob.glob(os.path.join(directory, "chunk-*.f32")))
+
+
+def generate(num_games, output, score_fns=SCORE_FNS, depth=3, width=7,
+             height=7, opening_moves=2, epsilon=0.1, workers=None, seed=0,
+             chunk_size=CHUNK_SIZE, verbose=False):
+    """Play `num_games` self-play games on `workers` processes (one per cpu
+    by default) and stream their positions to chunk files in the `output`
+    directory. Each game pits two of the heuristics in `score_fns`, chosen
+    at random, against each other. Returns the number of positions written.
+    """
+    rng = random.Random(seed)
+    jobs = ((rng.getrandbits(32),
+             (rng.choice(score_fns), rng.choice(score_fns)),
+             depth, width, height, opening_moves, epsilon)
+            for _ in range(num_games))
+    writer = ChunkWriter(output, chunk_size)
+    workers = workers or os.cpu_count() or 1
+    start = timeit.default_timer()
+
+    def consume(results):
+        positions = 0
+        for idx, rows in enumerate(results):
+            writer.write(rows)
+            positions += len(rows)
+            if verbose and (idx + 1) % 100 == 0:
+                print("{} games, {} positions ({:.1f}s)".format(
+                    idx + 1, positions, timeit.default_timer() - start))
+
+    if workers == 1:
+        consume(map(play_self_play_game, jobs))
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            consume(pool.imap(play_self_play_game, jobs, chunksize=4))
+    writer.flush()
+
+    meta_path = os.path.join(output, "meta.json")
+    meta = {"features": list(LinearScore.FEATURES), "games": 0, "rows": 0}
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+    meta["games"] += num_games
+    meta["rows"] += writer.rows
+    with open(meta_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    return writer.rows
+
+
+def load_chunks(directory):
+    """Return the arrays (features, outcomes) of every chunk in a
+    directory.
+    """
+    import numpy as np
+    width = len(LinearScore.FEATURES) + 1
+    data = [np.fromfile(path, dtype="<f4").reshape(-1, width)
+            for path in chunk_paths(directory)]
+    if not data:
+        raise ValueError("No chunks in {}".format(directory))
+    data = np.concatenate(data).astype(float)
+    return data[:, :-1], data[:, -1]
+
+
+def fit_logistic(features, outcomes, l2=1e-3, iterations=50, tol=1e-10):
+    """Fit a logistic regression P(win) = sigmoid(features . w + b) by
+    Newton's method, with an L2 penalty on w, and return (w, b).
+    """
+    import numpy as np
+    x = np.column_stack([features, np.ones(len(features))])
+    penalty = l2 * len(x) * np.eye(x.shape[1])
+    penalty[-1, -1] = 0.
+    weights = np.zeros(x.shape[1])
+    for _ in range(iterations):
+        p = 1. / (1. + np.exp(-x.dot(weights)))
+        gradient = x.T.dot(p - outcomes) + penalty.dot(weights)
+        hessian = (x.T * (p * (1. - p))).dot(x) + penalty
+        step = np.linalg.solve(hessian, gradient)
+        weights -= step
+        if np.abs(step).max() < tol:
+            break
+    return weights[:-1], weights[-1]
+
+
+def fit(directory, output, l2=1e-3, verbose=False):
+    """Fit heuristic weights to the chunks in a directory and write them to
+    the JSON file `output`. Returns the weights.
+    """
+    import numpy as np
+    features, outcomes = load_chunks(directory)
+    weights, bias = fit_logistic(features, outcomes, l2)
+    p = 1. / (1. + np.exp(-(features.dot(weights) + bias)))
+    accuracy = float(np.mean((p > 0.5) == (outcomes > 0.5)))
+    data = {"features": list(LinearScore.FEATURES),
+            "weights": weights.tolist(), "bias": float(bias),
+            "positions": len(outcomes), "accuracy": accuracy, "l2": l2}
+    with open(output, "w") as f:
+        json.dump(data, f, indent=2)
+    if verbose:
+        print("Fitted {} positions (accuracy {:.1%})".format(len(outcomes),
+                                                            accuracy))
+        # scale the weights like custom_score_3 (10 per own move) to compare
+        scale = 10. / weights[0] if weights[0] else 1.
+        for name, weight in zip(LinearScore.FEATURES, weights):
+            print("{:>12}: {:>10.4f} (scaled: {:>8.2f})".format(
+                name, weight, scale * weight))
+    return weights.tolist()
+
+
+def main():
+    import game_agent
+    import sample_players
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    gen = commands.add_parser("generate", help="play self-play games")
+    gen.add_argument("--games", type=int, default=1000)
+    gen.add_argument("--depth", type=int, default=3,
+                     help="search depth of the players")
+    gen.add_argument("--score", nargs="+", default=None, metavar="NAME",
+                     help="names of the heuristics in game_agent.py or "
+                          "sample_players.py to play (default: custom_score "
+                          "custom_score_3 improved_score)")
+    gen.add_argument("--weights", nargs="+", default=[], metavar="PATH",
+                     help="also play LinearScore heuristics with these "
+                          "weights files")
+    gen.add_argument("--epsilon", type=float, default=0.1,
+                     help="probability of a random move")
+    gen.add_argument("--opening", type=int, default=2,
+                     help="number of random opening moves")
+    gen.add_argument("--width", type=int, default=7)
+    gen.add_argument("--height", type=int, default=7)
+    gen.add_argument("--workers", type=int, default=None,
+                     help="number of processes (default: one per cpu)")
+    gen.add_argument("--seed", type=int, default=0)
+    gen.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    gen.add_argument("--output", default="selfplay",
+                     help="directory of the chunk files")
+
+    fit_cmd = commands.add_parser("fit", help="fit heuristic weights")
+    fit_cmd.add_argument("directory", help="directory of the chunk files")
+    fit_cmd.add_argument("--l2", type=float, default=1e-3,
+                         help="L2 penalty per position")
+    fit_cmd.add_argument("--output", default="weights.json")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        score_fns = SCORE_FNS
+        if args.score:
+            score_fns = [getattr(game_agent, name, None) or
+                         getattr(sample_players, name) for name in args.score]
+        score_fns = score_fns + [LinearScore.load(path)
+                                 for path in args.weights]
+        rows = generate(args.games, args.output, score_fns, args.depth,
+                        args.width, args.height, args.opening, args.epsilon,
+                        args.workers, args.seed, args.chunk_size, verbose=True)
+        print("Wrote {} positions to {}".format(rows, args.output))
+    else:
+        fit(args.directory, args.output, args.l2, verbose=True)
+        print("Wrote weights to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
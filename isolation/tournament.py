@@ -10,20 +10,62 @@ The matches are fair because the board is initialized randomly for both
 players, and the players play each match twice -- once as the first player and
 once as the second player.  Randomizing the openings and switching the player
 order corrects for imbalances due to both starting position and initiative.
+
+Games can be spread across a pool of worker processes with the --workers
+option. Every game is played with fresh copies of both agents and its own
+random seed, so a parallel tournament produces exactly the same results as
+a serial tournament with the same --seed (as long as the agents themselves
+do not depend on timing, e.g., fixed-depth agents that never time out).
+
+With the --log option, every move of the search agents is recorded (nodes,
+evaluations, depth reached, branching factor, cutoffs and time per
+iteration) and written to a JSON lines file, and a summary of the searches
+of each agent is printed after the results.
+
+With the --record option, every game is appended to a binary game record
+file as soon as its round is tallied (see game_records.py).
+
+With the --sprt option, each pairing of a test agent and a cpu agent is
+played one match (two games) at a time, and stops as soon as a sequential
+probability ratio test decides whether the test agent is stronger or weaker
+than the cpu agent (or after --matches matches, 100 by default). The
+matches of all the undecided pairings share a single queue of games, so
+the workers freed by decided pairings play the pairings that are still
+running. The Elo difference of every pairing is reported with its
+confidence interval.
+
+The --width and --height options play the tournament on a board of another
+size, and --bitboard plays it on `BitBoard`s, which generate moves faster on
+large boards.
+
+With the --hard-timeout option, every agent searches its moves in a worker
+process that is killed when the time limit expires (see agent_workers.py),
+so an agent that hangs loses the game on time instead of stalling the
+tournament.
 """
+import argparse
 import itertools
+import math
+import multiprocessing
+import os
 import random
 import warnings
 
-from collections import namedtuple
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from copy import deepcopy
+from statistics import NormalDist
 
-from isolation import Board
+from isolation import Board, BitBoard
+from agent_workers import PreemptiblePlayer
+from game_records import GameRecordWriter
 from sample_players import (RandomPlayer, open_move_score,
                             improved_score, center_score)
-from game_agent import (MinimaxPlayer, AlphaBetaPlayer, custom_score,
-                        custom_score_2, custom_score_3)
+from game_agent import (MinimaxPlayer, AlphaBetaPlayer, SearchLog,
+                        custom_score, custom_score_2, custom_score_3)
 
 NUM_MATCHES = 5  # number of matches against each opponent
+SPRT_MAX_MATCHES = 100  # most matches against each opponent with --sprt
 TIME_LIMIT = 150  # number of milliseconds before timeout
 
 DESCRIPTION = """
@@ -36,39 +78,369 @@ game_agent.py.
 
 Agent = namedtuple("Agent", ["player", "name"])
 
+# The board of every game: its size and the class that implements it
+BoardSpec = namedtuple("BoardSpec", ["width", "height", "board_class"])
+
+DEFAULT_BOARD = BoardSpec(7, 7, Board)
+
+# A single game of a round: the index of the test agent, whether the cpu
+# agent moves first, the two random opening moves, the game's seed, and the
+# board it is played on
+GameSpec = namedtuple("GameSpec",
+                      ["agent_idx", "cpu_first", "opening", "seed", "board"],
+                      defaults=(DEFAULT_BOARD,))
+
+
+def make_games(test_agents, num_matches, rng, board=DEFAULT_BOARD):
+    """Return the list of games played by the test agents against one cpu
+    agent on the given `BoardSpec`, drawing the openings and game seeds from
+    the random generator.
+    """
+    games = []
+    for _ in range(num_matches):
+
+        # initialize all games with a random move and response
+        board_state = Board(None, None, board.width, board.height)
+        opening = []
+        for _ in range(2):
+            move = rng.choice(sorted(board_state.get_legal_moves()))
+            board_state.apply_move(move)
+            opening.append(move)
+
+        for idx in range(len(test_agents)):
+            for cpu_first in (True, False):
+                games.append(GameSpec(idx, cpu_first, tuple(opening),
+                                      rng.getrandbits(32), board))
+    return games
+
+
+def expected_score(elo):
+    """Return the expected score of a player rated `elo` points above the
+    opponent.
+    """
+    return 1. / (1. + 10 ** (-elo / 400.))
 
-def play_round(cpu_agent, test_agents, win_counts, num_matches):
+
+def elo_difference(wins, losses, confidence=0.95):
+    """Return the Elo difference (elo, low, high) estimated from the number
+    of wins and losses, with the bounds of its confidence interval (from
+    the Wilson score interval of the win rate). The estimate is infinite if
+    every game was won or lost, but the bounds of the interval are finite.
+    """
+    games = wins + losses
+    if not games:
+        return 0., float("-inf"), float("inf")
+
+    def elo(score):
+        if score <= 0.:
+            return float("-inf")
+        if score >= 1.:
+            return float("inf")
+        return 400. * math.log10(score / (1. - score))
+
+    z = NormalDist().inv_cdf((1. + confidence) / 2.)
+    score = wins / games
+    denominator = 1. + z * z / games
+    centre = (score + z * z / (2. * games)) / denominator
+    margin = z * math.sqrt(score * (1. - score) / games +
+                           z * z / (4. * games * games)) / denominator
+    return elo(score), elo(centre - margin), elo(centre + margin)
+
+
+class SPRT:
+    """Sequential probability ratio test of the hypotheses that a player is
+    `elo0` (H0) or `elo1` (H1) Elo points stronger than the opponent, from
+    the wins and losses observed so far (isolation games cannot be drawn).
+
+    Parameters
+    ----------
+    elo0 : float (optional)
+        The Elo difference under the null hypothesis.
+
+    elo1 : float (optional)
+        The Elo difference under the alternative hypothesis.
+
+    alpha : float (optional)
+        The probability of accepting H1 when H0 is true.
+
+    beta : float (optional)
+        The probability of accepting H0 when H1 is true.
+    """
+
+    def __init__(self, elo0=-50., elo1=50., alpha=0.05, beta=0.05):
+        if elo0 >= elo1:
+            raise ValueError("elo0 must be smaller than elo1")
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.alpha = alpha
+        self.beta = beta
+        self.lower = math.log(beta / (1. - alpha))
+        self.upper = math.log((1. - beta) / alpha)
+
+    def llr(self, wins, losses):
+        """Return the log-likelihood ratio of H1 against H0."""
+        p0, p1 = expected_score(self.elo0), expected_score(self.elo1)
+        return (wins * math.log(p1 / p0) +
+                losses * math.log((1. - p1) / (1. - p0)))
+
+    def status(self, wins, losses):
+        """Return "H1" or "H0" once the test accepts that hypothesis, or
+        None while more games are needed.
+        """
+        llr = self.llr(wins, losses)
+        if llr >= self.upper:
+            return "H1"
+        if llr <= self.lower:
+            return "H0"
+        return None
+
+
+def play_game(cpu_player, test_player, spec):
+    """Play a single game between fresh copies of the players and return a
+    tuple (True if the cpu player won, termination reason, game, search
+    records of the cpu player, search records of the test player), where
+    game is a tuple (width, height, moves) describing the board size and
+    every move played, including the opening.
+
+    Search records are only collected for players with a `search_log`.
+    """
+    cpu_player, test_player = deepcopy((cpu_player, test_player))
+    for player in (cpu_player, test_player):
+        if getattr(player, "search_log", None) is not None:
+            player.search_log = SearchLog(player.search_log.name)
+    width, height, board_class = spec.board
+    if spec.cpu_first:
+        game = board_class(cpu_player, test_player, width, height)
+    else:
+        game = board_class(test_player, cpu_player, width, height)
+    for move in spec.opening:
+        game.apply_move(move)
+
+    random.seed(spec.seed)
+    winner, history, termination = game.play(time_limit=TIME_LIMIT)
+    moves = list(spec.opening) + [tuple(move) for move in history]
+    return (winner is cpu_player, termination,
+            (game.width, game.height, moves), _records(cpu_player),
+            _records(test_player))
+
+
+def _records(player):
+    log = getattr(player, "search_log", None)
+    return log.records if log is not None else []
+
+
+def _play_game_job(args):
+    """Unpack the arguments of play_game() for Executor.map()."""
+    return play_game(*args)
+
+
+def _init_worker(counter, cpus):
+    """Pin each worker process to its own cpu so that concurrent games do not
+    compete for cores, which would make per-move timing unfair.
+    """
+    with counter.get_lock():
+        idx = counter.value
+        counter.value += 1
+    pin_to_cpu(cpus[idx % len(cpus)])
+
+
+def pin_to_cpu(cpu):
+    """Restrict this process to a single cpu, where the platform allows it."""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu})
+
+
+def available_cpus():
+    """Return a sorted list of the cpus this process is allowed to run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def make_executor(workers):
+    """Return a process pool with at most one pinned worker per available cpu,
+    or None if the games should be played serially.
+    """
+    cpus = available_cpus()
+    if workers > len(cpus):
+        warnings.warn(("Requested {} workers but only {} cpus are available; " +
+                       "using {} workers.").format(workers, len(cpus), len(cpus)))
+        workers = len(cpus)
+    if workers <= 1:
+        return None
+    counter = multiprocessing.Value("i", 0)
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                               initargs=(counter, cpus))
+
+
+def play_round(cpu_agent, test_agents, win_counts, num_matches, rng=random,
+               executor=None, logs=None, records=None, sprt=None,
+               game_counts=None, board=DEFAULT_BOARD):
     """Compare the test agents to the cpu agent in "fair" matches.
 
     "Fair" matches use random starting locations and force the agents to
     play as both first and second player to control for advantages resulting
     from choosing better opening moves or having first initiative to move.
+
+    If an executor is provided, the games are played concurrently in its
+    worker processes; the tallies are identical to a serial round.
+
+    If `logs` maps players to `SearchLog` instances, the search records of
+    each game are added to the log of the corresponding player.
+
+    If `records` is a `GameRecordWriter`, every game is appended to it.
+
+    If `game_counts` is a dictionary, the number of games played by each
+    test agent is added to it.
+
+    If `sprt` is an `SPRT`, the pairings of the test agents with the cpu
+    agent stop as soon as the test decides them; see play_pairings().
+
+    Every game is played on the given `BoardSpec`.
+    """
+    if game_counts is None:
+        game_counts = {agent.player: 0 for agent in test_agents}
+    if sprt is not None:
+        return play_pairings([cpu_agent], test_agents, [win_counts],
+                             [game_counts], num_matches, sprt, rng, executor,
+                             logs, records, board)
+    games = make_games(test_agents, num_matches, rng, board)
+    return _play_games(cpu_agent, test_agents, games, win_counts,
+                       game_counts, executor, logs, records)
+
+
+def play_pairings(cpu_agents, test_agents, win_counts, game_counts,
+                  max_matches, sprt, rng=random, executor=None, logs=None,
+                  records=None, board=DEFAULT_BOARD):
+    """Play every pairing of a cpu agent and a test agent one match (two
+    games) at a time until the sequential test `sprt` accepts either
+    hypothesis for the wins and losses of the test agent, or until it has
+    played `max_matches` matches, and return the numbers of timeouts and
+    forfeits.
+
+    `win_counts` and `game_counts` are lists with one dictionary per cpu
+    agent, in which the wins of both agents and the games of the test agents
+    are counted as in play_round(); see play_round() for the other
+    parameters.
+
+    The next match of a pairing is queued as soon as its last match has
+    been tallied, after the matches of the other pairings already queued,
+    so that all the undecided pairings keep the workers of the executor
+    busy. The games of each cpu agent are drawn up front and in the same
+    order as in a fixed round of `max_matches` matches, and every pairing
+    plays its matches in that order, so the results do not depend on the
+    number of workers and a test that never stops plays the same games as a
+    fixed round.
     """
+    num_agents = len(test_agents)
+    games = [make_games(test_agents, max_matches, rng, board)
+             for _ in cpu_agents]
+    matches = {}
+    remaining = {}
+    running = {}
+    done = deque()
+
+    def undecided(pairing):
+        cpu_idx, agent_idx = pairing
+        player = test_agents[agent_idx].player
+        wins = win_counts[cpu_idx][player]
+        losses = game_counts[cpu_idx].get(player, 0) - wins
+        return sprt.status(wins, losses) is None
+
+    def queue_match(pairing):
+        cpu_idx, agent_idx = pairing
+        start = 2 * (matches[pairing] * num_agents + agent_idx)
+        matches[pairing] += 1
+        remaining[pairing] = 2
+        for spec in games[cpu_idx][start:start + 2]:
+            job = (cpu_agents[cpu_idx].player,
+                   test_agents[agent_idx].player, spec)
+            if executor is None:
+                done.append((pairing, spec, play_game(*job)))
+            else:
+                running[executor.submit(play_game, *job)] = (pairing, spec)
+
+    for cpu_idx in range(len(cpu_agents)):
+        for agent_idx in range(num_agents):
+            pairing = (cpu_idx, agent_idx)
+            matches[pairing] = 0
+            if max_matches > 0 and undecided(pairing):
+                queue_match(pairing)
+
     timeout_count = 0
     forfeit_count = 0
-    for _ in range(num_matches):
+    while done or running:
+        if not done:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                done.append(running.pop(future) + (future.result(),))
+        pairing, spec, result = done.popleft()
+        termination = _tally_game(cpu_agents[pairing[0]], test_agents, spec,
+                                  result, win_counts[pairing[0]],
+                                  game_counts[pairing[0]], logs, records)
+        if termination == "timeout":
+            timeout_count += 1
+        elif termination == "forfeit":
+            forfeit_count += 1
+
+        remaining[pairing] -= 1
+        if (not remaining[pairing] and matches[pairing] < max_matches and
+                undecided(pairing)):
+            queue_match(pairing)
+    return timeout_count, forfeit_count
 
-        games = sum([[Board(cpu_agent.player, agent.player),
-                      Board(agent.player, cpu_agent.player)]
-                    for agent in test_agents], [])
 
-        # initialize all games with a random move and response
-        for _ in range(2):
-            move = random.choice(games[0].get_legal_moves())
-            for game in games:
-                game.apply_move(move)
+def _play_games(cpu_agent, test_agents, games, win_counts, game_counts,
+                executor, logs, records):
+    """Play the games of a round (a list of `GameSpec`) and tally the
+    results; see play_round().
+    """
+    timeout_count = 0
+    forfeit_count = 0
+    jobs = [(cpu_agent.player, test_agents[spec.agent_idx].player, spec)
+            for spec in games]
+    if executor is None:
+        results = [play_game(*job) for job in jobs]
+    else:
+        results = executor.map(_play_game_job, jobs)
+
+    for spec, result in zip(games, results):
+        termination = _tally_game(cpu_agent, test_agents, spec, result,
+                                  win_counts, game_counts, logs, records)
+        if termination == "timeout":
+            timeout_count += 1
+        elif termination == "forfeit":
+            forfeit_count += 1
 
-        # play all games and tally the results
-        for game in games:
-            winner, _, termination = game.play(time_limit=TIME_LIMIT)
-            win_counts[winner] += 1
+    return timeout_count, forfeit_count
 
-            if termination == "timeout":
-                timeout_count += 1
-            elif termination == "forfeit":
-                forfeit_count += 1
 
-    return timeout_count, forfeit_count
+def _tally_game(cpu_agent, test_agents, spec, result, win_counts,
+                game_counts, logs, records):
+    """Tally the result of a game (see play_game()) played from a `GameSpec`
+    and return its termination reason.
+    """
+    cpu_won, termination, game, cpu_records, test_records = result
+    test_player = test_agents[spec.agent_idx].player
+    if logs is not None:
+        for player, search_records in ((cpu_agent.player, cpu_records),
+                                       (test_player, test_records)):
+            if player in logs:
+                logs[player].extend(search_records)
+
+    if records is not None:
+        names = (cpu_agent.name, test_agents[spec.agent_idx].name)
+        if not spec.cpu_first:
+            names = names[::-1]
+        width, height, moves = game
+        records.write(width, height, names, moves, termination, spec.seed)
+
+    game_counts[test_player] = game_counts.get(test_player, 0) + 1
+    if cpu_won:
+        win_counts[cpu_agent.player] += 1
+    else:
+        win_counts[test_player] += 1
+    return termination
 
 
 def update(total_wins, wins):
@@ -77,28 +449,129 @@ def update(total_wins, wins):
     return total_wins
 
 
-def play_matches(cpu_agents, test_agents, num_matches):
-    """Play matches between the test agent and each cpu_agent individually. """
+def play_matches(cpu_agents, test_agents, num_matches, workers=1, seed=None,
+                 log_path=None, record_path=None, sprt=None,
+                 board=DEFAULT_BOARD):
+    """Play matches between the test agent and each cpu_agent individually.
+
+    The games are spread across `workers` processes (at most one per cpu),
+    and all random choices are drawn from `seed` so that the tournament can
+    be reproduced. If `log_path` is set, the search records of every agent
+    are written to that file as JSON lines and summarized per agent. If
+    `record_path` is set, every game is appended to that game record file.
+    If `sprt` is an `SPRT`, the pairings of all the cpu agents are played
+    together and each stops as soon as the test decides it, after at most
+    `num_matches` matches (see play_pairings()), and the Elo difference of
+    every pairing is printed. Every game is played on the given `BoardSpec`.
+    """
+    rng = random.Random(seed)
+    logs = None
+    if log_path is not None:
+        logs = {}
+        for agent in cpu_agents + test_agents:
+            if hasattr(agent.player, "search_log"):
+                agent.player.search_log = SearchLog(agent.name)
+                logs[agent.player] = SearchLog(agent.name)
+    records = None
+    if record_path is not None:
+        records = GameRecordWriter(record_path)
+    executor = make_executor(workers)
+    try:
+        _play_matches(cpu_agents, test_agents, num_matches, rng, executor,
+                      logs, records, sprt, board)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if records is not None:
+            records.close()
+
+    if logs is not None:
+        with open(log_path, "w") as f:
+            for log in logs.values():
+                log.write(f)
+        print_search_summary(cpu_agents + test_agents, logs)
+
+
+def print_search_summary(agents, logs):
+    """Print the search statistics aggregated over the moves of each agent."""
+    print("\n{:^13}{:>7}{:>7}{:>11}{:>7}{:>9}{:>9}".format(
+        "Agent", "Moves", "Depth", "Nodes/s", "EBF", "Cutoff", "1st"))
+    for agent in agents:
+        if agent.player not in logs:
+            continue
+        summary = logs[agent.player].summary()
+        print("{:^13}{:>7}{:>7.2f}{:>11.0f}{:>7.2f}{:>8.1f}%{:>8.1f}%".format(
+            agent.name, summary["moves"], summary["depth"],
+            summary["nodes_per_second"],
+            summary["effective_branching_factor"],
+            100 * summary["cutoff_rate"],
+            100 * summary["first_move_cutoff_rate"]))
+
+
+def print_elo_summary(pairings, sprt, confidence=0.95):
+    """Print the Elo difference of each pairing (test agent name, cpu agent
+    name, wins, losses of the test agent) with its confidence interval and
+    the decision of the sequential test.
+    """
+    decisions = {"H1": "stronger", "H0": "weaker", None: "undecided"}
+    print("\n{:^13}{:^13}{:>7}{:>8}{:>17}  {}".format(
+        "Agent", "Opponent", "Games", "Elo", "{:.0%} interval".format(
+            confidence), "SPRT"))
+    for test_name, cpu_name, wins, losses in pairings:
+        elo, low, high = elo_difference(wins, losses, confidence)
+        print("{:^13}{:^13}{:>7}{:>+8.0f}{:>17}  {}".format(
+            test_name, cpu_name, wins + losses, elo,
+            "[{:+.0f}, {:+.0f}]".format(low, high),
+            decisions[sprt.status(wins, losses)]))
+
+
+def _play_matches(cpu_agents, test_agents, num_matches, rng, executor,
+                  logs=None, records=None, sprt=None, board=DEFAULT_BOARD):
     total_wins = {agent.player: 0 for agent in test_agents}
+    total_games = {agent.player: 0 for agent in test_agents}
     total_timeouts = 0.
     total_forfeits = 0.
-    total_matches = 2 * num_matches * len(cpu_agents)
+    pairings = []
 
     print("\n{:^9}{:^13}".format("Match #", "Opponent") + ''.join(['{:^13}'.format(x[1].name) for x in enumerate(test_agents)]))
     print("{:^9}{:^13} ".format("", "") +  ' '.join(['{:^5}| {:^5}'.format("Won", "Lost") for x in enumerate(test_agents)]))
 
-    for idx, agent in enumerate(cpu_agents):
+    all_wins = []
+    all_games = []
+    for agent in cpu_agents:
         wins = {key: 0 for (key, value) in test_agents}
         wins[agent.player] = 0
+        all_wins.append(wins)
+        all_games.append({agent.player: 0 for agent in test_agents})
+
+    # the pairings of every cpu agent are played together, so the rows are
+    # only printed once they have all been decided
+    if sprt is not None:
+        counts = play_pairings(cpu_agents, test_agents, all_wins, all_games,
+                               num_matches, sprt, rng, executor, logs,
+                               records, board)
+        total_timeouts += counts[0]
+        total_forfeits += counts[1]
+
+    for idx, agent in enumerate(cpu_agents):
+        wins = all_wins[idx]
+        games = all_games[idx]
 
         print("{!s:^9}{:^13}".format(idx + 1, agent.name), end="", flush=True)
 
-        counts = play_round(agent, test_agents, wins, num_matches)
-        total_timeouts += counts[0]
-        total_forfeits += counts[1]
+        if sprt is None:
+            counts = play_round(agent, test_agents, wins, num_matches, rng,
+                                executor, logs, records, None, games, board)
+            total_timeouts += counts[0]
+            total_forfeits += counts[1]
         total_wins = update(total_wins, wins)
-        _total = 2 * num_matches
-        round_totals = sum([[wins[agent.player], _total - wins[agent.player]]
+        total_games = update(total_games, games)
+        for test_agent in test_agents:
+            pairings.append((test_agent.name, agent.name,
+                             wins[test_agent.player],
+                             games[test_agent.player] - wins[test_agent.player]))
+        round_totals = sum([[wins[agent.player],
+                             games[agent.player] - wins[agent.player]]
                             for agent in test_agents], [])
         print(' ' + ' '.join([
             '{:^5}| {:^5}'.format(
@@ -110,10 +583,14 @@ def play_matches(cpu_agents, test_agents, num_matches):
     print('{:^9}{:^13}'.format("", "Win Rate:") +
         ''.join([
             '{:^13}'.format(
-                "{:.1f}%".format(100 * total_wins[x[1].player] / total_matches)
+                "{:.1f}%".format(100 * total_wins[x[1].player] /
+                                 max(total_games[x[1].player], 1))
             ) for x in enumerate(test_agents)
     ]))
 
+    if sprt is not None:
+        print_elo_summary(pairings, sprt)
+
     if total_timeouts:
         print(("\nThere were {} timeouts during the tournament -- make sure " +
                "your agent handles search timeout correctly, and consider " +
@@ -125,6 +602,44 @@ def play_matches(cpu_agents, test_agents, num_matches):
 
 
 def main():
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes to play games in")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="random seed for the openings and every game")
+    parser.add_argument("--log", default=None, metavar="PATH",
+                        help="write the search statistics of every move to "
+                             "PATH as JSON lines")
+    parser.add_argument("--record", default=None, metavar="PATH",
+                        help="append every game to the game record file PATH")
+    parser.add_argument("--matches", type=int, default=None,
+                        help="number of matches against each opponent "
+                             "(default: {}), or the most matches with --sprt "
+                             "(default: {})".format(NUM_MATCHES,
+                                                    SPRT_MAX_MATCHES))
+    parser.add_argument("--sprt", nargs=2, type=float, default=None,
+                        metavar=("ELO0", "ELO1"),
+                        help="stop each pairing once a sequential test "
+                             "decides between an Elo difference of ELO0 "
+                             "and ELO1 (e.g. --sprt -100 100)")
+    parser.add_argument("--sprt-error", type=float, default=0.05,
+                        metavar="ALPHA",
+                        help="error rate of both sides of the sequential "
+                             "test (default: 0.05)")
+    parser.add_argument("--width", type=int, default=7,
+                        help="width of the board (default: 7)")
+    parser.add_argument("--height", type=int, default=7,
+                        help="height of the board (default: 7)")
+    parser.add_argument("--bitboard", action="store_true",
+                        help="play on BitBoards instead of Boards")
+    parser.add_argument("--hard-timeout", action="store_true",
+                        help="run every agent in a worker process that is "
+                             "killed when a move is late (search statistics "
+                             "are then not logged)")
+    args = parser.parse_args()
+    seed = args.seed
+    if seed is None:
+        seed = random.randrange(2**32)
 
     # Define two agents to compare -- these agents will play from the same
     # starting position against the same adversaries in the tournament
@@ -146,11 +661,31 @@ def main():
         Agent(AlphaBetaPlayer(score_fn=improved_score), "AB_Improved")
     ]
 
+    if args.hard_timeout:
+        test_agents = [Agent(PreemptiblePlayer(agent.player), agent.name)
+                       for agent in test_agents]
+        cpu_agents = [Agent(PreemptiblePlayer(agent.player), agent.name)
+                      for agent in cpu_agents]
+
     print(DESCRIPTION)
     print("{:^74}".format("*************************"))
     print("{:^74}".format("Playing Matches"))
     print("{:^74}".format("*************************"))
-    play_matches(cpu_agents, test_agents, NUM_MATCHES)
+    print("{:^74}".format("seed: {}".format(seed)))
+    board = BoardSpec(args.width, args.height,
+                      BitBoard if args.bitboard else Board)
+    sprt = None
+    num_matches = args.matches
+    if args.sprt is not None:
+        sprt = SPRT(args.sprt[0], args.sprt[1], args.sprt_error,
+                    args.sprt_error)
+        if num_matches is None:
+            num_matches = SPRT_MAX_MATCHES
+    if num_matches is None:
+        num_matches = NUM_MATCHES
+    play_matches(cpu_agents, test_agents, num_matches, workers=args.workers,
+                 seed=seed, log_path=args.log, record_path=args.record,
+                 sprt=sprt, board=board)
 
 
 if __name__ == "__main__":